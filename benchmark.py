@@ -0,0 +1,706 @@
+#!/usr/bin/env python3
+"""
+WhatsMyFinder - бенчмарки производительности
+Запуск: python benchmark.py <сценарий> [параметры]
+"""
+
+import json
+import math
+import os
+import sys
+import time
+import random
+import string
+import asyncio
+import functools
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import statistics
+import multiprocessing
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from whatsmyfinder import CheckGroup, CheckScheduler, HealthStore, ResultTable, SearchSession, SiteDatabase, SiteRecord, WhatsMyFinder
+
+def measure(func: Callable, repeat: int) -> List[float]:
+    """Замеряет время выполнения функции в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def print_timings(title: str, timings: List[float]):
+    """Выводит медиану и разброс замеров"""
+    print(f"  {title:<32} медиана {statistics.median(timings):8.3f} мс | "
+          f"мин {min(timings):8.3f} мс | макс {max(timings):8.3f} мс")
+
+def bench_startup(args: argparse.Namespace):
+    """Время загрузки базы: json.load против скомпилированного кэша"""
+    db_path = args.database
+    categories = set(args.categories.split(",")) if args.categories else {"social"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "wmn-data.pickle")
+
+        def load_json():
+            # Прежний путь: json.load и фильтрация списком по cat
+            with open(db_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return [site for site in data.get("sites", []) if site.get("cat") in categories]
+
+        def load_cold():
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            return SiteDatabase.load(db_path, cache_path).select(categories)
+
+        def load_warm():
+            return SiteDatabase.load(db_path, cache_path).select(categories)
+
+        print(f"📊 Загрузка базы {db_path} ({os.path.getsize(db_path) // 1024} КБ), {args.repeat} повторов")
+        print_timings("json.load + фильтр", measure(load_json, args.repeat))
+        print_timings("компиляция (холодный кэш)", measure(load_cold, args.repeat))
+        load_warm()
+        print_timings("скомпилированная база", measure(load_warm, args.repeat))
+
+def percentile(values: List[float], p: float) -> float:
+    """Процентиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(math.ceil(p / 100 * len(values))) - 1))
+    return values[index]
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS текущего процесса в МБ"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS — байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def load_source_database(db_path: str) -> SiteDatabase:
+    """Загружает исходную базу через временный кэш, не трогая рабочий"""
+    with tempfile.TemporaryDirectory() as tmp:
+        return SiteDatabase.load(db_path, os.path.join(tmp, "wmn-data.pickle"))
+
+def mock_database(database: SiteDatabase, base_port: int) -> SiteDatabase:
+    """Копия базы, где каждый хост заменен своим локальным портом заглушки"""
+    ports = {host: base_port + i for i, host in enumerate(database.by_host)}
+    sites = []
+    for site in database.sites:
+        clone = SiteRecord.from_row(site.to_row())
+        if site.url_parts is not None:
+            clone.url_parts = (f"http://127.0.0.1:{ports[site.host]}/{site.id}/", "")
+        sites.append(clone)
+    return SiteDatabase(sites, database.categories, database.source)
+
+class MockProfile:
+    """Распределения задержки, размера тела и отказов локальной заглушки"""
+
+    def __init__(self, latency: float, latency_sigma: float, body_size: int, body_sigma: float, failure_rate: float, seed: int = 1):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.body_size = body_size
+        self.body_sigma = body_sigma
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.filler = b"x" * (body_size * 20 + 1)
+
+    def delay(self) -> float:
+        return self.rng.lognormvariate(math.log(self.latency), self.latency_sigma) if self.latency > 0 else 0.0
+
+    def body(self, marker: str) -> bytes:
+        size = int(self.rng.lognormvariate(math.log(self.body_size), self.body_sigma)) if self.body_size > 0 else 0
+        size = min(size, len(self.filler) - 1)
+        # Маркер в середине тела: потоковый поиск не находит его слишком рано
+        half = self.filler[:size // 2]
+        return half + marker.encode("utf-8") + half
+
+def serve_mock(db_path: str, base_port: int, profile: MockProfile, ready, stop):
+    """Процесс заглушки: отвечает по правилам сайта для известных и неизвестных имен"""
+    database = load_source_database(db_path)
+
+    async def handle(request: web.Request) -> web.Response:
+        site = database.sites[int(request.match_info["site"])]
+        await asyncio.sleep(profile.delay())
+
+        roll = profile.rng.random()
+        if roll < profile.failure_rate / 2:
+            return web.Response(status=503)
+        if roll < profile.failure_rate:
+            # Обрыв соединения без ответа
+            if request.transport is not None:
+                request.transport.close()
+            return web.Response()
+
+        if request.match_info["account"] in site.known:
+            return web.Response(status=site.e_code or 200, body=profile.body(site.e_string))
+        return web.Response(status=site.m_code or 404, body=profile.body(site.m_string))
+
+    async def run():
+        app = web.Application()
+        app.router.add_route("*", "/{site}/{account:.*}", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        for i in range(len(database.by_host)):
+            await web.TCPSite(runner, "127.0.0.1", base_port + i, backlog=1024).start()
+        ready.set()
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        await runner.cleanup()
+
+    asyncio.run(run())
+
+class MockServer:
+    """Локальная заглушка всех сайтов базы в отдельном процессе"""
+
+    def __init__(self, db_path: str, base_port: int, profile: MockProfile):
+        context = multiprocessing.get_context("spawn")
+        self.ready = context.Event()
+        self.stop = context.Event()
+        self.process = context.Process(target=serve_mock, args=(db_path, base_port, profile, self.ready, self.stop), daemon=True)
+
+    def __enter__(self) -> "MockServer":
+        self.process.start()
+        if not self.ready.wait(60):
+            self.process.terminate()
+            raise RuntimeError("заглушка не запустилась")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop.set()
+        self.process.join(10)
+        if self.process.is_alive():
+            self.process.terminate()
+
+def make_usernames(database: SiteDatabase, count: int, seed: int = 1) -> List[str]:
+    """Смесь известных аккаунтов из базы и случайных несуществующих имен"""
+    rng = random.Random(seed)
+    known = sorted({account for site in database.sites for account in site.known})
+    usernames = []
+    for i in range(count):
+        if i % 2 == 0 and known:
+            usernames.append(rng.choice(known))
+        else:
+            usernames.append("".join(rng.choice(string.ascii_lowercase + string.digits) for _ in range(12)))
+    return usernames
+
+def run_mock_client(db_path: str, base_port: int, concurrency: int, usernames: List[str], overrides: Dict, results):
+    """Процесс клиента: прогоняет username через движок поиска и отдает метрики"""
+    app = WhatsMyFinder()
+    app.database = mock_database(load_source_database(db_path), base_port)
+    app.health = HealthStore()
+    search_config = dict(app.config["search"])
+    search_config.update({
+        "default_concurrent_requests": concurrency,
+        "max_concurrent_requests": concurrency,
+        "adaptive_concurrency": False,
+        "per_host_rate": 0
+    })
+    search_config.update(overrides)
+    app.config["search"] = search_config
+    sites = app.filter_sites()
+    latencies = []
+    errors = 0
+
+    def on_result(result: Dict):
+        nonlocal errors
+        if result["elapsed"] is not None:
+            latencies.append(result["elapsed"])
+        if result["error"]:
+            errors += 1
+
+    async def run():
+        async with SearchSession(search_config, health=app.health) as search:
+            await asyncio.gather(*(app.check_username(search, username, sites, on_result) for username in usernames))
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    results.put({
+        "concurrency": concurrency,
+        "checks": len(latencies),
+        "errors": errors,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "p50": round(percentile(latencies, 50), 4),
+        "p99": round(percentile(latencies, 99), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    })
+
+def run_in_process(target: Callable, *args) -> Dict:
+    """Выполняет замер в отдельном процессе, чтобы пиковый RSS не смешивался между прогонами"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=target, args=args + (results,))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+def bench_mock(args: argparse.Namespace):
+    """Пропускная способность, задержки и память на локальной заглушке всех сайтов"""
+    profile = MockProfile(args.latency, args.latency_sigma, args.body_size, args.body_sigma, args.failure_rate)
+    database = load_source_database(args.database)
+    usernames = make_usernames(database, args.usernames)
+    levels = [int(level) for level in args.levels.split(",")]
+
+    print(f"📊 Заглушка: {len(database.sites)} сайтов на {len(database.by_host)} портах, "
+          f"{len(usernames)} username, задержка ~{args.latency * 1000:.0f} мс, "
+          f"тело ~{args.body_size} Б, отказы {args.failure_rate:.1%}")
+    print(f"  {'параллельно':>11} {'проверок':>9} {'ошибок':>7} {'время, с':>9} {'проверок/с':>11} "
+          f"{'p50, мс':>8} {'p99, мс':>8} {'RSS, МБ':>8}")
+
+    rows = []
+    with MockServer(args.database, args.base_port, profile):
+        for level in levels:
+            row = run_in_process(run_mock_client, args.database, args.base_port, level, usernames, {})
+            rows.append(row)
+            print(f"  {row['concurrency']:>11} {row['checks']:>9} {row['errors']:>7} {row['elapsed']:>9.2f} "
+                  f"{row['throughput']:>11.1f} {row['p50'] * 1000:>8.1f} {row['p99'] * 1000:>8.1f} {row['peak_rss_mb']:>8.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            parameters = {key: value for key, value in vars(args).items() if key != "func"}
+            json.dump({"parameters": parameters, "results": rows}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Результаты сохранены: {args.json}")
+
+class CountingSink:
+    """Приемник результатов, который только считает строки"""
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text: str):
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+def bench_workers(args: argparse.Namespace):
+    """Масштабирование пакетного режима по числу рабочих процессов"""
+    profile = MockProfile(args.latency, args.latency_sigma, args.body_size, args.body_sigma, args.failure_rate)
+    database = mock_database(load_source_database(args.database), args.base_port)
+    usernames = make_usernames(database, args.usernames)
+    counts = [int(count) for count in args.workers.split(",")]
+
+    print(f"📊 Заглушка: {len(database.sites)} сайтов, {len(usernames)} username, "
+          f"{args.concurrency} запросов в полете на процесс")
+    print(f"  {'процессов':>9} {'проверок':>9} {'ошибок':>7} {'время, с':>9} {'проверок/с':>11} {'ускорение':>10}")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp, MockServer(args.database, args.base_port, profile):
+        for count in counts:
+            app = WhatsMyFinder()
+            app.config["paths"]["cache"] = tmp
+            app.config["cache"] = {"enabled": False}
+            app.config["search"].update({
+                "default_concurrent_requests": args.concurrency,
+                "max_concurrent_requests": args.concurrency,
+                "adaptive_concurrency": False,
+                "per_host_rate": 0,
+                "batch_usernames_in_flight": max(1, args.concurrency // 50)
+            })
+            app.database = database
+            stats = app.run_sharded_batch(iter(usernames), CountingSink(), count, all_results=True, report_progress=False)
+            baseline = rows[0]["throughput"] if rows else stats["checks_per_second"]
+            row = {
+                "workers": count,
+                "checks": stats["checks"],
+                "errors": stats["errors"],
+                "elapsed": round(stats["elapsed"], 3),
+                "throughput": round(stats["checks_per_second"], 1),
+                "speedup": round(stats["checks_per_second"] / baseline, 2) if baseline else 0.0
+            }
+            rows.append(row)
+            print(f"  {row['workers']:>9} {row['checks']:>9} {row['errors']:>7} {row['elapsed']:>9.2f} "
+                  f"{row['throughput']:>11.1f} {row['speedup']:>9.2f}x")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            parameters = {key: value for key, value in vars(args).items() if key != "func"}
+            json.dump({"parameters": parameters, "results": rows}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Результаты сохранены: {args.json}")
+
+def serve_egress_mock(sites: int, base_port: int, proxies: int, proxy_port: int, site_rate: float, ready, stop):
+    """Процесс заглушки для выходов: сайты с лимитом частоты на источник и прокси, подставляющие свой источник"""
+    # Следующее разрешенное время запроса для пары (сайт, источник)
+    next_allowed = {}
+    interval = 1 / site_rate
+
+    async def handle_site(request: web.Request) -> web.Response:
+        source = request.headers.get("X-Egress", "direct")
+        key = (request.host, source)
+        now = time.monotonic()
+        allowed = next_allowed.get(key, now)
+        # Небольшой запас на неравномерность планирования клиента
+        if allowed - now > interval:
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        next_allowed[key] = max(allowed, now) + interval
+        if request.match_info["account"].startswith("a"):
+            return web.Response(status=200, body=b"profile " * 200)
+        return web.Response(status=404, body=b"not found")
+
+    async def handle_proxy(request: web.Request) -> web.Response:
+        # Прокси-заглушка: пересылает запрос в абсолютной форме, помечая его своим источником
+        async with request.app["client"].request(request.method, str(request.url), headers={"X-Egress": request.app["name"]},
+                                                 data=await request.read()) as response:
+            headers = {"Retry-After": response.headers["Retry-After"]} if "Retry-After" in response.headers else None
+            return web.Response(status=response.status, body=await response.read(), headers=headers)
+
+    async def run():
+        runners = []
+        site_app = web.Application()
+        site_app.router.add_get("/{account}", handle_site)
+        runner = web.AppRunner(site_app, access_log=None)
+        await runner.setup()
+        runners.append(runner)
+        # Каждый сайт на своем адресе 127.0.1.x: лимиты клиента считаются по имени хоста (петля Linux)
+        for i in range(sites):
+            await web.TCPSite(runner, site_address(i), base_port, backlog=1024).start()
+
+        client = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        for i in range(proxies):
+            proxy_app = web.Application()
+            proxy_app["name"] = f"proxy{i}"
+            proxy_app["client"] = client
+            proxy_app.router.add_route("*", "/{path:.*}", handle_proxy)
+            runner = web.AppRunner(proxy_app, access_log=None)
+            await runner.setup()
+            runners.append(runner)
+            await web.TCPSite(runner, "127.0.0.1", proxy_port + i, backlog=1024).start()
+
+        ready.set()
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        await client.close()
+        for runner in runners:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+def site_address(index: int) -> str:
+    """Адрес сайта-заглушки в петлевой сети 127.0.1.0/24 и дальше"""
+    return f"127.0.{1 + index // 250}.{1 + index % 250}"
+
+def run_egress_client(sites: int, base_port: int, proxies: List[str], usernames: List[str], site_rate: float, results):
+    """Процесс клиента: поиск через заданные выходы с бюджетом частоты на хост"""
+    app = WhatsMyFinder()
+    app.database = SiteDatabase(
+        [SiteRecord(i, {"name": f"site{i}", "uri_check": f"http://{site_address(i)}:{base_port}/{{account}}", "e_code": 200,
+                        "e_string": "profile", "m_code": 404, "m_string": "not found", "cat": "mock"})
+         for i in range(sites)],
+        ["mock"], {}
+    )
+    app.health = HealthStore()
+    search_config = dict(app.config["search"])
+    search_config.update({
+        "default_concurrent_requests": 200,
+        "max_concurrent_requests": 200,
+        "adaptive_concurrency": False,
+        "per_host_limit": 4,
+        "per_host_rate": site_rate,
+        "search_deadline": 0,
+        "hedge_requests": False
+    })
+    app.config["search"] = search_config
+    app.config["egress"] = {"direct": not proxies, "proxies": proxies, "drain_after": 3, "drain_period": 60}
+    app.config["cache"] = {"enabled": False}
+    checks = limited = errors = 0
+
+    def on_result(result: Dict):
+        nonlocal checks, limited, errors
+        checks += 1
+        if result["status"] == 429:
+            limited += 1
+        elif result["error"]:
+            errors += 1
+
+    async def run():
+        async with app.search_session(cache=False) as search:
+            await asyncio.gather(*(app.check_username(search, username, app.database.sites, on_result) for username in usernames))
+            return search.egresses.report()
+
+    started = time.perf_counter()
+    egresses = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    results.put({
+        "checks": checks,
+        "limited": limited,
+        "errors": errors,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(checks / elapsed, 1),
+        "egresses": egresses
+    })
+
+def bench_egress(args: argparse.Namespace):
+    """Пропускная способность при лимите частоты на источник: один выход против пула прокси"""
+    counts = [int(count) for count in args.proxies.split(",")]
+    usernames = [("a" if i % 2 == 0 else "z") + f"user{i}" for i in range(args.usernames)]
+    context = multiprocessing.get_context("spawn")
+    ready, stop = context.Event(), context.Event()
+    server = context.Process(
+        target=serve_egress_mock,
+        args=(args.sites, args.base_port, max(counts), args.proxy_port, args.site_rate, ready, stop),
+        daemon=True
+    )
+    server.start()
+    if not ready.wait(60):
+        server.terminate()
+        raise RuntimeError("заглушка не запустилась")
+
+    print(f"📊 Заглушка: {args.sites} сайтов, лимит {args.site_rate:g} запросов/с на сайт с одного источника, "
+          f"{len(usernames)} username{', плюс неработающий прокси' if args.broken else ''}")
+    print(f"  {'прокси':>6} {'проверок':>9} {'429':>6} {'ошибок':>7} {'время, с':>9} {'проверок/с':>11}")
+
+    rows = []
+    try:
+        for count in counts:
+            proxies = [f"http://127.0.0.1:{args.proxy_port + i}" for i in range(count)]
+            if args.broken:
+                # Порт без слушателя: выход должен быстро уйти из ротации
+                proxies.append({"url": f"http://127.0.0.1:{args.proxy_port + max(counts)}", "name": "broken"})
+            row = run_in_process(run_egress_client, args.sites, args.base_port, proxies, usernames, args.site_rate)
+            row["proxies"] = count
+            rows.append(row)
+            print(f"  {row['proxies']:>6} {row['checks']:>9} {row['limited']:>6} {row['errors']:>7} "
+                  f"{row['elapsed']:>9.2f} {row['throughput']:>11.1f}")
+            for egress in row["egresses"]:
+                drained = f", выводился из ротации {egress['drains']} раз" if egress["drains"] else ""
+                print(f"           {egress['name']}: запросов {egress['requests']}, отказов {egress['failures']}{drained}")
+    finally:
+        stop.set()
+        server.join(10)
+        if server.is_alive():
+            server.terminate()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            parameters = {key: value for key, value in vars(args).items() if key != "func"}
+            json.dump({"parameters": parameters, "results": rows}, f, indent=2, ensure_ascii=False)
+        print(f"💾 Результаты сохранены: {args.json}")
+
+def synthetic_results(database: SiteDatabase, checks: int, seed: int = 1):
+    """Результаты check_site для checks проверок: все сайты базы по очереди для каждого username"""
+    rng = random.Random(seed)
+    sites = [site for site in database.sites if site.url_parts]
+    for index in range(checks):
+        site = sites[index % len(sites)]
+        username = f"user{index // len(sites)}"
+        roll = rng.random()
+        error = "Timeout" if roll < 0.03 else None
+        found = not error and roll > 0.9
+        yield {
+            "username": username,
+            "name": site.name,
+            "url": site.url(username),
+            "found": found,
+            "error": error,
+            "category": site.cat,
+            "status": None if error else (site.e_code if found else site.m_code) or 200,
+            "elapsed": None if error else round(rng.uniform(0.05, 2.0), 3),
+            "cached": False
+        }
+
+def bench_results(args: argparse.Namespace):
+    """Память и время на хранение результатов: список словарей против колонок ResultTable"""
+    database = load_source_database(args.database)
+    rows = []
+
+    def fill_dicts():
+        rows.clear()
+        rows.extend(synthetic_results(database, args.checks))
+        return rows
+
+    def fill_table():
+        table = ResultTable(database)
+        for result in synthetic_results(database, args.checks):
+            table.add(result)
+        return table
+
+    print(f"📊 {args.checks} проверок по {len(database.sites)} сайтам")
+    print(f"{'хранение':>14} {'МБ':>9} {'байт/проверку':>14} {'МБ на 1 млн':>12} {'заполнение, с':>14} {'группировка, с':>15}")
+    report = {}
+    for name, fill in (("словари", fill_dicts), ("ResultTable", fill_table)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        store = fill()
+        fill_time = time.perf_counter() - started
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        started = time.perf_counter()
+        if isinstance(store, ResultTable):
+            store.group_by_category(found_only=True)
+            store.group_by_username()
+        else:
+            by_category = {}
+            by_username = {}
+            for result in store:
+                if result["found"]:
+                    by_category.setdefault(result["category"], []).append(result)
+                by_username.setdefault(result["username"], []).append(result)
+        group_time = time.perf_counter() - started
+
+        per_check = size / args.checks
+        report[name] = {"bytes": size, "bytes_per_check": per_check, "fill_seconds": fill_time, "group_seconds": group_time}
+        print(f"{name:>14} {size / 2 ** 20:9.1f} {per_check:14.1f} {per_check * 1e6 / 2 ** 20:12.1f} {fill_time:14.2f} {group_time:15.2f}")
+        del store
+        rows.clear()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"scenario": "results", "checks": args.checks, "results": report}, f, indent=2)
+
+def bench_queue(args: argparse.Namespace):
+    """Память на ожидающую проверку: задача на каждую проверку против очереди CheckScheduler"""
+    database = load_source_database(args.database)
+    app = WhatsMyFinder.embed(database)
+    sites = [site for site in database.sites if site.url_parts]
+    usernames = [f"user{index}" for index in range(args.jobs // len(sites) + 1)]
+
+    def jobs():
+        for index in range(args.jobs):
+            yield sites[index % len(sites)], usernames[index // len(sites)]
+
+    async def fill_tasks():
+        # Как раньше: все проверки создаются сразу и ждут своей очереди в семафорах
+        tasks = {}
+        for site, username in jobs():
+            tasks[asyncio.ensure_future(app.check_site(None, site, username))] = (site, username)
+        return tasks
+
+    async def fill_queue():
+        scheduler = CheckScheduler(0, args.jobs)
+        group = CheckGroup(functools.partial(app.check_site, None))
+        for rank, (site, username) in enumerate(jobs()):
+            scheduler.submit(group, 0, rank, site, username)
+        return scheduler
+
+    async def measure(fill: Callable) -> Dict:
+        tracemalloc.start()
+        started = time.perf_counter()
+        store = await fill()
+        fill_time = time.perf_counter() - started
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        if isinstance(store, dict):
+            for task in store:
+                task.cancel()
+            await asyncio.gather(*store, return_exceptions=True)
+        return {"bytes": size, "bytes_per_job": size / args.jobs, "fill_seconds": fill_time}
+
+    async def stream() -> Dict:
+        # Весь поток проверок через ограниченную очередь: пик памяти не зависит от их числа
+        scheduler = CheckScheduler(args.workers, args.queue_size)
+
+        async def run(site: SiteRecord, username: str, deadline: Optional[float]) -> Dict:
+            await asyncio.sleep(0)
+            return app.skipped_result(site, username, "Benchmark")
+
+        group = CheckGroup(run)
+        tracemalloc.start()
+        started = time.perf_counter()
+        scheduler.start()
+        outstanding = 0
+        for rank, (site, username) in enumerate(jobs()):
+            while not scheduler.has_room():
+                await group.finished.get()
+                outstanding -= 1
+            scheduler.submit(group, 0, rank, site, username)
+            outstanding += 1
+        for _ in range(outstanding):
+            await group.finished.get()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        await scheduler.close()
+        return {"peak_bytes": peak, "seconds": elapsed, "jobs_per_second": args.jobs / elapsed}
+
+    async def run_all() -> Dict:
+        report = {}
+        print(f"📊 {args.jobs} проверок в ожидании по {len(sites)} сайтам")
+        print(f"{'ожидание':>14} {'МБ':>9} {'байт/проверку':>14} {'заполнение, с':>14}")
+        for name, fill in (("задачи", fill_tasks), ("CheckScheduler", fill_queue)):
+            report[name] = await measure(fill)
+            entry = report[name]
+            print(f"{name:>14} {entry['bytes'] / 2 ** 20:9.1f} {entry['bytes_per_job']:14.1f} {entry['fill_seconds']:14.2f}")
+        report["stream"] = await stream()
+        entry = report["stream"]
+        print(f"🌊 Поток через очередь на {args.queue_size} мест и {args.workers} воркеров: "
+              f"пик {entry['peak_bytes'] / 2 ** 20:.1f} МБ, {entry['jobs_per_second']:.0f} проверок/с")
+        return report
+
+    report = asyncio.run(run_all())
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"scenario": "queue", "jobs": args.jobs, "results": report}, f, indent=2)
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """Общие параметры локальной заглушки"""
+    parser.add_argument("--database", default="wmn-data.json", help="путь к wmn-data.json")
+    parser.add_argument("--usernames", type=int, default=20, help="количество username")
+    parser.add_argument("--latency", type=float, default=0.05, help="медианная задержка ответа, с")
+    parser.add_argument("--latency-sigma", type=float, default=0.8, help="разброс задержки (sigma логнормального распределения)")
+    parser.add_argument("--body-size", type=int, default=20000, help="медианный размер тела, байт")
+    parser.add_argument("--body-sigma", type=float, default=1.0, help="разброс размера тела")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="доля отказов (503 и обрывы соединения)")
+    parser.add_argument("--base-port", type=int, default=20000, help="первый порт заглушки")
+    parser.add_argument("--json", metavar="FILE", help="сохранить результаты в JSON для сравнения версий")
+
+def main():
+    """Точка входа"""
+    parser = argparse.ArgumentParser(description="WhatsMyFinder benchmarks")
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+
+    startup = subparsers.add_parser("startup", help="время загрузки базы данных")
+    startup.add_argument("--database", default="wmn-data.json", help="путь к wmn-data.json")
+    startup.add_argument("--categories", help="категории для фильтра через запятую")
+    startup.add_argument("--repeat", type=int, default=50, help="количество повторов")
+    startup.set_defaults(func=bench_startup)
+
+    mock = subparsers.add_parser("mock", help="поиск по локальной заглушке всех сайтов")
+    add_mock_arguments(mock)
+    mock.add_argument("--levels", default="10,50,100,200", help="уровни параллельности через запятую")
+    mock.set_defaults(func=bench_mock)
+
+    workers = subparsers.add_parser("workers", help="масштабирование пакетного режима по процессам")
+    add_mock_arguments(workers)
+    workers.add_argument("--workers", default="1,2,4", help="числа рабочих процессов через запятую")
+    workers.add_argument("--concurrency", type=int, default=100, help="запросов в полете на процесс")
+    workers.set_defaults(func=bench_workers)
+
+    egress = subparsers.add_parser("egress", help="пул прокси против одного выхода при лимите частоты на источник")
+    egress.add_argument("--proxies", default="1,2,4", help="числа прокси-заглушек через запятую")
+    egress.add_argument("--broken", action="store_true", help="добавить неработающий прокси, который должен уйти из ротации")
+    egress.add_argument("--sites", type=int, default=20, help="количество сайтов")
+    egress.add_argument("--site-rate", type=float, default=5.0, help="лимит сайта, запросов/с с одного источника")
+    egress.add_argument("--usernames", type=int, default=50, help="количество username")
+    egress.add_argument("--base-port", type=int, default=21000, help="порт сайтов-заглушек")
+    egress.add_argument("--proxy-port", type=int, default=22000, help="первый порт прокси-заглушек")
+    egress.add_argument("--json", metavar="FILE", help="сохранить результаты в JSON для сравнения версий")
+    egress.set_defaults(func=bench_egress)
+
+    results = subparsers.add_parser("results", help="память на хранение результатов: словари против колонок")
+    results.add_argument("--database", default="wmn-data.json", help="путь к wmn-data.json")
+    results.add_argument("--checks", type=int, default=1000000, help="количество проверок")
+    results.add_argument("--json", metavar="FILE", help="сохранить результаты в JSON для сравнения версий")
+    results.set_defaults(func=bench_results)
+
+    jobs = subparsers.add_parser("queue", help="память на ожидающую проверку: задачи против очереди планировщика")
+    jobs.add_argument("--database", default="wmn-data.json", help="путь к wmn-data.json")
+    jobs.add_argument("--jobs", type=int, default=200000, help="количество проверок")
+    jobs.add_argument("--workers", type=int, default=600, help="воркеров планировщика в потоковом замере")
+    jobs.add_argument("--queue-size", type=int, default=4096, help="мест в очереди в потоковом замере")
+    jobs.add_argument("--json", metavar="FILE", help="сохранить результаты в JSON для сравнения версий")
+    jobs.set_defaults(func=bench_queue)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
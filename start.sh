@@ -43,7 +43,7 @@ if [ ! -f "wmn-data.json" ]; then
 fi
 
 # Создание папок
-mkdir -p reports/html reports/csv
+mkdir -p reports/html reports/csv cache
 
 # Запуск приложения
 echo "🚀 Запуск WhatsMyFinder..."
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from aiohttp import web
+
+# Тесты импортируют whatsmyfinder.py из корня репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def site_server():
+    """Сайты-заглушки в отдельном потоке: handler(site, name) -> (код, тело), код None обрывает соединение"""
+    servers = []
+
+    def start(handler) -> int:
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        state = {}
+
+        async def profile(request):
+            status, text = handler(request.match_info["site"], request.match_info["name"])
+            if status is None:
+                request.transport.close()
+            return web.Response(status=status or 200, text=text)
+
+        async def serve():
+            application = web.Application()
+            application.router.add_get("/{site}/{name}", profile)
+            runner = web.AppRunner(application)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            state["runner"] = runner
+            state["port"] = runner.addresses[0][1]
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(serve())
+            ready.set()
+            loop.run_forever()
+            loop.run_until_complete(state["runner"].cleanup())
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        ready.wait(10)
+        servers.append((loop, thread))
+        return state["port"]
+
+    yield start
+    for loop, thread in servers:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(10)
@@ -0,0 +1,45 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from whatsmyfinder import WhatsMyFinder
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "whatsmyfinder.py")
+SITES = 3
+
+def profiles(site, name):
+    """alice существует на всех сайтах, остальные имена - нет"""
+    return (200, "PROFILE") if name == "alice" else (404, "missing")
+
+def write_setup(directory, port: int):
+    database = {"categories": ["test"], "sites": [
+        {"name": f"site{index}", "uri_check": f"http://127.0.0.1:{port}/s{index}/{{account}}", "e_code": 200,
+         "e_string": "PROFILE", "m_code": 404, "m_string": "missing", "known": ["alice"], "cat": "test"}
+        for index in range(SITES)
+    ]}
+    (directory / "db.json").write_text(json.dumps(database), encoding="utf-8")
+    config = WhatsMyFinder.default_config()
+    config["paths"]["database"] = "db.json"
+    config["cache"]["enabled"] = False
+    config["search"].update({"per_host_rate": 0, "hedge_requests": False, "max_retries": 0})
+    (directory / "config.json").write_text(json.dumps(config), encoding="utf-8")
+    # a/b и x?y изменили бы путь запроса; Иван возможен, хотя эталонный аккаунт - латиницей
+    (directory / "users.txt").write_text("alice\nbob\nИван\na/b\nx?y\n", encoding="utf-8")
+
+def test_sharded_batch_counts_impossible_pairs(tmp_path, site_server):
+    write_setup(tmp_path, site_server(profiles))
+    completed = subprocess.run(
+        [sys.executable, SCRIPT, "--batch", "users.txt", "--all-results", "--workers", "2", "-o", "out.ndjson"],
+        cwd=str(tmp_path), capture_output=True, text=True, encoding="utf-8", timeout=120
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    summary = next(line for line in completed.stderr.splitlines() if line.startswith("✅ Username"))
+    # Проверки - только запрошенные пары
+    assert re.search(r"Username: 5 \| Проверок: 9 \| Найдено: 3 \|", summary)
+    assert f"Невозможных: {2 * SITES}" in summary
+    results = [json.loads(line) for line in (tmp_path / "out.ndjson").read_text(encoding="utf-8").splitlines()]
+    assert len(results) == 5 * SITES
+    assert sum(result["error"] == "Impossible" for result in results) == 2 * SITES
@@ -0,0 +1,41 @@
+import asyncio
+
+from whatsmyfinder import scan_body
+
+class ChunkedContent:
+    """Тело ответа, отдаваемое заданными блоками"""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.read = 0
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+class FakeResponse:
+    def __init__(self, chunks, charset=None):
+        self.content = ChunkedContent(chunks)
+        self.charset = charset
+
+def scan(chunks, needles, charset=None, limit=1 << 20):
+    response = FakeResponse(chunks, charset)
+    return asyncio.run(scan_body(response, needles, limit)), response.content.read
+
+def test_needle_split_across_chunks():
+    found, _ = scan([b"<title>Pro", b"file of al", b"ice</title>"], ["Profile of alice", "Not Found"])
+    assert found == {"Profile of alice"}
+
+def test_non_utf8_charset():
+    body = "<p>Пользователь не найден</p>".encode("windows-1251")
+    found, _ = scan([body[:12], body[12:]], ["не найден"], charset="windows-1251")
+    assert found == {"не найден"}
+
+def test_stops_when_every_needle_is_found():
+    found, read = scan([b"alpha", b"beta", b"gamma"], ["alpha"])
+    assert found == {"alpha"}
+    assert read == 1
+
+def test_bytes_past_limit_are_not_matched():
+    found, _ = scan([b"x" * 10, b"PROFILE"], ["PROFILE"], limit=12)
+    assert found == set()
@@ -0,0 +1,42 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from whatsmyfinder import SiteDatabase, SiteRecord, search_usernames
+
+SITES = 8
+
+async def search(**limits):
+    """Поиск alice по SITES сайтам-заглушкам, на каждом из которых профиль есть"""
+    async def profile(request):
+        return web.Response(text="PROFILE")
+
+    application = web.Application()
+    application.router.add_get("/{site}/{name}", profile)
+    runner = web.AppRunner(application)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    base = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    database = SiteDatabase([
+        SiteRecord(index, {"name": f"site{index}", "uri_check": f"{base}/s{index}/{{account}}", "e_code": 200,
+                           "e_string": "PROFILE", "m_code": 404, "m_string": "missing", "cat": "test"})
+        for index in range(SITES)
+    ], ["test"], {})
+    config = {"search": {"hedge_requests": False, "per_host_rate": 0, "max_retries": 0}}
+    try:
+        async with aiohttp.ClientSession() as session:
+            return [result async for result in search_usernames("alice", database, session, config=config, **limits)]
+    finally:
+        await runner.cleanup()
+
+def test_max_hits_is_a_hard_quota():
+    for _ in range(5):
+        results = asyncio.run(search(max_hits=2))
+        assert len(results) == SITES
+        assert sum(result.found for result in results) == 2
+        assert all(result.error == "NotChecked" for result in results if not result.found)
+
+def test_without_quota_every_site_is_reported():
+    results = asyncio.run(search())
+    assert sorted(result.name for result in results if result.found) == sorted(f"site{index}" for index in range(SITES))
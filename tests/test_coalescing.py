@@ -0,0 +1,64 @@
+import asyncio
+import collections
+
+import aiohttp
+from aiohttp import web
+
+from whatsmyfinder import SiteDatabase, SiteRecord, WhatsMyFinder, search_usernames, username_variants
+
+def site(index, name, path, **rules):
+    entry = {"name": name, "uri_check": f"{{base}}/{path}/{{account}}", "e_code": 200, "e_string": "PROFILE",
+             "m_code": 404, "m_string": "missing", "cat": "test", **rules}
+    return index, entry
+
+SITES = [
+    site(0, "profiles", "shared"),
+    # Тот же URL, но свое условие находки: запрос общий, вывод свой
+    site(1, "premium", "shared", e_string="Premium"),
+    site(2, "plain", "plain", strip_bad_char="._-"),
+]
+
+async def search(usernames, **options):
+    """Результаты поиска и число запросов к каждому пути сайтов-заглушек"""
+    requests = collections.Counter()
+
+    async def profile(request):
+        requests[request.path] += 1
+        # Ответ медленнее старта соседних проверок, чтобы они застали запрос в полете
+        await asyncio.sleep(0.1)
+        return web.Response(text="PROFILE")
+
+    application = web.Application()
+    application.router.add_get("/{site}/{name}", profile)
+    runner = web.AppRunner(application)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    base = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    database = SiteDatabase([SiteRecord(index, {**entry, "uri_check": entry["uri_check"].replace("{base}", base)})
+                             for index, entry in SITES], ["test"], {})
+    config = {"search": {"hedge_requests": False, "per_host_rate": 0, "max_retries": 0}}
+    try:
+        async with aiohttp.ClientSession() as session:
+            results = [result async for result in search_usernames(usernames, database, session, config=config, **options)]
+    finally:
+        await runner.cleanup()
+    return results, requests
+
+def test_sites_with_the_same_request_share_one_response():
+    results, requests = asyncio.run(search("alice"))
+    assert requests["/shared/alice"] == 1
+    assert {result.name: result.found for result in results} == {"profiles": True, "premium": False, "plain": True}
+
+def test_variants_giving_the_same_request_are_checked_once():
+    variants = username_variants("Alice_Smith")
+    assert len(variants) == 8
+    app = WhatsMyFinder.embed(SiteDatabase([SiteRecord(index, entry) for index, entry in SITES], ["test"], {}))
+    # Без разделителей остаются два написания: с заглавными и строчными
+    plain = [account for checked_site, account in app.plan_checks("Alice_Smith", app.database.sites) if checked_site.name == "plain"]
+    assert [app.database.sites[2].account(account) for account in plain] == ["AliceSmith", "alicesmith"]
+
+    results, requests = asyncio.run(search("Alice_Smith", variants=True))
+    assert requests["/plain/AliceSmith"] == 1
+    assert requests["/plain/alicesmith"] == 1
+    assert requests["/shared/alice.smith"] == 1
+    assert len(results) == 2 * len(variants) + len(plain)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+
+from whatsmyfinder import SearchDaemon, SiteDatabase, SiteRecord, WhatsMyFinder
+
+SLOW_SECONDS = 2.0
+
+async def start_runner(application: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(application)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+def port(runner: web.AppRunner) -> int:
+    return runner.addresses[0][1]
+
+async def sites_app() -> web.AppRunner:
+    """Два сайта-заглушки: быстрый и отвечающий через SLOW_SECONDS"""
+    async def fast(request):
+        return web.Response(text="PROFILE")
+
+    async def slow(request):
+        await asyncio.sleep(SLOW_SECONDS)
+        return web.Response(text="PROFILE")
+
+    application = web.Application()
+    application.router.add_get("/fast/{name}", fast)
+    application.router.add_get("/slow/{name}", slow)
+    return await start_runner(application)
+
+def daemon_app(sites: web.AppRunner, names=("fast", "slow")) -> WhatsMyFinder:
+    """Приложение с конфигурацией по умолчанию и сайтами-заглушками names"""
+    base = f"http://127.0.0.1:{port(sites)}"
+    app = WhatsMyFinder()
+    app.config["cache"]["enabled"] = False
+    app.config["search"].update({"hedge_requests": False, "per_host_rate": 0, "default_timeout": 10, "max_retries": 0})
+    app.database = SiteDatabase([
+        SiteRecord(index, {"name": name, "uri_check": f"{base}/{name}/{{account}}", "e_code": 200,
+                           "e_string": "PROFILE", "m_code": 404, "m_string": "missing", "cat": "test"})
+        for index, name in enumerate(names)
+    ], ["test"], {})
+    return app
+
+def test_results_stream_before_slow_site_finishes(tmp_path, monkeypatch):
+    # Конфигурация по умолчанию, папки кэша и отчетов - во временном каталоге
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        sites = await sites_app()
+        daemon = await start_runner(SearchDaemon(daemon_app(sites), max_jobs=1).web_app())
+        try:
+            async with aiohttp.ClientSession() as session:
+                url = f"http://127.0.0.1:{port(daemon)}"
+                async with session.post(f"{url}/jobs", json={"usernames": ["alice"], "all_results": True}) as response:
+                    job = await response.json()
+                started = time.monotonic()
+                arrivals = []
+                async with session.get(f"{url}/jobs/{job['id']}/results") as response:
+                    async for line in response.content:
+                        arrivals.append((json.loads(line)["name"], time.monotonic() - started))
+        finally:
+            await daemon.cleanup()
+            await sites.cleanup()
+        return arrivals
+
+    arrivals = asyncio.run(scenario())
+    assert [name for name, _ in arrivals] == ["fast", "slow"]
+    assert arrivals[0][1] < SLOW_SECONDS / 2
+    assert arrivals[1][1] >= SLOW_SECONDS * 0.9
+
+def test_delete_cancels_running_job(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def scenario():
+        sites = await sites_app()
+        daemon = SearchDaemon(daemon_app(sites, ("slow",)), max_jobs=1)
+        runner = await start_runner(daemon.web_app())
+        try:
+            async with aiohttp.ClientSession() as session:
+                url = f"http://127.0.0.1:{port(runner)}"
+                async with session.post(f"{url}/jobs", json={"usernames": ["alice"]}) as response:
+                    job_id = (await response.json())["id"]
+                while daemon.jobs[job_id].state != "running":
+                    await asyncio.sleep(0.01)
+                started = time.monotonic()
+                async with session.delete(f"{url}/jobs/{job_id}") as response:
+                    assert response.status == 200
+                task = daemon.jobs[job_id].task
+                await asyncio.wait([task], timeout=SLOW_SECONDS)
+                elapsed = time.monotonic() - started
+                async with session.get(f"{url}/jobs/{job_id}") as response:
+                    state = (await response.json())["state"]
+        finally:
+            await runner.cleanup()
+            await sites.cleanup()
+        return task, state, elapsed
+
+    task, state, elapsed = asyncio.run(scenario())
+    assert task.cancelled()
+    assert state == "cancelled"
+    assert elapsed < SLOW_SECONDS / 2
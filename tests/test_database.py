@@ -0,0 +1,21 @@
+from whatsmyfinder import SiteDatabase, SiteRecord
+
+def database(**changes):
+    entry = {"name": "site0", "uri_check": "https://example.com/{account}", "e_code": 200, "e_string": "PROFILE",
+             "m_code": 404, "m_string": "missing", "known": ["alice"], "cat": "test", **changes}
+    return SiteDatabase([SiteRecord(0, entry)], ["test"], {})
+
+def test_strip_bad_char_edit_changes_rules():
+    before = database()
+    after = database(strip_bad_char=".")
+    assert before.diff(after) == {"added": [], "removed": [], "changed": ["site0"]}
+    assert not after.current(before.sites[0])
+    assert before.sites[0].fingerprint() != after.sites[0].fingerprint()
+
+def test_known_edit_keeps_rules():
+    before = database()
+    after = database(known=["bob"])
+    assert before.diff(after)["changed"] == []
+    assert after.current(before.sites[0])
+    # Валидация перепроверяет сайт с новыми эталонными аккаунтами
+    assert before.sites[0].fingerprint() != after.sites[0].fingerprint()
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+
+from whatsmyfinder import PROBE_TIMEOUT, HealthStore, SiteDatabase, SiteHealth, SiteRecord, search_usernames
+
+def worker_store(baseline):
+    """Хранилище рабочего процесса: копия общего исходного состояния"""
+    store = HealthStore()
+    store.sites = {name: SiteHealth(data) for name, data in baseline.items()}
+    return store
+
+def test_merge_two_workers_against_one_baseline():
+    store = HealthStore()
+    store.get("site").latency.add(0.1)
+    store.get("site").requests += 1
+    baseline = store.snapshot()
+
+    snapshots = []
+    for latency in (0.2, 0.4):
+        worker = worker_store(baseline)
+        worker.get("site").latency.add(latency)
+        worker.get("site").requests += 1
+        snapshots.append(worker.snapshot())
+
+    for snapshot in snapshots:
+        store.merge(snapshot, baseline)
+
+    health = store.get("site")
+    assert health.latency.count == 3
+    assert sum(health.latency.counts) == 3
+    assert health.requests == 3
+
+def test_snapshot_is_not_changed_by_merge():
+    store = HealthStore()
+    store.get("site").latency.add(0.1)
+    baseline = store.snapshot()
+    worker = worker_store(baseline)
+    worker.get("site").latency.add(0.2)
+
+    store.merge(worker.snapshot(), baseline)
+
+    assert sum(baseline["site"]["latency"]) == 1
+
+def expired_quarantine(store, name):
+    """Сайт, карантин которого только что истек"""
+    health = store.get(name)
+    health.consecutive_failures = 5
+    health.quarantine_period = 3600
+    health.quarantined_until = time.time() - 1
+
+def site_record(base):
+    return SiteRecord(0, {"name": "site0", "uri_check": f"{base}/{{account}}", "e_code": 200, "e_string": "PROFILE",
+                          "m_code": 404, "m_string": "missing", "cat": "test"})
+
+def test_probe_ending_at_deadline_does_not_keep_quarantine():
+    async def scenario():
+        async def profile(request):
+            return web.Response(text="PROFILE")
+
+        application = web.Application()
+        application.router.add_get("/{name}", profile)
+        runner = web.AppRunner(application)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        database = SiteDatabase([site_record(f"http://127.0.0.1:{runner.addresses[0][1]}")], ["test"], {})
+        store = HealthStore()
+        expired_quarantine(store, "site0")
+        search = {"hedge_requests": False, "per_host_rate": 0, "max_retries": 0}
+        outcomes = []
+        try:
+            async with aiohttp.ClientSession() as session:
+                for deadline in (1e-6, 0, 0):
+                    config = {"search": {**search, "search_deadline": deadline}}
+                    outcomes.append([(result.name, result.error)
+                                     async for result in search_usernames("alice", database, session, config=config, health=store)])
+        finally:
+            await runner.cleanup()
+        return outcomes
+
+    probe, first, second = asyncio.run(scenario())
+    assert probe == [("site0", "Deadline")]
+    assert first == [("site0", None)]
+    assert second == [("site0", None)]
+
+def test_probe_that_never_started_expires():
+    store = HealthStore()
+    expired_quarantine(store, "site0")
+    site = site_record("http://127.0.0.1:9")
+
+    active, quarantined = store.schedule([site])
+    assert active == [site]
+    # Проба назначена, но проверка так и не началась (например, ее отменил бюджет времени)
+    assert store.schedule([site]) == ([], [site])
+
+    store.get("site0").probe_started -= PROBE_TIMEOUT
+    assert store.schedule([site]) == ([site], [])
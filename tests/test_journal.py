@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+
+from whatsmyfinder import CheckJournal, WhatsMyFinder
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "whatsmyfinder.py")
+# Варианты Alice_Smith: регистр и разделители _ . - и без разделителя
+VARIANTS = 8
+
+def write_setup(directory, port: int):
+    database = {"categories": ["test"], "sites": [
+        {"name": "site0", "uri_check": f"http://127.0.0.1:{port}/s0/{{account}}", "e_code": 200, "e_string": "PROFILE",
+         "m_code": 404, "m_string": "missing", "known": ["alice_smith"], "cat": "test"}
+    ]}
+    (directory / "db.json").write_text(json.dumps(database), encoding="utf-8")
+    config = WhatsMyFinder.default_config()
+    config["paths"]["database"] = "db.json"
+    config["cache"]["enabled"] = False
+    config["search"].update({"per_host_rate": 0, "hedge_requests": False, "max_retries": 0})
+    (directory / "config.json").write_text(json.dumps(config), encoding="utf-8")
+    (directory / "users.txt").write_text("Alice_Smith\n", encoding="utf-8")
+
+def run(directory, *args):
+    completed = subprocess.run([sys.executable, SCRIPT, *args], cwd=str(directory), capture_output=True, text=True,
+                               encoding="utf-8", timeout=120)
+    assert completed.returncode == 0, completed.stderr
+    return completed
+
+def read_results(directory):
+    return [json.loads(line) for line in (directory / "out.ndjson").read_text(encoding="utf-8").splitlines()]
+
+def test_resume_retries_failed_variant_with_saved_settings(tmp_path, site_server):
+    down = {"alice.smith"}
+
+    def handler(site, name):
+        if name in down:
+            return None, ""
+        return (200, "PROFILE") if name == "alice_smith" else (404, "missing")
+
+    write_setup(tmp_path, site_server(handler))
+    run(tmp_path, "--batch", "users.txt", "--all-results", "--variants", "--journal", "batch.journal", "-o", "out.ndjson")
+    first = read_results(tmp_path)
+    assert len(first) == VARIANTS
+    assert [result["username"] for result in first if result["error"]] == ["alice.smith"]
+
+    # Продолжение без --variants: набор проверок берется из журнала
+    down.clear()
+    resumed = run(tmp_path, "--resume", "batch.journal")
+    second = read_results(tmp_path)[len(first):]
+    assert [(result["username"], result["error"]) for result in second] == [("alice.smith", None)]
+    assert f"По журналу: {VARIANTS - 1} |" in resumed.stderr
+
+def test_journal_keeps_variants_apart(tmp_path):
+    path = str(tmp_path / "batch.journal")
+    journal = CheckJournal.create(path, {"batch": "users.txt"})
+    for variant, error in (("Alice_Smith", None), ("alice_smith", "Timeout"), ("alice_smith", None), ("alice.smith", "Timeout")):
+        journal.stream.write(journal.line({"username": variant, "name": "site0", "error": error}, "Alice_Smith"))
+    journal.close()
+
+    resumed, settings = CheckJournal.resume(path)
+    resumed.close()
+    assert settings == {"batch": "users.txt"}
+    assert resumed.done("Alice_Smith") == {("Alice_Smith", "site0"), ("alice_smith", "site0")}
+    assert resumed.done("alice.smith") == set()
+    assert CheckJournal.compact(path) == 2
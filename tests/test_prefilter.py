@@ -0,0 +1,46 @@
+from whatsmyfinder import SiteRecord
+
+def site(uri_check="https://example.com/{account}", **changes):
+    entry = {"name": "site0", "uri_check": uri_check, "e_code": 200, "e_string": "PROFILE",
+             "m_code": 404, "m_string": "missing", "known": ["alice"], "cat": "test", **changes}
+    return SiteRecord(0, entry)
+
+def test_default_keeps_only_structural_constraints():
+    path = site()
+    # Эталонный аккаунт латиницей не отсеивает пробелы, апострофы и не-ASCII
+    for username in ("Иван", "o'brien", "x+y", "john doe"):
+        assert path.accepts(username)
+    assert not path.accepts("a/b")
+    assert not path.accepts("a?b")
+    assert not path.accepts("tab\there")
+
+def test_query_and_json_body_constraints():
+    query = site("https://example.com/user?name={account}")
+    assert query.accepts("a/b")
+    assert not query.accepts("a&b")
+    body = site("https://example.com/api", post_body='{"name": "{account}"}')
+    assert body.accepts("a/b")
+    assert not body.accepts('a"b')
+
+def test_subdomain_is_dns_label():
+    subdomain = site("https://{account}.example.com/")
+    assert subdomain.accepts("Alice")
+    assert subdomain.account("Alice") == "alice"
+    assert not subdomain.accepts("a_b")
+    assert not subdomain.accepts("-alice")
+    assert not subdomain.accepts("a" * 64)
+
+def test_strict_uses_charset_of_known():
+    path = site()
+    assert path.accepts("alice.b-c_1", strict=True)
+    assert not path.accepts("Иван", strict=True)
+    assert not path.accepts("john doe", strict=True)
+    # Не-ASCII в known расширяет класс и для strict
+    assert site(known=["alice", "Иван"]).accepts("Пётр", strict=True)
+
+def test_strip_bad_char():
+    stripped = site(strip_bad_char="/.")
+    # Удаляемые символы не ломают запрос
+    assert stripped.accepts("a/b")
+    assert stripped.account("a.b/c") == "abc"
+    assert not stripped.accepts("./")
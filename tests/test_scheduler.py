@@ -0,0 +1,94 @@
+import asyncio
+
+from whatsmyfinder import CheckGroup, CheckScheduler, SiteRecord
+
+def site(index: int) -> SiteRecord:
+    return SiteRecord(index, {"name": f"site{index}", "uri_check": f"https://example.com/{index}/{{account}}", "e_code": 200,
+                              "e_string": "PROFILE", "m_code": 404, "m_string": "missing", "cat": "test"})
+
+def test_cancelled_waiter_passes_room_to_next():
+    async def scenario():
+        scheduler = CheckScheduler(workers=1, capacity=1)
+        group = CheckGroup(None)
+        scheduler.submit(group, 0, 0, site(0), "alice")
+        first = asyncio.ensure_future(scheduler.wait_room())
+        second = asyncio.ensure_future(scheduler.wait_room())
+        await asyncio.sleep(0)
+
+        # Место освобождается для first, но first отменяют раньше, чем он его займет
+        await scheduler.cancel(group)
+        first.cancel()
+        await asyncio.wait_for(second, 1)
+        return first
+
+    first = asyncio.run(scenario())
+    assert first.cancelled()
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        scheduler = CheckScheduler(workers=1, capacity=1)
+        scheduler.submit(CheckGroup(None), 0, 0, site(0), "alice")
+        waiter = asyncio.ensure_future(scheduler.wait_room())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return scheduler._putters
+
+    assert not asyncio.run(scenario())
+
+def test_checks_run_by_priority_then_rank():
+    async def scenario():
+        order = []
+
+        async def run(site, username, deadline):
+            order.append((username, site.name))
+            return {}
+
+        scheduler = CheckScheduler(workers=1, capacity=10)
+        group = CheckGroup(run)
+        # Более ранний username (меньший priority) разбирается первым, внутри него - по rank
+        scheduler.submit(group, 1, 0, site(0), "bob")
+        scheduler.submit(group, 0, 1, site(1), "alice")
+        scheduler.submit(group, 0, 0, site(2), "alice")
+        scheduler.submit(group, 1, 1, site(3), "bob")
+        scheduler.start()
+        for _ in range(4):
+            await group.finished.get()
+        await scheduler.close()
+        return order
+
+    assert asyncio.run(scenario()) == [("alice", "site2"), ("alice", "site1"), ("bob", "site0"), ("bob", "site3")]
+
+def test_cancel_reports_queued_and_running_checks_of_group_only():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def run(site, username, deadline):
+            await release.wait()
+            return {"name": site.name}
+
+        scheduler = CheckScheduler(workers=1, capacity=10)
+        cancelled = CheckGroup(run)
+        other = CheckGroup(run)
+        scheduler.submit(cancelled, 0, 0, site(0), "alice")
+        scheduler.submit(cancelled, 0, 1, site(1), "alice")
+        scheduler.submit(other, 1, 0, site(2), "bob")
+        scheduler.start()
+        await asyncio.sleep(0.01)
+        assert scheduler.running() == 1
+
+        await scheduler.cancel(cancelled)
+        finished = {}
+        while not cancelled.finished.empty():
+            checked_site, _, task = cancelled.finished.get_nowait()
+            finished[checked_site.name] = task
+        release.set()
+        _, _, task = await asyncio.wait_for(other.finished.get(), 1)
+        await scheduler.close()
+        return finished, task
+
+    finished, other_task = asyncio.run(scenario())
+    # Начатая проверка отменена, не начатая снята из очереди без задачи
+    assert finished["site0"].cancelled()
+    assert finished["site1"] is None
+    assert other_task.result() == {"name": "site2"}
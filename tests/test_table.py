@@ -0,0 +1,40 @@
+from whatsmyfinder import ResultTable, SiteDatabase, SiteRecord
+
+def database():
+    return SiteDatabase([
+        SiteRecord(index, {"name": name, "uri_check": f"https://{name}.example/{{account}}", "e_code": 200,
+                           "e_string": "PROFILE", "m_code": 404, "m_string": "missing", "cat": category})
+        for index, (name, category) in enumerate((("github", "coding"), ("gitlab", "coding"), ("vk", "social")))
+    ], ["coding", "social"], {})
+
+def result(username, name, category, found=False, error=None, status=200, elapsed=0.25, cached=False):
+    url = f"https://{name}.example/{username}" if name != "gone" else ""
+    return {"username": username, "name": name, "url": url, "found": found, "error": error, "category": category,
+            "status": status, "elapsed": elapsed, "cached": cached}
+
+RESULTS = [
+    result("alice", "github", "coding", found=True),
+    result("alice", "gitlab", "coding", status=404, elapsed=0.125, cached=True),
+    result("alice", "vk", "social", error="Timeout", status=None, elapsed=None),
+    result("Иван", "github", "coding", error="Impossible", status=None, elapsed=None),
+    result("bob", "vk", "social", found=True, elapsed=1.5),
+    # Сайт удален перезагрузкой базы: URL не из чего восстановить
+    result("bob", "gone", "misc", status=404),
+]
+
+def test_rows_round_trip():
+    table = ResultTable(database())
+    for row in RESULTS:
+        table.add(row)
+    assert len(table) == len(RESULTS)
+    assert list(table) == RESULTS
+
+def test_counts_and_groups():
+    table = ResultTable(database())
+    for row in RESULTS:
+        table.add(row)
+    assert table.counts() == {"checks": 6, "found": 2, "errors": 1, "cached": 1, "impossible": 1}
+    assert {username: list(rows) for username, rows in table.group_by_username(found_only=True).items()} == {"alice": [0], "bob": [4]}
+    assert {category: list(rows) for category, rows in table.group_by_category().items()} == {
+        "coding": [0, 1, 3], "social": [2, 4], "misc": [5]
+    }
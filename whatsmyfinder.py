@@ -7,36 +7,2300 @@ Database Source: WebBreacher/WhatsMyName
 """
 
 import json
+import re
 import asyncio
 import aiohttp
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
 import ssl
 import os
 import sys
 import csv
+import io
+import array
 import uuid
+import time
+import pickle
+import pstats
+import cProfile
+import traceback
+import sqlite3
+import hashlib
+import random
+import socket
+import bisect
+import heapq
+import queue
+import argparse
+import threading
+import itertools
+import contextlib
+import functools
+import concurrent.futures
+import collections
+import multiprocessing
 from datetime import datetime
-from typing import Dict, List, Set, Optional
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Set, Optional, TextIO, Tuple, Union
 from urllib.parse import urlparse
 import colorama
 from colorama import Fore, Style, Back
 
-# Инициализация colorama
-colorama.init()
+# Размер блока чтения тела ответа и лимит по умолчанию для потокового поиска
+BODY_CHUNK_SIZE = 65536
+DEFAULT_MAX_BODY_BYTES = 1048576
+# Тела не длиннее этого дочитываются, чтобы соединение вернулось в пул keep-alive
+KEEPALIVE_DRAIN_BYTES = 16384
+
+async def scan_body(response: aiohttp.ClientResponse, needles: Iterable[str], limit: int, trace: Optional["RequestTrace"] = None) -> Set[str]:
+    """Ищет строки в теле ответа за один проход по частям, останавливаясь, когда найдены все, или после limit байт"""
+    patterns = {}
+    for needle in needles:
+        encoded = {needle.encode("utf-8")}
+        if response.charset:
+            try:
+                encoded.add(needle.encode(response.charset))
+            except (LookupError, UnicodeEncodeError):
+                pass
+        patterns[needle] = encoded
+    
+    # Хвост предыдущего блока сохраняется, чтобы найти совпадение на границе блоков
+    overlap = max(len(pattern) for encoded in patterns.values() for pattern in encoded) - 1
+    found = set()
+    tail = b""
+    consumed = 0
+    
+    async for chunk in response.content.iter_chunked(BODY_CHUNK_SIZE):
+        chunk = chunk[:limit - consumed]
+        consumed += len(chunk)
+        window = tail + chunk
+        matching_started = time.perf_counter() if trace is not None else None
+        for needle, encoded in list(patterns.items()):
+            if any(pattern in window for pattern in encoded):
+                found.add(needle)
+                del patterns[needle]
+        if trace is not None:
+            trace.phases["match"] += time.perf_counter() - matching_started
+        if not patterns or consumed >= limit:
+            break
+        tail = window[-overlap:] if overlap else b""
+    
+    return found
+
+async def drain_small_body(response: aiohttp.ClientResponse):
+    """Дочитывает короткое тело ответа, чтобы не закрывать соединение"""
+    length = response.content_length
+    if length is not None and length <= KEEPALIVE_DRAIN_BYTES:
+        await response.read()
+
+# Разделители слов в username, между которыми перебираются варианты
+VARIANT_SEPARATORS = ("_", ".", "-", "")
+
+def username_variants(username: str) -> List[str]:
+    """Варианты написания username: регистр и разделители слов"""
+    words = username
+    for separator in VARIANT_SEPARATORS[:-1]:
+        words = words.replace(separator, " ")
+    words = words.split()
+    
+    bases = [username]
+    if len(words) > 1:
+        bases.extend(separator.join(words) for separator in VARIANT_SEPARATORS)
+    variants = []
+    for base in bases:
+        for variant in (base, base.lower()):
+            if variant not in variants:
+                variants.append(variant)
+    return variants
+
+def username_shape(username: str) -> str:
+    """Класс username для статистики находок: длина и состав символов (john_doe99 -> "l:a9_")"""
+    length = len(username)
+    size = "s" if length <= 4 else "m" if length <= 8 else "l" if length <= 12 else "x"
+    letters = "a" if any(char.isalpha() for char in username) else ""
+    digits = "9" if any(char.isdigit() for char in username) else ""
+    other = "_" if any(not char.isalnum() for char in username) else ""
+    return f"{size}:{letters}{digits}{other}"
+
+# Заголовки по умолчанию для сайтов без собственных заголовков
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "text/html",
+}
+
+# Версия формата скомпилированной базы; увеличивается при изменении SiteRecord
+DB_CACHE_VERSION = 2
+
+# Ограничения на username сайта: класс символов, символы, ломающие запрос, границы длины (0 - без предела) и регистр
+UsernameConstraints = collections.namedtuple("UsernameConstraints", "charset forbidden min_length max_length lowercase")
+
+# Классы символов username: метка DNS, ASCII-имя (буквы, цифры, _ . -), любые печатные символы.
+# ASCII-имя выводится из эталонных аккаунтов и применяется только в строгом отсеве
+USERNAME_CHARSETS = {
+    "dns": re.compile(r"[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\Z"),
+    "word": re.compile(r"[A-Za-z0-9_.-]+\Z"),
+    "any": re.compile(r"[^\x00-\x1f\x7f]+\Z")
+}
+
+def username_constraints(uri_check: str, post_body: Optional[str], known: Iterable[str], strip_bad_char: str) -> UsernameConstraints:
+    """Ограничения на username по месту {account} в запросе и эталонным аккаунтам из known"""
+    parsed = urlparse(uri_check.replace("{account}", "account"))
+    forbidden = set()
+    if "{account}" in uri_check:
+        before = uri_check.split("{account}")[0]
+        if "account" in parsed.netloc and "/" not in before.split("://", 1)[-1]:
+            # Поддомен: метка DNS без учета регистра, не длиннее 63 символов
+            return UsernameConstraints("dns", "", 1, 63, True)
+        # Символы, которые изменили бы путь или запрос вместо имени
+        forbidden.update("&#" if "?" in before else "/?#")
+    if post_body and "{account}" in post_body:
+        forbidden.update('"\\' if post_body.lstrip().startswith(("{", "[")) else "&=")
+    # ASCII-имя, если эталонные аккаунты не выходят за него: пробелы и не-ASCII встречаются только там, где они есть в known
+    accounts = ["".join(char for char in account if char not in strip_bad_char) for account in known]
+    charset = "word" if all(USERNAME_CHARSETS["word"].match(account) for account in accounts if account) else "any"
+    return UsernameConstraints(charset, "".join(sorted(forbidden - set(strip_bad_char))), 1, 0, False)
+
+class SiteRecord:
+    """Компактная запись сайта с заранее разобранными шаблонами"""
+    
+    __slots__ = (
+        "id", "name", "cat", "host", "url_parts", "body_parts", "pretty_parts",
+        "headers", "e_code", "e_string", "m_code", "m_string", "known",
+        "strip_bad_char", "protection", "max_body_bytes", "constraints"
+    )
+    
+    def __init__(self, site_id: int, entry: Dict):
+        uri_check = entry.get("uri_check", "")
+        post_body = entry.get("post_body")
+        uri_pretty = entry.get("uri_pretty")
+        
+        self.id = site_id
+        self.name = entry.get("name", "Unknown")
+        self.cat = entry.get("cat", "unknown")
+        self.host = (urlparse(uri_check.replace("{account}", "account")).hostname or "").lower()
+        # Шаблоны хранятся разрезанными по {account}: подстановка сводится к str.join
+        self.url_parts = tuple(uri_check.split("{account}")) if "{account}" in uri_check else None
+        self.body_parts = tuple(post_body.split("{account}")) if post_body else None
+        self.pretty_parts = tuple(uri_pretty.split("{account}")) if uri_pretty else None
+        self.headers = entry.get("headers") or DEFAULT_HEADERS
+        self.e_code = entry.get("e_code")
+        self.e_string = entry.get("e_string", "")
+        self.m_code = entry.get("m_code")
+        self.m_string = entry.get("m_string", "")
+        self.known = tuple(entry.get("known", ()))
+        self.strip_bad_char = entry.get("strip_bad_char", "")
+        self.protection = tuple(entry.get("protection", ()))
+        self.max_body_bytes = entry.get("max_body_bytes")
+        self.constraints = username_constraints(uri_check, post_body, self.known, self.strip_bad_char)
+    
+    def account(self, username: str) -> str:
+        """Username без символов, которые сайт не принимает (strip_bad_char), в регистре, который сайт различает"""
+        if self.strip_bad_char:
+            username = "".join(char for char in username if char not in self.strip_bad_char)
+        return username.lower() if self.constraints.lowercase else username
+    
+    def accepts(self, username: str, strict: bool = False) -> bool:
+        """Может ли username существовать на сайте: длина, символы, ломающие запрос, а со strict - и класс символов known"""
+        constraints = self.constraints
+        account = self.account(username)
+        if len(account) < constraints.min_length or (constraints.max_length and len(account) > constraints.max_length):
+            return False
+        if constraints.forbidden and any(char in constraints.forbidden for char in account):
+            return False
+        # Класс символов из 1-3 эталонных аккаунтов - догадка: без strict отсеиваются только непечатные символы
+        charset = constraints.charset if strict or constraints.charset != "word" else "any"
+        return USERNAME_CHARSETS[charset].match(account) is not None
+    
+    def url(self, username: str) -> str:
+        """URL проверки для username"""
+        return self.account(username).join(self.url_parts)
+    
+    def body(self, username: str) -> Optional[str]:
+        """Тело POST-запроса для username"""
+        return self.account(username).join(self.body_parts) if self.body_parts else None
+    
+    def request_key(self, username: str) -> tuple:
+        """Ключ HTTP-запроса: у сайтов и вариантов username с одинаковым ключом ответ общий"""
+        return (self.url(username), self.body(username), tuple(sorted(self.headers.items())))
+    
+    def needle(self, status: int) -> Optional[str]:
+        """Строка, которую нужно искать в теле при данном коде ответа; None, если исход решает код"""
+        if self.e_code is not None and status == self.e_code:
+            return self.e_string or None
+        # Fallback: код ответа однозначно говорит об отсутствии профиля
+        if (self.m_code is not None and status == self.m_code) or status in (404, 410, 403, 400):
+            return None
+        return self.m_string or None
+    
+    def matches(self, status: int, found: Set[str]) -> bool:
+        """Применяет правила сайта к коду ответа и найденным в теле строкам"""
+        if self.e_code is not None and status == self.e_code:
+            return not self.e_string or self.e_string in found
+        if (self.m_code is not None and status == self.m_code) or status in (404, 410, 403, 400):
+            return False
+        return not self.m_string or self.m_string not in found
+    
+    def rules(self, known: bool = True) -> tuple:
+        """Правила проверки: URL, тело запроса, заголовки, условия и удаляемые символы, с known - и эталонные аккаунты"""
+        # strip_bad_char меняет URL запроса и ограничения на username
+        rules = (
+            self.url_parts, self.body_parts, sorted(self.headers.items()),
+            self.e_code, self.e_string, self.m_code, self.m_string, self.strip_bad_char
+        )
+        return rules + (self.known,) if known else rules
+    
+    def fingerprint(self) -> str:
+        """Хэш правил проверки: меняется при правке URL, тела запроса, заголовков, условий, strip_bad_char или known"""
+        return hashlib.sha1(json.dumps(self.rules(), ensure_ascii=False).encode("utf-8")).hexdigest()
+    
+    def to_row(self) -> tuple:
+        """Сериализует запись в кортеж для скомпилированной базы"""
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+    
+    @classmethod
+    def from_row(cls, row: tuple) -> "SiteRecord":
+        """Восстанавливает запись из кортежа без повторного разбора шаблонов"""
+        site = cls.__new__(cls)
+        (site.id, site.name, site.cat, site.host, site.url_parts, site.body_parts, site.pretty_parts,
+         site.headers, site.e_code, site.e_string, site.m_code, site.m_string, site.known,
+         site.strip_bad_char, site.protection, site.max_body_bytes, site.constraints) = row
+        return site
+
+class SiteDatabase:
+    """База сайтов с индексами по категориям и хостам"""
+    
+    def __init__(self, sites: List[SiteRecord], categories: List[str], source: Dict, indexes: Optional[Dict] = None):
+        self.sites = sites
+        self.categories = categories
+        self.source = source
+        self.by_name = {site.name: site for site in sites}
+        if indexes is None:
+            self.by_category = {}
+            self.by_host = {}
+            for site in sites:
+                self.by_category.setdefault(site.cat, []).append(site)
+                self.by_host.setdefault(site.host, []).append(site)
+        else:
+            self.by_category = {cat: [sites[i] for i in ids] for cat, ids in indexes["by_category"].items()}
+            self.by_host = {host: [sites[i] for i in ids] for host, ids in indexes["by_host"].items()}
+    
+    @classmethod
+    def from_json(cls, db_path: str, source: Dict) -> "SiteDatabase":
+        """Разбирает исходный wmn-data.json"""
+        with open(db_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        sites = [SiteRecord(i, entry) for i, entry in enumerate(data.get("sites", []))]
+        return cls(sites, data.get("categories", []), source)
+    
+    @classmethod
+    def load(cls, db_path: str, cache_path: str) -> "SiteDatabase":
+        """Загружает базу из скомпилированного кэша, пересобирая его при изменении исходника"""
+        stat = os.stat(db_path)
+        source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": None}
+        
+        cached = None
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get("version") != DB_CACHE_VERSION:
+                cached = None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError, KeyError):
+            cached = None
+        
+        if cached:
+            cached_source = cached["source"]
+            if cached_source["mtime_ns"] == source["mtime_ns"] and cached_source["size"] == source["size"]:
+                return cls.from_cache(cached, cached_source)
+        
+        # mtime изменился: сверяем содержимое по хэшу, прежде чем пересобирать
+        source["sha256"] = file_sha256(db_path)
+        if cached and cached["source"]["sha256"] == source["sha256"]:
+            database = cls.from_cache(cached, source)
+        else:
+            database = cls.from_json(db_path, source)
+        database.save(cache_path)
+        return database
+    
+    @classmethod
+    def from_cache(cls, cached: Dict, source: Dict) -> "SiteDatabase":
+        """Восстанавливает базу и готовые индексы из скомпилированного кэша"""
+        sites = [SiteRecord.from_row(row) for row in cached["sites"]]
+        return cls(sites, cached["categories"], source, cached["indexes"])
+    
+    def save(self, cache_path: str):
+        """Атомарно сохраняет скомпилированную базу"""
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        indexes = {
+            "by_category": {cat: [site.id for site in sites] for cat, sites in self.by_category.items()},
+            "by_host": {host: [site.id for site in sites] for host, sites in self.by_host.items()}
+        }
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({
+                "version": DB_CACHE_VERSION,
+                "source": self.source,
+                "sites": [site.to_row() for site in self.sites],
+                "categories": self.categories,
+                "indexes": indexes
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    
+    def diff(self, other: "SiteDatabase") -> Dict[str, List[str]]:
+        """Отличия other от этой базы: добавленные, удаленные сайты и сайты с измененными правилами"""
+        before = self.by_name.keys()
+        after = other.by_name.keys()
+        return {
+            "added": sorted(after - before),
+            "removed": sorted(before - after),
+            # Правка одних known не меняет результатов проверок
+            "changed": sorted(name for name in after & before
+                              if self.by_name[name].rules(known=False) != other.by_name[name].rules(known=False))
+        }
+    
+    def current(self, site: SiteRecord) -> bool:
+        """Действует ли запись сайта в этой базе; поиск, начатый на прежней базе, может держать устаревшую"""
+        record = self.by_name.get(site.name)
+        return record is site or (record is not None and record.rules(known=False) == site.rules(known=False))
+    
+    def select(self, categories: Set[str]) -> List[SiteRecord]:
+        """Сайты выбранных категорий в порядке базы"""
+        if not categories:
+            return self.sites
+        selected = [site for cat in categories for site in self.by_category.get(cat, ())]
+        selected.sort(key=lambda site: site.id)
+        return selected
+
+def file_sha256(path: str) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BODY_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class AdaptiveLimiter:
+    """Глобальный лимит одновременных запросов, подстраивающийся под отклик сети (AIMD)"""
+    
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, adaptive: bool = True, backoff_interval: float = 1.0):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.adaptive = adaptive
+        self.backoff_interval = backoff_interval
+        self.in_flight = 0
+        # До первого сигнала перегрузки лимит растет экспоненциально (slow start)
+        self.threshold = float(maximum)
+        self._last_backoff = 0.0
+        self._waiters = collections.deque()
+    
+    async def acquire(self):
+        """Занимает слот, ожидая освобождения при достижении лимита"""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_event_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+                # Переданный этому ожидающему слот отдаем следующему
+                self._wake()
+                raise
+        self.in_flight += 1
+    
+    def try_acquire(self) -> bool:
+        """Занимает слот без ожидания; False, если лимит исчерпан или слот ждут другие"""
+        if self.in_flight >= int(self.limit) or self._waiters:
+            return False
+        self.in_flight += 1
+        return True
+    
+    def release(self):
+        """Освобождает слот"""
+        self.in_flight -= 1
+        self._wake()
+    
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+    
+    def record_success(self):
+        """Успешный ответ: увеличивает лимит"""
+        if not self.adaptive:
+            return
+        if self.limit < self.threshold:
+            self.limit += 1
+        else:
+            self.limit += 1 / self.limit
+        self.limit = min(self.limit, self.maximum)
+        self._wake()
+    
+    def record_congestion(self):
+        """Таймаут или 429: уменьшает лимит вдвое, не чаще раза в backoff_interval"""
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        if now - self._last_backoff < self.backoff_interval:
+            return
+        self._last_backoff = now
+        self.limit = max(self.minimum, self.limit / 2)
+        self.threshold = self.limit
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+class HostThrottle:
+    """Ограничивает число одновременных запросов и их частоту для каждого хоста"""
+    
+    def __init__(self, limit: int, rate: float):
+        self.limit = limit
+        self.interval = 1 / rate if rate else 0.0
+        self._semaphores = {}
+        self._next_slot = {}
+    
+    @contextlib.asynccontextmanager
+    async def slot(self, host: str):
+        """Слот запроса к хосту с соблюдением интервала между запросами"""
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.limit)
+        
+        async with semaphore:
+            now = time.monotonic()
+            start = max(now, self._next_slot.get(host, 0.0))
+            self._next_slot[host] = start + self.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+    
+    async def try_acquire(self, host: str) -> bool:
+        """Занимает слот хоста без ожидания; False, если слоты заняты или интервал между запросами не выдержан"""
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.limit)
+        now = time.monotonic()
+        if semaphore.locked() or self._next_slot.get(host, 0.0) > now:
+            return False
+        # Свободный семафор занимается без переключения задач
+        await semaphore.acquire()
+        self._next_slot[host] = now + self.interval
+        return True
+    
+    def release(self, host: str):
+        """Освобождает слот, занятый try_acquire"""
+        self._semaphores[host].release()
+    
+    def penalize(self, host: str, delay: float):
+        """Откладывает следующие запросы к хосту (например, по Retry-After)"""
+        self._next_slot[host] = max(self._next_slot.get(host, 0.0), time.monotonic() + delay)
+
+class ResultCache:
+    """Кэш результатов проверок в SQLite с TTL и вытеснением старых записей"""
+    
+    COLUMNS = ("site", "username", "category", "url", "found", "status", "error", "elapsed", "checked_at", "expires_at")
+    
+    def __init__(self, path: str, ttl_found: float, ttl_missing: float, ttl_error: float, max_entries: int, flush_every: int = 500):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ttl_found = ttl_found
+        self.ttl_missing = ttl_missing
+        self.ttl_error = ttl_error
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self._pending = []
+        # Несколько рабочих процессов пишут в одну базу: ждем снятия блокировки
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                site TEXT NOT NULL,
+                username TEXT NOT NULL,
+                category TEXT,
+                url TEXT,
+                found INTEGER NOT NULL,
+                status INTEGER,
+                error TEXT,
+                elapsed REAL,
+                checked_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (site, username)
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_username ON results (username, checked_at);
+            CREATE INDEX IF NOT EXISTS idx_results_site_found ON results (site, found);
+            CREATE INDEX IF NOT EXISTS idx_results_checked_at ON results (checked_at);
+        """)
+    
+    @staticmethod
+    def to_result(row: sqlite3.Row) -> Dict:
+        """Строка таблицы в формате результата check_site"""
+        return {
+            "username": row["username"],
+            "name": row["site"],
+            "url": row["url"],
+            "found": bool(row["found"]),
+            "error": row["error"],
+            "category": row["category"],
+            "status": row["status"],
+            "elapsed": row["elapsed"],
+            "cached": True
+        }
+    
+    def get(self, site: str, username: str) -> Optional[Dict]:
+        """Неистекший результат для пары (сайт, username)"""
+        row = self.db.execute(
+            "SELECT * FROM results WHERE site = ? AND username = ? AND expires_at > ?",
+            (site, username, time.time())
+        ).fetchone()
+        return self.to_result(row) if row else None
+    
+    def put(self, result: Dict):
+        """Сохраняет результат; запись буферизуется и сбрасывается пачками"""
+        if result["error"]:
+            ttl = self.ttl_error
+        elif result["found"]:
+            ttl = self.ttl_found
+        else:
+            ttl = self.ttl_missing
+        if ttl <= 0:
+            return
+        
+        now = time.time()
+        self._pending.append((
+            result["name"], result["username"], result["category"], result["url"],
+            int(result["found"]), result["status"], result["error"], result["elapsed"], now, now + ttl
+        ))
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+    
+    def flush(self):
+        """Записывает накопленные результаты"""
+        if not self._pending:
+            return
+        with self.db:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                self._pending
+            )
+        self._pending = []
+    
+    def evict(self):
+        """Удаляет истекшие записи и самые старые сверх max_entries"""
+        self.flush()
+        with self.db:
+            self.db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+            count = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                self.db.execute(
+                    "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY checked_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+    
+    def invalidate(self, sites: List[str]) -> int:
+        """Удаляет все результаты указанных сайтов"""
+        self.flush()
+        with self.db:
+            return self.db.executemany("DELETE FROM results WHERE site = ?", [(site,) for site in sites]).rowcount
+    
+    def found_on_site(self, site: str) -> List[Dict]:
+        """Все username, найденные на сайте"""
+        self.flush()
+        rows = self.db.execute(
+            "SELECT * FROM results WHERE site = ? AND found = 1 ORDER BY username", (site,)
+        ).fetchall()
+        return [self.to_result(row) for row in rows]
+    
+    def last_status(self, username: str) -> List[Dict]:
+        """Последний известный результат username по каждому сайту"""
+        self.flush()
+        rows = self.db.execute(
+            "SELECT * FROM results WHERE username = ? ORDER BY site", (username,)
+        ).fetchall()
+        return [self.to_result(row) for row in rows]
+    
+    def close(self):
+        """Сбрасывает буфер, вытесняет лишнее и закрывает базу"""
+        self.evict()
+        self.db.close()
+
+# Минимум замеров, после которого задержкам сайта можно доверять
+LATENCY_MIN_SAMPLES = 5
+
+# Через сколько секунд незавершенная проба после карантина (например, отмененная до старта) уступает следующей
+PROBE_TIMEOUT = 120.0
+
+# Априорная доля находок на сайте и ее вес в проверках, пока истории мало
+HIT_RATE_PRIOR = 0.1
+HIT_RATE_WEIGHT = 2
+
+# Коды ответа, которые считаются временными и повторяются
+RETRY_STATUSES = (429, 502, 503, 504)
+
+def is_transient_error(error: Exception) -> bool:
+    """Ошибка, при которой имеет смысл повторить запрос"""
+    if isinstance(error, (aiohttp.ClientSSLError, aiohttp.InvalidURL)):
+        return False
+    if isinstance(error, aiohttp.ClientConnectorError):
+        # Несуществующий домен повтор не исправит
+        return not isinstance(error.os_error, socket.gaierror)
+    return isinstance(error, (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError, aiohttp.ClientPayloadError))
+
+class LatencyHistogram:
+    """Гистограмма задержек с логарифмическими корзинами"""
+    
+    BOUNDS = tuple(0.05 * 1.4 ** i for i in range(24))
+    
+    def __init__(self, counts: Optional[List[int]] = None):
+        self.counts = list(counts) if counts else [0] * (len(self.BOUNDS) + 1)
+        self.count = sum(self.counts)
+    
+    def add(self, seconds: float):
+        """Учитывает одну задержку"""
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+    
+    def percentile(self, p: float) -> float:
+        """Верхняя граница корзины, в которую попадает p-й процентиль"""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.BOUNDS[min(i, len(self.BOUNDS) - 1)]
+        return self.BOUNDS[-1]
+
+class SiteHealth:
+    """Накопленная статистика доступности одного сайта"""
+    
+    __slots__ = (
+        "latency", "requests", "errors", "timeouts", "last_success", "last_error",
+        "statuses", "consecutive_failures", "quarantined_until", "quarantine_period", "probe_started", "hits"
+    )
+    
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.latency = LatencyHistogram(data.get("latency"))
+        self.requests = data.get("requests", 0)
+        self.errors = data.get("errors", 0)
+        self.timeouts = data.get("timeouts", 0)
+        self.last_success = data.get("last_success")
+        self.last_error = data.get("last_error")
+        self.statuses = data.get("statuses", {})
+        self.consecutive_failures = data.get("consecutive_failures", 0)
+        self.quarantined_until = data.get("quarantined_until", 0.0)
+        self.quarantine_period = data.get("quarantine_period", 0.0)
+        self.probe_started = 0.0
+        # Класс username -> [проверок без ошибок, находок]
+        self.hits = data.get("hits", {})
+    
+    def to_dict(self) -> Dict:
+        """Сериализует запись для сохранения"""
+        # Копии: снимок служит базой для слияния приращений рабочих процессов, а merge меняет счетчики на месте
+        return {
+            "latency": list(self.latency.counts),
+            "requests": self.requests,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+            "statuses": dict(self.statuses),
+            "consecutive_failures": self.consecutive_failures,
+            "quarantined_until": self.quarantined_until,
+            "quarantine_period": self.quarantine_period,
+            "hits": {shape: list(entry) for shape, entry in self.hits.items()}
+        }
+    
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+    
+    def expected_latency(self, default: float) -> float:
+        """Ожидаемая задержка сайта (p90), пока замеров мало — default"""
+        if self.latency.count < LATENCY_MIN_SAMPLES:
+            return default
+        return self.latency.percentile(90)
+    
+    def hit_rate(self, shape: str) -> float:
+        """Доля находок для класса username, сглаженная к доле по всем классам, а та - к HIT_RATE_PRIOR"""
+        checks = sum(entry[0] for entry in self.hits.values())
+        found = sum(entry[1] for entry in self.hits.values())
+        site_rate = (found + HIT_RATE_PRIOR * HIT_RATE_WEIGHT) / (checks + HIT_RATE_WEIGHT)
+        checks, found = self.hits.get(shape, (0, 0))
+        return (found + site_rate * HIT_RATE_WEIGHT) / (checks + HIT_RATE_WEIGHT)
+
+class HealthStore:
+    """Телеметрия здоровья сайтов между запусками и политика планирования"""
+    
+    def __init__(self, path: Optional[str] = None, quarantine_after: int = 5,
+                 quarantine_period: float = 3600, quarantine_max: float = 86400):
+        self.path = path
+        self.quarantine_after = quarantine_after
+        self.quarantine_initial = quarantine_period
+        self.quarantine_max = quarantine_max
+        self.sites = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.sites = {name: SiteHealth(data) for name, data in json.load(f).items()}
+            except (OSError, ValueError, TypeError):
+                self.sites = {}
+    
+    def get(self, name: str) -> SiteHealth:
+        """Запись сайта, создается при первом обращении"""
+        health = self.sites.get(name)
+        if health is None:
+            health = self.sites[name] = SiteHealth()
+        return health
+    
+    def record(self, site: SiteRecord, result: Dict):
+        """Учитывает итог сетевой проверки сайта"""
+        # Истекший дедлайн поиска не говорит ничего о самом сайте
+        if result["error"] == "Deadline":
+            return
+        
+        health = self.get(site.name)
+        health.requests += 1
+        if result["status"] is not None:
+            key = str(result["status"])
+            health.statuses[key] = health.statuses.get(key, 0) + 1
+        
+        now = time.time()
+        if not result["error"]:
+            entry = health.hits.setdefault(username_shape(result["username"]), [0, 0])
+            entry[0] += 1
+            entry[1] += bool(result["found"])
+            health.last_success = now
+            health.consecutive_failures = 0
+            health.quarantined_until = 0.0
+            health.quarantine_period = 0.0
+            return
+        
+        health.errors += 1
+        health.last_error = now
+        if result["error"] == "Timeout":
+            health.timeouts += 1
+        health.consecutive_failures += 1
+        if health.consecutive_failures >= self.quarantine_after and health.quarantined_until <= now:
+            # Каждая неудачная проба удваивает срок карантина
+            health.quarantine_period = min(
+                self.quarantine_max,
+                health.quarantine_period * 2 if health.quarantine_period else self.quarantine_initial
+            )
+            health.quarantined_until = now + health.quarantine_period
+    
+    def end_probe(self, site: SiteRecord):
+        """Снимает отметку пробной проверки сайта"""
+        health = self.sites.get(site.name)
+        if health is not None:
+            health.probe_started = 0.0
+    
+    def forget(self, names: List[str]):
+        """Сбрасывает телеметрию сайтов, чьи правила изменились или которых больше нет"""
+        for name in names:
+            self.sites.pop(name, None)
+    
+    def rank(self, sites: List[SiteRecord], username: Optional[str], default_latency: float = 1.0) -> List[SiteRecord]:
+        """Сайты по убыванию ожидаемых находок в секунду для username: доля находок, успешных ответов и задержка"""
+        # Без username - доля находок сайта по всем классам
+        shape = username_shape(username) if username is not None else None
+        
+        def value(site: SiteRecord) -> float:
+            health = self.sites.get(site.name) or SiteHealth()
+            return health.hit_rate(shape) * (1 - health.error_rate) / max(health.expected_latency(default_latency), 0.01)
+        
+        return sorted(sites, key=value, reverse=True)
+    
+    def schedule(self, sites: List[SiteRecord], default_latency: float = 1.0,
+                 username: Optional[str] = None) -> Tuple[List[SiteRecord], List[SiteRecord]]:
+        """Упорядочивает сайты и отделяет находящиеся в карантине: медленные первыми или, с username, самые выгодные"""
+        now = time.time()
+        active = []
+        quarantined = []
+        for site in sites:
+            health = self.sites.get(site.name)
+            if health is not None and health.quarantined_until:
+                if health.quarantined_until > now or now - health.probe_started < PROBE_TIMEOUT:
+                    quarantined.append(site)
+                    continue
+                # Карантин истек: пропускаем одну пробную проверку
+                health.probe_started = now
+            active.append(site)
+        
+        if username is not None:
+            return self.rank(active, username, default_latency), quarantined
+        active.sort(key=lambda site: self.get(site.name).expected_latency(default_latency), reverse=True)
+        return active, quarantined
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        """Текущее состояние всех записей"""
+        return {name: health.to_dict() for name, health in self.sites.items()}
+    
+    def merge(self, snapshot: Dict[str, Dict], baseline: Dict[str, Dict]):
+        """Добавляет приращения, накопленные другим процессом относительно общего исходного состояния"""
+        for name, data in snapshot.items():
+            before = SiteHealth(baseline.get(name))
+            after = SiteHealth(data)
+            health = self.get(name)
+            for i, count in enumerate(after.latency.counts):
+                health.latency.counts[i] += count - before.latency.counts[i]
+            health.latency.count = sum(health.latency.counts)
+            health.requests += after.requests - before.requests
+            health.errors += after.errors - before.errors
+            health.timeouts += after.timeouts - before.timeouts
+            for status, count in after.statuses.items():
+                health.statuses[status] = health.statuses.get(status, 0) + count - before.statuses.get(status, 0)
+            for shape, (checks, found) in after.hits.items():
+                entry = health.hits.setdefault(shape, [0, 0])
+                before_checks, before_found = before.hits.get(shape, (0, 0))
+                entry[0] += checks - before_checks
+                entry[1] += found - before_found
+            # Состояние карантина берется у процесса, видевшего сайт последним
+            if max(after.last_success or 0, after.last_error or 0) >= max(health.last_success or 0, health.last_error or 0):
+                health.consecutive_failures = after.consecutive_failures
+                health.quarantined_until = after.quarantined_until
+                health.quarantine_period = after.quarantine_period
+            health.last_success = max(health.last_success or 0, after.last_success or 0) or None
+            health.last_error = max(health.last_error or 0, after.last_error or 0) or None
+    
+    def report(self) -> List[Dict]:
+        """Сводка по сайтам, от самых проблемных"""
+        rows = []
+        for name, health in self.sites.items():
+            rows.append({
+                "name": name,
+                "requests": health.requests,
+                "error_rate": round(health.error_rate, 3),
+                "timeouts": health.timeouts,
+                "p50": round(health.latency.percentile(50), 3),
+                "p95": round(health.latency.percentile(95), 3),
+                "last_success": health.last_success,
+                "statuses": health.statuses,
+                "quarantined_until": health.quarantined_until or None
+            })
+        rows.sort(key=lambda row: (row["error_rate"], row["p95"]), reverse=True)
+        return rows
+    
+    def save(self):
+        """Атомарно сохраняет телеметрию"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({name: health.to_dict() for name, health in self.sites.items()}, f)
+        os.replace(tmp_path, self.path)
+
+class PhaseHistogram(LatencyHistogram):
+    """Гистограмма длительностей фаз запроса: корзины от половины миллисекунды, с суммой"""
+    
+    BOUNDS = tuple(0.0005 * 2 ** i for i in range(16))
+    
+    def __init__(self, counts: Optional[List[int]] = None, total: float = 0.0):
+        super().__init__(counts)
+        self.total = total
+    
+    def add(self, seconds: float):
+        super().add(seconds)
+        self.total += seconds
+    
+    def merge(self, counts: List[int], total: float):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.count = sum(self.counts)
+        self.total += total
+
+# Фазы запроса: ожидание соединения из пула, DNS, TCP+TLS, до первого байта ответа, загрузка тела, поиск строк
+TRACE_PHASES = ("queue", "dns", "connect", "ttfb", "body", "match")
+
+class RequestTrace:
+    """Отметки времени одного HTTP-запроса, заполняемые хуками aiohttp"""
+    
+    __slots__ = ("site", "host", "url", "started", "phases", "reused", "dns_cache_hit", "status", "error", "total", "marks")
+    
+    def __init__(self, site: SiteRecord, url: str):
+        self.site = site.name
+        self.host = site.host
+        self.url = url
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(TRACE_PHASES, 0.0)
+        self.reused = None
+        self.dns_cache_hit = None
+        self.status = None
+        self.error = None
+        self.total = None
+        self.marks = {}
+    
+    def mark(self, name: str):
+        self.marks[name] = time.perf_counter()
+    
+    def close(self, phase: str) -> float:
+        """Закрывает фазу, начатую mark(phase), и возвращает ее длительность"""
+        started = self.marks.pop(phase, None)
+        if started is None:
+            return 0.0
+        duration = time.perf_counter() - started
+        self.phases[phase] += duration
+        return duration
+    
+    def to_dict(self, origin: float) -> Dict:
+        return {
+            "site": self.site,
+            "url": self.url,
+            "start": round(self.started - origin, 6),
+            "total": round(self.total, 6),
+            "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            "reused": self.reused,
+            "dns_cache_hit": self.dns_cache_hit,
+            "status": self.status,
+            "error": self.error
+        }
+
+class RequestTracer:
+    """Трассировка фаз HTTP-запросов через хуки aiohttp и агрегаты за запуск"""
+    
+    def __init__(self, keep_requests: bool = True):
+        self.keep_requests = keep_requests
+        self.origin = time.perf_counter()
+        self.requests = []
+        self.phases = {phase: PhaseHistogram() for phase in TRACE_PHASES}
+        self.sites = {}
+        # Счетчики по сайтам: [запросов, ошибок, переиспользованных соединений, новых соединений]
+        self.counters = {}
+        self.dns_cache_hits = 0
+    
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """TraceConfig для ClientSession; запросы без RequestTrace в trace_request_ctx не учитываются"""
+        config = aiohttp.TraceConfig()
+        
+        def hook(signal, callback: Callable[[RequestTrace, object], None]):
+            async def handler(session, context, params):
+                trace = context.trace_request_ctx
+                if isinstance(trace, RequestTrace):
+                    callback(trace, params)
+            signal.append(handler)
+        
+        def connection_created(trace: RequestTrace, params):
+            # Соединение создается вместе с DNS: его время вычитается из connect
+            dns_before = trace.marks.pop("dns_before", 0.0)
+            trace.phases["connect"] -= trace.phases["dns"] - dns_before
+            trace.close("connect")
+            trace.reused = False
+        
+        def connection_started(trace: RequestTrace, params):
+            trace.marks["dns_before"] = trace.phases["dns"]
+            trace.mark("connect")
+        
+        def dns_cache(hit: bool):
+            def callback(trace: RequestTrace, params):
+                trace.dns_cache_hit = hit
+            return callback
+        
+        def response_started(trace: RequestTrace, params):
+            trace.close("ttfb")
+            trace.mark("body")
+        
+        def reused(trace: RequestTrace, params):
+            trace.reused = True
+        
+        hook(config.on_connection_queued_start, lambda trace, params: trace.mark("queue"))
+        hook(config.on_connection_queued_end, lambda trace, params: trace.close("queue"))
+        hook(config.on_dns_resolvehost_start, lambda trace, params: trace.mark("dns"))
+        hook(config.on_dns_resolvehost_end, lambda trace, params: trace.close("dns"))
+        hook(config.on_dns_cache_hit, dns_cache(True))
+        hook(config.on_dns_cache_miss, dns_cache(False))
+        hook(config.on_connection_create_start, connection_started)
+        hook(config.on_connection_create_end, connection_created)
+        hook(config.on_connection_reuseconn, reused)
+        hook(config.on_request_headers_sent, lambda trace, params: trace.mark("ttfb"))
+        hook(config.on_request_redirect, lambda trace, params: trace.close("ttfb"))
+        hook(config.on_request_end, response_started)
+        return config
+    
+    def begin(self, site: SiteRecord, url: str) -> RequestTrace:
+        return RequestTrace(site, url)
+    
+    def finish(self, trace: RequestTrace):
+        """Закрывает трассу запроса и добавляет ее в агрегаты"""
+        # Загрузка тела без времени поиска строк, которое учтено отдельно
+        trace.close("body")
+        trace.phases["body"] = max(trace.phases["body"] - trace.phases["match"], 0.0)
+        trace.total = time.perf_counter() - trace.started
+        
+        for phase, seconds in trace.phases.items():
+            self.phases[phase].add(seconds)
+        histogram = self.sites.get(trace.site)
+        if histogram is None:
+            histogram = self.sites[trace.site] = PhaseHistogram()
+        histogram.add(trace.total)
+        
+        counters = self.counters.setdefault(trace.site, [0, 0, 0, 0])
+        counters[0] += 1
+        if trace.error:
+            counters[1] += 1
+        if trace.reused is True:
+            counters[2] += 1
+        elif trace.reused is False:
+            counters[3] += 1
+        if trace.dns_cache_hit:
+            self.dns_cache_hits += 1
+        if self.keep_requests:
+            self.requests.append(trace.to_dict(self.origin))
+    
+    def snapshot(self) -> Dict:
+        """Агрегаты и записи для передачи из рабочего процесса"""
+        return {
+            "requests": self.requests,
+            "phases": {phase: (histogram.counts, histogram.total) for phase, histogram in self.phases.items()},
+            "sites": {site: (histogram.counts, histogram.total) for site, histogram in self.sites.items()},
+            "counters": self.counters,
+            "dns_cache_hits": self.dns_cache_hits
+        }
+    
+    def merge(self, snapshot: Dict):
+        """Добавляет снимок другого процесса"""
+        self.requests.extend(snapshot["requests"])
+        for phase, (counts, total) in snapshot["phases"].items():
+            self.phases[phase].merge(counts, total)
+        for site, (counts, total) in snapshot["sites"].items():
+            self.sites.setdefault(site, PhaseHistogram()).merge(counts, total)
+        for site, values in snapshot["counters"].items():
+            counters = self.counters.setdefault(site, [0, 0, 0, 0])
+            for i, value in enumerate(values):
+                counters[i] += value
+        self.dns_cache_hits += snapshot["dns_cache_hits"]
+    
+    @staticmethod
+    def reuse_ratio(reused: int, created: int) -> Optional[float]:
+        return reused / (reused + created) if reused + created else None
+    
+    def summary(self) -> Dict:
+        """Агрегаты за запуск"""
+        totals = [sum(values) for values in zip(*self.counters.values())] or [0, 0, 0, 0]
+        return {
+            "requests": totals[0],
+            "errors": totals[1],
+            "connections": {"reused": totals[2], "created": totals[3], "reuse_ratio": self.reuse_ratio(totals[2], totals[3])},
+            "dns_cache_hits": self.dns_cache_hits,
+            "phases": {
+                phase: {
+                    "total": round(histogram.total, 6),
+                    "mean": round(histogram.total / histogram.count, 6) if histogram.count else 0.0,
+                    "p50": histogram.percentile(50),
+                    "p95": histogram.percentile(95),
+                    "p99": histogram.percentile(99)
+                }
+                for phase, histogram in self.phases.items()
+            },
+            "sites": {
+                site: {
+                    "requests": counters[0],
+                    "errors": counters[1],
+                    "p50": self.sites[site].percentile(50),
+                    "p95": self.sites[site].percentile(95),
+                    "reuse_ratio": self.reuse_ratio(counters[2], counters[3])
+                }
+                for site, counters in sorted(self.counters.items())
+            }
+        }
+    
+    def write_json(self, path: str):
+        """JSON-файл трассы: агрегаты и записи по каждому запросу"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"summary": self.summary(), "requests": self.requests}, f, ensure_ascii=False)
+    
+    def openmetrics(self) -> str:
+        """Текстовая экспозиция в формате OpenMetrics"""
+        lines = []
+        
+        def label(value: str) -> str:
+            return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        
+        def histogram(name: str, key: str, histograms: Dict[str, PhaseHistogram]):
+            lines.append(f"# TYPE {name} histogram")
+            lines.append(f"# UNIT {name} seconds")
+            for value, data in histograms.items():
+                labels = f'{key}="{label(value)}"'
+                cumulative = 0
+                for bound, count in zip(data.BOUNDS, data.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {data.count}')
+                lines.append(f"{name}_count{{{labels}}} {data.count}")
+                lines.append(f"{name}_sum{{{labels}}} {data.total:.6f}")
+        
+        histogram("whatsmyfinder_request_phase_seconds", "phase", self.phases)
+        histogram("whatsmyfinder_site_request_seconds", "site", self.sites)
+        
+        lines.append("# TYPE whatsmyfinder_requests counter")
+        for site, counters in sorted(self.counters.items()):
+            lines.append(f'whatsmyfinder_requests_total{{site="{label(site)}",outcome="ok"}} {counters[0] - counters[1]}')
+            lines.append(f'whatsmyfinder_requests_total{{site="{label(site)}",outcome="error"}} {counters[1]}')
+        
+        summary = self.summary()
+        lines.append("# TYPE whatsmyfinder_connections counter")
+        lines.append(f'whatsmyfinder_connections_total{{kind="reused"}} {summary["connections"]["reused"]}')
+        lines.append(f'whatsmyfinder_connections_total{{kind="created"}} {summary["connections"]["created"]}')
+        lines.append("# TYPE whatsmyfinder_dns_cache_hits counter")
+        lines.append(f"whatsmyfinder_dns_cache_hits_total {self.dns_cache_hits}")
+        lines.append("# TYPE whatsmyfinder_connection_reuse_ratio gauge")
+        if summary["connections"]["reuse_ratio"] is not None:
+            lines.append(f'whatsmyfinder_connection_reuse_ratio {summary["connections"]["reuse_ratio"]:.6f}')
+        for site, counters in sorted(self.counters.items()):
+            ratio = self.reuse_ratio(counters[2], counters[3])
+            if ratio is not None:
+                lines.append(f'whatsmyfinder_connection_reuse_ratio{{site="{label(site)}"}} {ratio:.6f}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+    
+    def write_openmetrics(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.openmetrics())
+
+class LoopProfiler:
+    """Профилирование цикла событий: задержка цикла, блокирующие колбэки со стеком и профиль CPU"""
+    
+    def __init__(self, interval: float = 0.01, threshold: float = 0.1, cpu: bool = True, top: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.top = top
+        self.lag = PhaseHistogram()
+        self.lag_max = 0.0
+        # Стек -> [число блокировок, суммарная длительность, максимальная]
+        self.stalls = {}
+        self.cpu = cProfile.Profile() if cpu else None
+        self.elapsed = 0.0
+        self._depth = 0
+        self._started = 0.0
+        self._sampler = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._heartbeat = 0.0
+        self._loop_thread = None
+        self._pending_stack = None
+    
+    def start(self):
+        """Начинает профилирование текущего цикла событий; вложенные вызовы учитываются один раз"""
+        self._depth += 1
+        if self._depth > 1:
+            return
+        self._started = time.monotonic()
+        self._heartbeat = self._started
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._sampler = asyncio.ensure_future(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, daemon=True)
+        self._watchdog.start()
+        if self.cpu is not None:
+            self.cpu.enable()
+    
+    async def stop(self):
+        """Останавливает профилирование, накопленные данные сохраняются для следующего start()"""
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        if self.cpu is not None:
+            self.cpu.disable()
+        self._sampler.cancel()
+        await asyncio.gather(self._sampler, return_exceptions=True)
+        self._stopped.set()
+        self._watchdog.join()
+        self.elapsed += time.monotonic() - self._started
+    
+    async def _sample(self):
+        # Задержка цикла: насколько позже заказанного просыпается sleep(interval)
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self._heartbeat = time.monotonic()
+            self.lag.add(lag)
+            self.lag_max = max(self.lag_max, lag)
+            if lag >= self.threshold:
+                with self._lock:
+                    stack, self._pending_stack = self._pending_stack, None
+                stall = self.stalls.setdefault(stack or ("(стек не снят)",), [0, 0.0, 0.0])
+                stall[0] += 1
+                stall[1] += lag
+                stall[2] = max(stall[2], lag)
+    
+    def _watch(self):
+        # Сторожевой поток: цикл не отметился дольше порога - снимаем стек того, что его держит
+        captured = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self._heartbeat
+            if heartbeat == captured or time.monotonic() - heartbeat - self.interval < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = self.format_stack(frame)
+            del frame
+            captured = heartbeat
+            with self._lock:
+                self._pending_stack = stack
+    
+    @staticmethod
+    def format_stack(frame) -> Tuple[str, ...]:
+        """Стек от колбэка цикла событий до текущей строки, без кадров самого цикла"""
+        frames = traceback.extract_stack(frame)
+        for index in range(len(frames) - 1, -1, -1):
+            if frames[index].filename.endswith(os.path.join("asyncio", "events.py")):
+                frames = frames[index + 1:]
+                break
+        return tuple(
+            f"{os.path.join(*entry.filename.split(os.sep)[-2:])}:{entry.lineno} {entry.name}: {entry.line or ''}".rstrip()
+            for entry in frames
+        )
+    
+    def cpu_summary(self) -> List[Dict]:
+        """Функции с наибольшим собственным временем CPU"""
+        if self.cpu is None:
+            return []
+        entries = []
+        for (filename, line, name), (primitive, calls, own, cumulative, _) in pstats.Stats(self.cpu).stats.items():
+            entries.append({
+                "function": f"{os.path.join(*filename.split(os.sep)[-2:])}:{line}({name})",
+                "calls": calls,
+                "primitive_calls": primitive,
+                "own": round(own, 6),
+                "cumulative": round(cumulative, 6)
+            })
+        entries.sort(key=lambda entry: entry["own"], reverse=True)
+        return entries[:self.top]
+    
+    def summary(self) -> Dict:
+        """Сводка профиля за все запуски"""
+        return {
+            "elapsed": round(self.elapsed, 3),
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "loop_lag": {
+                "samples": self.lag.count,
+                "mean": round(self.lag.total / self.lag.count, 6) if self.lag.count else 0.0,
+                # Процентили - верхние границы корзин, не больше измеренного максимума
+                "p50": min(self.lag.percentile(50), round(self.lag_max, 6)),
+                "p90": min(self.lag.percentile(90), round(self.lag_max, 6)),
+                "p99": min(self.lag.percentile(99), round(self.lag_max, 6)),
+                "max": round(self.lag_max, 6),
+                "histogram": {f"{bound:g}": count for bound, count in zip(self.lag.BOUNDS + (float("inf"),), self.lag.counts)}
+            },
+            "stalls": [
+                {"count": count, "total": round(total, 6), "max": round(longest, 6), "stack": list(stack)}
+                for stack, (count, total, longest) in sorted(self.stalls.items(), key=lambda item: item[1][1], reverse=True)
+            ],
+            "cpu": self.cpu_summary()
+        }
+    
+    def write_json(self, path: str):
+        """JSON-файл профиля; рядом - .prof с полным профилем CPU для pstats и snakeviz"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        if self.cpu is not None:
+            self.cpu.dump_stats(os.path.splitext(path)[0] + ".prof")
+
+class DnsCache:
+    """Разрешенные адреса хостов между запусками: свежие до TTL, устаревшие - запас на случай сбоя DNS"""
+    
+    def __init__(self, path: Optional[str] = None, ttl: float = 3600, stale_ttl: float = 86400):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # хост -> [время истечения, [[семейство, адрес], ...]]
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                now = time.time()
+                self.entries = {key: entry for key, entry in entries.items() if entry[0] + stale_ttl > now}
+            except (OSError, ValueError, TypeError, IndexError):
+                self.entries = {}
+    
+    def get(self, host: str, family: int) -> Tuple[Optional[List], bool]:
+        """Адреса хоста нужного семейства и признак свежести; (None, False), если их нет"""
+        entry = self.entries.get(host)
+        if entry is None:
+            return None, False
+        addresses = [address for address in entry[1] if family == socket.AF_UNSPEC or address[0] == family]
+        if not addresses:
+            return None, False
+        return addresses, entry[0] > time.time()
+    
+    def put(self, host: str, addresses: List):
+        self.entries[host] = [time.time() + self.ttl, addresses]
+        self.dirty = True
+    
+    def save(self):
+        """Атомарно сохраняет кэш, если он менялся"""
+        if not self.path or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+class CachingResolver(AbstractResolver):
+    """Резолвер aiohttp поверх DnsCache: в сеть уходят только имена без свежей записи"""
+    
+    def __init__(self, cache: DnsCache, resolver: Optional[AbstractResolver] = None):
+        self.cache = cache
+        self.resolver = resolver or aiohttp.DefaultResolver()
+    
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict]:
+        addresses, fresh = self.cache.get(host, family)
+        if fresh:
+            self.cache.hits += 1
+            return self.results(host, port, addresses)
+        try:
+            results = await self.resolver.resolve(host, port, family)
+        except OSError:
+            # Сбой DNS: устаревший адрес лучше, чем отказ всех проверок сайта
+            if addresses:
+                self.cache.stale += 1
+                return self.results(host, port, addresses)
+            raise
+        self.cache.misses += 1
+        self.cache.put(host, [[result["family"], result["host"]] for result in results])
+        return results
+    
+    @staticmethod
+    def results(host: str, port: int, addresses: List) -> List[Dict]:
+        return [{
+            "hostname": host,
+            "host": address,
+            "port": port,
+            "family": family,
+            "proto": 0,
+            "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV
+        } for family, address in addresses]
+    
+    async def close(self):
+        await self.resolver.close()
+
+_TLS_CONTEXTS = {}
+
+def tls_context(verify: bool) -> ssl.SSLContext:
+    """SSL-контекст, общий для всех соединений процесса: хранилище сертификатов загружается один раз"""
+    context = _TLS_CONTEXTS.get(verify)
+    if context is None:
+        context = ssl.create_default_context()
+        if not verify:
+            # Как и прежний ssl=False: сайты с просроченными или самоподписанными сертификатами тоже проверяются
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        _TLS_CONTEXTS[verify] = context
+    return context
+
+class Egress:
+    """Точка выхода запросов: прямое соединение или HTTP/SOCKS-прокси со своим пулом, бюджетом и здоровьем"""
+    
+    def __init__(self, name: str, proxy: Optional[str], limit: int, rate: float):
+        self.name = name
+        self.proxy = proxy
+        self.limit = limit
+        # Бюджет выхода: не больше limit запросов одновременно и rate запросов в секунду
+        self.budget = HostThrottle(limit, rate)
+        self.connector = None
+        self.session = None
+        # Чужую сессию закрывает ее владелец
+        self.owned = True
+        self.request_proxy = None
+        self.score = 1.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.drained_until = 0.0
+        self.drains = 0
+        self.in_flight = 0
+    
+    def open(self, per_host: int, trace_configs: Optional[List[aiohttp.TraceConfig]] = None,
+             resolver: Optional[AbstractResolver] = None, **connector_options):
+        if self.proxy and self.proxy.startswith("socks"):
+            try:
+                from aiohttp_socks import ProxyConnector
+            except ImportError:
+                raise RuntimeError("для SOCKS-прокси установите пакет aiohttp-socks")
+            # Имена сайтов разрешает сам прокси
+            self.connector = ProxyConnector.from_url(self.proxy, limit=self.limit, limit_per_host=per_host, ttl_dns_cache=300,
+                                                     **connector_options)
+        else:
+            # Через HTTP-прокси все соединения идут к одному адресу: лимит на хост соблюдает HostThrottle
+            self.connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=0 if self.proxy else per_host, ttl_dns_cache=300,
+                                                  resolver=resolver, **connector_options)
+            self.request_proxy = self.proxy
+        self.session = aiohttp.ClientSession(connector=self.connector, trace_configs=trace_configs)
+    
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.drained_until
+    
+    def record(self, ok: bool, drain_after: int, drain_period: float):
+        """Учитывает исход запроса; после drain_after отказов подряд выход выводится из ротации"""
+        self.requests += 1
+        self.score = 0.9 * self.score + (0.1 if ok else 0.0)
+        if ok:
+            self.consecutive_failures = 0
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= drain_after and self.available:
+            self.drained_until = time.monotonic() + drain_period
+            self.drains += 1
+            # После паузы выход получает одну пробную попытку
+            self.consecutive_failures = drain_after - 1
+    
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "failures": self.failures,
+            "score": round(self.score, 3),
+            "in_flight": self.in_flight,
+            "drained": not self.available,
+            "drains": self.drains
+        }
+
+class EgressPool:
+    """Набор выходов; запросы к каждому хосту распределяются по выходам по кругу"""
+    
+    def __init__(self, egresses: List[Egress], drain_after: int = 5, drain_period: float = 60.0):
+        self.egresses = egresses
+        self.drain_after = drain_after
+        self.drain_period = drain_period
+        self._rotation = {}
+    
+    @classmethod
+    def from_config(cls, egress_config: Dict, maximum: int) -> "EgressPool":
+        proxies = egress_config.get("proxies", [])
+        egresses = []
+        if egress_config.get("direct", True) or not proxies:
+            egresses.append(Egress("direct", None, maximum, 0))
+        for proxy in proxies:
+            if isinstance(proxy, str):
+                proxy = {"url": proxy}
+            name = proxy.get("name") or urlparse(proxy["url"]).netloc.rpartition("@")[2]
+            egresses.append(Egress(name, proxy["url"], proxy.get("limit", maximum), proxy.get("rate", 0)))
+        return cls(egresses, egress_config.get("drain_after", 5), egress_config.get("drain_period", 60.0))
+    
+    def open(self, per_host: int, trace_configs: Optional[List[aiohttp.TraceConfig]] = None,
+             resolver: Optional[AbstractResolver] = None, **connector_options):
+        for egress in self.egresses:
+            egress.open(per_host, trace_configs, resolver, **connector_options)
+    
+    async def close(self):
+        for egress in self.egresses:
+            if egress.owned:
+                await egress.session.close()
+    
+    def pick(self, host: str) -> Egress:
+        """Следующий по кругу для хоста выход в ротации, по возможности со свободным бюджетом"""
+        start = self._rotation.get(host, 0)
+        self._rotation[host] = start + 1
+        count = len(self.egresses)
+        fallback = None
+        for offset in range(count):
+            egress = self.egresses[(start + offset) % count]
+            if not egress.available:
+                continue
+            if egress.in_flight < egress.limit:
+                return egress
+            fallback = fallback or egress
+        if fallback is not None:
+            return fallback
+        # Все выходы выведены: берем тот, что вернется раньше остальных
+        return min(self.egresses, key=lambda egress: egress.drained_until)
+    
+    def any_available(self) -> bool:
+        return any(egress.available for egress in self.egresses)
+    
+    def record(self, egress: Egress, ok: bool):
+        egress.record(ok, self.drain_after, self.drain_period)
+    
+    def report(self) -> List[Dict]:
+        return [egress.to_dict() for egress in self.egresses]
+
+# Итог HTTP-запроса: код, строки, которые искались в теле, найденные из них, ошибка и время
+RequestOutcome = collections.namedtuple("RequestOutcome", "status needles found error elapsed")
+
+class SharedRequest:
+    """Запрос в полете, ответ которого разделяют все сайты и варианты username с тем же ключом"""
+    
+    __slots__ = ("sites", "future")
+    
+    def __init__(self, site: SiteRecord):
+        self.sites = [site]
+        self.future = asyncio.get_event_loop().create_future()
+    
+    def join(self, site: SiteRecord):
+        if site not in self.sites:
+            self.sites.append(site)
+
+class CheckGroup:
+    """Проверки одного username в планировщике: как проверять, до какого срока и куда отдавать готовые"""
+    
+    __slots__ = ("run", "deadline", "finished")
+    
+    def __init__(self, run: Callable[[SiteRecord, str, Optional[float]], Awaitable[Dict]], deadline: Optional[float] = None):
+        self.run = run
+        self.deadline = deadline
+        # (сайт, username, задача); задача None - проверка снята из очереди, не начавшись
+        self.finished = asyncio.Queue()
+
+class CheckScheduler:
+    """Фиксированный пул воркеров, разбирающих проверки (username, сайт) из ограниченной очереди с приоритетами"""
+    
+    def __init__(self, workers: int, capacity: int):
+        self.workers = workers
+        self.capacity = capacity
+        # Куча (приоритет, ранг, порядковый номер, сайт, username, группа): кортеж вместо корутины на каждую проверку
+        self._heap = []
+        self._order = itertools.count()
+        self._running = {}
+        self._getters = collections.deque()
+        self._putters = collections.deque()
+        self._tasks = []
+    
+    def start(self):
+        """Запускает воркеры в текущем цикле событий"""
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+    
+    async def close(self):
+        """Останавливает воркеры и отменяет начатые проверки"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._running:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._running, return_exceptions=True)
+        self._tasks = []
+        self._running = {}
+        self._heap = []
+    
+    def queued(self) -> int:
+        return len(self._heap)
+    
+    def running(self) -> int:
+        return len(self._running)
+    
+    def has_room(self) -> bool:
+        return len(self._heap) < self.capacity
+    
+    async def wait_room(self):
+        """Ждет места в очереди"""
+        while not self.has_room():
+            waiter = asyncio.get_event_loop().create_future()
+            self._putters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Место, освобожденное для отмененного ожидающего, достается следующему
+                if self.has_room():
+                    self._wake(self._putters)
+                raise
+            finally:
+                with contextlib.suppress(ValueError):
+                    self._putters.remove(waiter)
+    
+    def submit(self, group: CheckGroup, priority: int, rank: int, site: SiteRecord, username: str):
+        """Ставит проверку в очередь; раньше разбираются меньший priority, при равном - меньший rank"""
+        heapq.heappush(self._heap, (priority, rank, next(self._order), site, username, group))
+        self._wake(self._getters)
+    
+    async def cancel(self, group: CheckGroup):
+        """Снимает проверки группы из очереди и отменяет начатые; все они попадают в group.finished"""
+        queued = [entry for entry in self._heap if entry[5] is group]
+        if queued:
+            self._heap = [entry for entry in self._heap if entry[5] is not group]
+            heapq.heapify(self._heap)
+            for _ in queued:
+                self._wake(self._putters)
+        running = [task for task, job in self._running.items() if job[2] is group]
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.wait(running)
+        for entry in queued:
+            group.finished.put_nowait((entry[3], entry[4], None))
+        for task in running:
+            # Воркер мог успеть отдать результат сам
+            job = self._running.pop(task, None)
+            if job is not None:
+                group.finished.put_nowait((job[0], job[1], task))
+    
+    @staticmethod
+    def _wake(waiters: collections.deque):
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+    
+    async def _work(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            while not self._heap:
+                waiter = loop.create_future()
+                self._getters.append(waiter)
+                await waiter
+            _, _, _, site, username, group = heapq.heappop(self._heap)
+            self._wake(self._putters)
+            # Задача живет, пока проверка выполняется: их не больше, чем воркеров
+            task = asyncio.ensure_future(group.run(site, username, group.deadline))
+            self._running[task] = (site, username, group)
+            try:
+                await asyncio.wait((task,))
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            if self._running.pop(task, None) is not None:
+                group.finished.put_nowait((site, username, task))
+
+class SearchSession:
+    """Долгоживущая HTTP-сессия: общий коннектор, DNS-кэш и keep-alive для серии проверок"""
+    
+    def __init__(self, search_config: Dict, cache: Optional[ResultCache] = None, health: Optional[HealthStore] = None,
+                 tracer: Optional[RequestTracer] = None, egress_config: Optional[Dict] = None,
+                 network_config: Optional[Dict] = None, dns_cache: Optional[DnsCache] = None,
+                 session: Optional[aiohttp.ClientSession] = None, profiler: Optional[LoopProfiler] = None):
+        self.search_config = search_config
+        self.profiler = profiler
+        self.external_session = session
+        self.egress_config = egress_config or {}
+        self.network_config = network_config or {}
+        self.dns_cache = dns_cache
+        self.resolver = None
+        self.cache = cache
+        self.health = health if health is not None else HealthStore()
+        self.tracer = tracer
+        self.connector = None
+        self.session = None
+        self.egresses = None
+        self.limiter = None
+        self.hosts = None
+        self.scheduler = None
+        self.retries = 0
+        self.hedged = 0
+        # Ключ запроса -> SharedRequest, пока запрос в полете
+        self.requests = {}
+        self.coalesced = 0
+    
+    def record_latency(self, site: SiteRecord, seconds: float):
+        """Учитывает задержку успешного ответа сайта"""
+        self.health.get(site.name).latency.add(seconds)
+    
+    def site_timeout(self, site: SiteRecord, deadline: Optional[float] = None) -> float:
+        """Таймаут сайта по процентилю его задержек, не дольше общего таймаута и дедлайна поиска"""
+        timeout = self.search_config["default_timeout"]
+        histogram = self.health.get(site.name).latency
+        if self.search_config.get("adaptive_timeouts", True) and histogram.count >= LATENCY_MIN_SAMPLES:
+            adaptive = histogram.percentile(95) * self.search_config.get("timeout_multiplier", 3.0)
+            timeout = min(timeout, max(adaptive, self.search_config.get("min_timeout", 3)))
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        return max(timeout, 0.001)
+    
+    def hedge_delay(self, site: SiteRecord) -> Optional[float]:
+        """Через сколько секунд дублировать запрос: обычный p95 задержки сайта"""
+        if not self.search_config.get("hedge_requests", True):
+            return None
+        histogram = self.health.get(site.name).latency
+        if histogram.count < LATENCY_MIN_SAMPLES:
+            return None
+        return histogram.percentile(95)
+    
+    @contextlib.asynccontextmanager
+    async def egress_slot(self, host: str):
+        """Выход для запроса к хосту вместе со слотами хоста на этом выходе, бюджета выхода и общего лимита"""
+        while True:
+            egress = self.egresses.pick(host)
+            # Сначала ждем очереди к хосту, чтобы не занимать глобальный слот впустую
+            async with self.hosts.slot((egress.name, host)), egress.budget.slot(egress.name), self.limiter:
+                # Пока запрос ждал слотов, выход могли вывести из ротации
+                if not egress.available and self.egresses.any_available():
+                    continue
+                egress.in_flight += 1
+                try:
+                    yield egress
+                finally:
+                    egress.in_flight -= 1
+                return
+    
+    async def try_hedge_slot(self, egress: Egress, host: str) -> bool:
+        """Слоты хоста, бюджета выхода и общего лимита для дубля запроса - только если все свободны без ожидания"""
+        key = (egress.name, host)
+        if not await self.hosts.try_acquire(key):
+            return False
+        if not await egress.budget.try_acquire(egress.name):
+            self.hosts.release(key)
+            return False
+        if not self.limiter.try_acquire():
+            egress.budget.release(egress.name)
+            self.hosts.release(key)
+            return False
+        return True
+    
+    def release_hedge_slot(self, egress: Egress, host: str):
+        self.limiter.release()
+        egress.budget.release(egress.name)
+        self.hosts.release((egress.name, host))
+    
+    async def warm_up(self, sites: List[SiteRecord]) -> Dict[str, int]:
+        """Заранее разрешает имена и открывает соединения к хостам сайтов прямого выхода"""
+        egress = next((egress for egress in self.egresses.egresses if egress.proxy is None), None)
+        connect = self.network_config.get("warmup_connect", True)
+        now = time.time()
+        origins = {}
+        for site in sites:
+            health = self.health.sites.get(site.name)
+            if health is not None and health.quarantined_until > now:
+                continue
+            if site.host and site.url_parts:
+                parsed = urlparse(site.url_parts[0])
+                origins.setdefault(site.host, f"{parsed.scheme}://{parsed.netloc}/")
+        if egress is None or not origins:
+            return {"hosts": 0, "connected": 0}
+        
+        semaphore = asyncio.Semaphore(self.network_config.get("warmup_concurrency", 32))
+        timeout = aiohttp.ClientTimeout(total=self.search_config.get("min_timeout", 3))
+        connected = 0
+        
+        async def warm(host: str, origin: str):
+            nonlocal connected
+            async with semaphore:
+                try:
+                    if not connect:
+                        await self.resolver.resolve(host, 0, socket.AF_UNSPEC)
+                        return
+                    # Легкий HEAD оставляет в пуле готовое TCP+TLS соединение; учитывается в лимитах хоста
+                    async with self.hosts.slot((egress.name, host)):
+                        async with egress.session.head(origin, allow_redirects=False, timeout=timeout):
+                            connected += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError):
+                    pass
+        
+        if connect or self.resolver is not None:
+            await asyncio.gather(*(warm(host, origin) for host, origin in origins.items()))
+        return {"hosts": len(origins), "connected": connected}
+    
+    def backoff(self, attempt: int) -> float:
+        """Пауза перед повтором: экспоненциальная с полным джиттером"""
+        base = self.search_config.get("retry_backoff", 0.5)
+        return random.uniform(0, min(base * 2 ** attempt, 10.0))
+    
+    async def __aenter__(self) -> "SearchSession":
+        if self.profiler:
+            self.profiler.start()
+        initial = self.search_config["default_concurrent_requests"]
+        adaptive = self.search_config.get("adaptive_concurrency", True)
+        maximum = self.search_config.get("max_concurrent_requests", initial) if adaptive else initial
+        per_host = self.search_config.get("per_host_limit", 4)
+        
+        self.limiter = AdaptiveLimiter(initial, maximum, adaptive=adaptive)
+        # Лимиты хоста считаются для каждого выхода отдельно: ключ (выход, хост)
+        self.hosts = HostThrottle(per_host, self.search_config.get("per_host_rate", 0))
+        # Воркеров с запасом к лимиту запросов: часть из них ждет слотов хоста
+        workers = self.search_config.get("workers", 0) or 2 * maximum
+        self.scheduler = CheckScheduler(workers, max(self.search_config.get("queue_size", 4096), 1))
+        self.scheduler.start()
+        if self.external_session is not None:
+            # Сессия вызывающей стороны: ее коннектор, TLS и прокси, единственный выход
+            egress = Egress("direct", None, maximum, 0)
+            egress.session = self.external_session
+            egress.connector = self.external_session.connector
+            egress.owned = False
+            self.egresses = EgressPool([egress], self.egress_config.get("drain_after", 5), self.egress_config.get("drain_period", 60.0))
+        else:
+            self.egresses = EgressPool.from_config(self.egress_config, maximum)
+            if self.dns_cache is not None:
+                self.resolver = CachingResolver(self.dns_cache)
+            self.egresses.open(
+                per_host, [self.tracer.trace_config()] if self.tracer else None, self.resolver,
+                ssl=tls_context(self.network_config.get("verify_ssl", False)),
+                # Соединения, открытые прогревом, должны дожить до начала поиска
+                keepalive_timeout=self.network_config.get("keepalive_timeout", 30)
+            )
+        self.connector = self.egresses.egresses[0].connector
+        self.session = self.egresses.egresses[0].session
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.scheduler.close()
+        await self.egresses.close()
+        if self.resolver:
+            await self.resolver.close()
+            self.dns_cache.save()
+        if self.cache:
+            self.cache.flush()
+        self.health.save()
+        if self.profiler:
+            await self.profiler.stop()
+
+async def read_line(prompt: str) -> str:
+    """input() в отдельном потоке, не блокирующий цикл событий"""
+    loop = asyncio.get_event_loop()
+    future = loop.create_future()
+    
+    def read():
+        try:
+            outcome = (future.set_result, input(prompt))
+        except BaseException as e:
+            outcome = (future.set_exception, e)
+        
+        def deliver():
+            if not future.done():
+                outcome[0](outcome[1])
+        # Цикл мог завершиться, пока поток ждал ввода
+        with contextlib.suppress(RuntimeError):
+            loop.call_soon_threadsafe(deliver)
+    
+    # Поток-демон не держит процесс, если ввод так и не завершится
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+def parse_retry_after(value: Optional[str], default: float = 1.0, maximum: float = 30.0) -> float:
+    """Разбирает Retry-After в секундах"""
+    try:
+        return min(max(float(value), 0.0), maximum)
+    except (TypeError, ValueError):
+        return default
+
+class ResultSink:
+    """Потоковая запись результатов в NDJSON или CSV: строки копятся в буфере и пишутся в отдельном потоке"""
+    
+    # Колонка CSV -> ключ результата; None - время записи
+    CSV_COLUMNS = {
+        "username": "username",
+        "category": "category",
+        "site_name": "name",
+        "url": "url",
+        "found": "found",
+        "status": "status",
+        "error": "error",
+        "elapsed": "elapsed",
+        "cached": "cached",
+        "timestamp": None
+    }
+    
+    def __init__(self, stream: TextIO, output_format: str = "ndjson", columns: Optional[List[str]] = None,
+                 found_only: bool = False, header: bool = True, buffer_lines: int = 256, close_stream: bool = False,
+                 journal: Optional["CheckJournal"] = None):
+        if output_format not in ("ndjson", "csv"):
+            raise ValueError(f"неизвестный формат вывода: {output_format}")
+        self.stream = stream
+        self.output_format = output_format
+        self.columns = columns or list(self.CSV_COLUMNS)
+        self.found_only = found_only
+        self.buffer_lines = buffer_lines
+        self.close_stream = close_stream
+        self.journal = journal
+        self.written = 0
+        self._lines = []
+        self._journal_lines = []
+        self._pending = None
+        # Один поток сохраняет порядок записей
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._row = io.StringIO()
+        self._csv = csv.writer(self._row)
+        self._stamp_second = None
+        self._stamp = ""
+        
+        if output_format == "csv" and header:
+            self._lines.append(self.csv_line(self.columns))
+    
+    @classmethod
+    def open(cls, path: str, output_format: str = "ndjson", **kwargs) -> "ResultSink":
+        return cls(open(path, 'w', newline='', encoding='utf-8'), output_format, close_stream=True, **kwargs)
+    
+    def csv_line(self, values: List) -> str:
+        self._csv.writerow(values)
+        line = self._row.getvalue()
+        self._row.seek(0)
+        self._row.truncate()
+        return line
+    
+    def timestamp(self) -> str:
+        """Время записи, форматируется не чаще раза в секунду"""
+        second = int(time.time())
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp = datetime.fromtimestamp(second).strftime('%Y-%m-%d %H:%M:%S')
+        return self._stamp
+    
+    def write(self, result: Dict, username: Optional[str] = None):
+        """Добавляет результат; username - исходный username, если проверялся его вариант"""
+        if self.journal is not None:
+            self._journal_lines.append(self.journal.line(result, username or result["username"]))
+        if not self.found_only or (result["found"] and not result["error"]):
+            if self.output_format == "ndjson":
+                line = json.dumps(result, ensure_ascii=False) + "\n"
+            else:
+                line = self.csv_line([self.timestamp() if key is None else result.get(key) for key in map(self.CSV_COLUMNS.get, self.columns)])
+            self._lines.append(line)
+            self.written += 1
+        if len(self._lines) + len(self._journal_lines) >= self.buffer_lines:
+            self.submit()
+    
+    def submit(self):
+        """Передает накопленные строки потоку записи, не дожидаясь его"""
+        if self._pending is not None and self._pending.done():
+            # Ошибка записи всплывает при следующей передаче
+            self._pending.result()
+        if self._lines or self._journal_lines:
+            text = "".join(self._lines)
+            journal_text = "".join(self._journal_lines)
+            self._lines = []
+            self._journal_lines = []
+            self._pending = self._executor.submit(self._write, text, journal_text)
+    
+    def _write(self, text: str, journal_text: str):
+        if text:
+            self.stream.write(text)
+            self.stream.flush()
+        # Журнал дописывается только после вывода: отмеченная проверка уже не потеряется
+        if journal_text:
+            self.journal.stream.write(journal_text)
+            self.journal.stream.flush()
+    
+    async def drain(self):
+        """Дожидается записи всех строк, не блокируя цикл событий"""
+        self.submit()
+        if self._pending is not None:
+            await asyncio.wrap_future(self._pending)
+    
+    def close(self):
+        self.submit()
+        self._executor.shutdown(wait=True)
+        if self._pending is not None:
+            self._pending.result()
+        if self.close_stream:
+            self.stream.close()
+
+class CheckJournal:
+    """Журнал завершенных проверок (username, вариант, сайт) для возобновления пакета; файл только дописывается"""
+    
+    def __init__(self, stream: TextIO, completed: Optional[Dict[str, Set[Tuple[str, str]]]] = None, path: Optional[str] = None):
+        self.stream = stream
+        # username из списка -> завершенные пары (проверенный вариант, сайт)
+        self.completed = completed or {}
+        self.path = path
+    
+    @staticmethod
+    def line(result: Dict, username: str) -> str:
+        # Невозможная пара завершена так же, как успешная проверка: при продолжении ее незачем повторять
+        done = not result["error"] or result["error"] == "Impossible"
+        return json.dumps([username, result["username"], result["name"], 1 if done else 0], ensure_ascii=False) + "\n"
+    
+    def done(self, username: str) -> Set[Tuple[str, str]]:
+        """Пары (вариант, сайт), которые для username уже проверены без ошибки"""
+        return self.completed.get(username, set())
+    
+    @property
+    def completed_checks(self) -> int:
+        return sum(len(done) for done in self.completed.values())
+    
+    @classmethod
+    def create(cls, path: str, settings: Dict) -> "CheckJournal":
+        """Новый журнал; первая строка хранит параметры запуска"""
+        stream = open(path, 'w', encoding='utf-8')
+        stream.write(json.dumps(settings, ensure_ascii=False) + "\n")
+        stream.flush()
+        return cls(stream, path=path)
+    
+    @staticmethod
+    def read(path: str) -> Tuple[Dict, Dict[str, Set[Tuple[str, str]]], int]:
+        """Параметры запуска, успешные проверки и длина целой части файла"""
+        completed = {}
+        with open(path, 'rb') as f:
+            header = f.readline()
+            settings = json.loads(header)
+            valid = len(header)
+            for raw in f:
+                try:
+                    if not raw.endswith(b"\n"):
+                        raise ValueError("оборванная строка")
+                    username, variant, site, ok = json.loads(raw)
+                except ValueError:
+                    # Процесс оборвался посреди записи: хвост отбрасывается
+                    break
+                valid += len(raw)
+                done = completed.setdefault(username, set())
+                if ok:
+                    done.add((variant, site))
+                else:
+                    done.discard((variant, site))
+        return settings, completed, valid
+    
+    @classmethod
+    def resume(cls, path: str) -> Tuple["CheckJournal", Dict]:
+        """Открывает журнал для дозаписи после прерванного запуска"""
+        settings, completed, valid = cls.read(path)
+        with open(path, 'r+b') as f:
+            f.truncate(valid)
+        return cls(open(path, 'a', encoding='utf-8'), completed, path), settings
+    
+    @classmethod
+    def compact(cls, path: str) -> int:
+        """Переписывает журнал, оставляя по строке на каждую успешную проверку"""
+        settings, completed, _ = cls.read(path)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(settings, ensure_ascii=False) + "\n")
+            for username, done in completed.items():
+                for variant, site in done:
+                    f.write(json.dumps([username, variant, site, 1], ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        return sum(len(done) for done in completed.values())
+    
+    def close(self):
+        self.stream.close()
+
+class ResultTable:
+    """Результаты проверок по колонкам: номера сайтов и username, коды ответа, флаги и ошибки в компактных массивах"""
+    
+    # Биты колонки flags
+    FOUND = 1
+    ERROR = 2
+    CACHED = 4
+    
+    def __init__(self, database: Optional[SiteDatabase] = None):
+        self.database = database
+        # Строки хранятся один раз, в колонках - их номера; ошибки - перечисление встреченных текстов
+        self.sites = []
+        self.site_ids = {}
+        self.usernames = []
+        self.username_ids = {}
+        self.errors = [None]
+        self.error_ids = {None: 0}
+        self.site = array.array("H")
+        self.username = array.array("I")
+        self.status = array.array("H")
+        self.flags = array.array("B")
+        self.error = array.array("H")
+        # float32 хватает для миллисекунд; -1 - время не измерялось
+        self.elapsed = array.array("f")
+    
+    def __len__(self) -> int:
+        return len(self.site)
+    
+    def intern_site(self, name: str, category: str) -> int:
+        site_id = self.site_ids.get(name)
+        if site_id is None:
+            record = self.database.by_name.get(name) if self.database else None
+            if record is None:
+                # Сайта нет в базе (например, удален перезагрузкой): URL восстанавливать не из чего
+                record = SiteRecord(-1, {"name": name, "cat": category})
+            site_id = self.site_ids[name] = len(self.sites)
+            self.sites.append(record)
+        return site_id
+    
+    def intern_username(self, username: str) -> int:
+        username_id = self.username_ids.get(username)
+        if username_id is None:
+            username_id = self.username_ids[username] = len(self.usernames)
+            self.usernames.append(username)
+        return username_id
+    
+    def intern_error(self, error: Optional[str]) -> int:
+        error_id = self.error_ids.get(error)
+        if error_id is None:
+            if len(self.errors) >= 65535:
+                # Перечисление переполнено: редкие тексты ошибок сливаются в один
+                return self.intern_error("Error")
+            error_id = self.error_ids[error] = len(self.errors)
+            self.errors.append(error)
+        return error_id
+    
+    def add(self, result: Dict):
+        """Добавляет результат check_site; URL не хранится, а восстанавливается по шаблону сайта"""
+        self.site.append(self.intern_site(result["name"], result["category"]))
+        self.username.append(self.intern_username(result["username"]))
+        self.status.append(result["status"] or 0)
+        self.flags.append(
+            (self.FOUND if result["found"] and not result["error"] else 0)
+            | (self.ERROR if result["error"] else 0)
+            | (self.CACHED if result["cached"] else 0)
+        )
+        self.error.append(self.intern_error(result["error"]))
+        self.elapsed.append(-1.0 if result["elapsed"] is None else result["elapsed"])
+    
+    def row(self, index: int) -> Dict:
+        """Результат в прежнем виде словаря"""
+        site = self.sites[self.site[index]]
+        username = self.usernames[self.username[index]]
+        flags = self.flags[index]
+        elapsed = self.elapsed[index]
+        return {
+            "username": username,
+            "name": site.name,
+            "url": site.url(username) if site.url_parts else "",
+            "found": bool(flags & self.FOUND),
+            "error": self.errors[self.error[index]],
+            "category": site.cat,
+            "status": self.status[index] or None,
+            "elapsed": None if elapsed < 0 else round(elapsed, 3),
+            "cached": bool(flags & self.CACHED)
+        }
+    
+    def __iter__(self) -> Iterable[Dict]:
+        return (self.row(index) for index in range(len(self)))
+    
+    def counts(self) -> Dict[str, int]:
+        """Число проверок, находок, ошибок, ответов из кэша и пар, отсеянных до сети"""
+        counts = collections.Counter(self.flags)
+        impossible_id = self.error_ids.get("Impossible")
+        impossible = self.error.count(impossible_id) if impossible_id is not None else 0
+        return {
+            "checks": len(self),
+            "found": sum(count for flags, count in counts.items() if flags & self.FOUND),
+            "errors": sum(count for flags, count in counts.items() if flags & self.ERROR) - impossible,
+            "cached": sum(count for flags, count in counts.items() if flags & self.CACHED),
+            "impossible": impossible
+        }
+    
+    def group(self, column: array.array, found_only: bool = False) -> Dict[int, array.array]:
+        """Номера строк по значению колонки"""
+        groups = {}
+        flags = self.flags
+        for index, key in enumerate(column):
+            if found_only and not flags[index] & self.FOUND:
+                continue
+            rows = groups.get(key)
+            if rows is None:
+                rows = groups[key] = array.array("I")
+            rows.append(index)
+        return groups
+    
+    def group_by_username(self, found_only: bool = False) -> Dict[str, array.array]:
+        return {self.usernames[key]: rows for key, rows in self.group(self.username, found_only).items()}
+    
+    def group_by_category(self, found_only: bool = False) -> Dict[str, array.array]:
+        """Номера строк по категориям сайтов, в порядке добавления"""
+        groups = {}
+        for key, rows in self.group(self.site, found_only).items():
+            groups.setdefault(self.sites[key].cat, []).append(rows)
+        # Группы сайтов одной категории сливаются с сохранением порядка строк
+        return {category: array.array("I", sorted(index for rows in parts for index in rows)) if len(parts) > 1 else parts[0]
+                for category, parts in groups.items()}
+    
+    def memory_bytes(self) -> int:
+        """Память колонок и словарей интернирования (записи сайтов принадлежат базе)"""
+        columns = (self.site, self.username, self.status, self.flags, self.error, self.elapsed)
+        strings = [sys.getsizeof(username) for username in self.usernames] + [sys.getsizeof(error) for error in self.errors]
+        containers = (self.sites, self.site_ids, self.usernames, self.username_ids, self.errors, self.error_ids)
+        return sum(map(sys.getsizeof, columns)) + sum(strings) + sum(map(sys.getsizeof, containers))
+
+class ProgressDisplay:
+    """Прогресс-бар с оценкой оставшегося времени по измеренной задержке запросов"""
+    
+    def __init__(self, total: int, limiter: AdaptiveLimiter, width: int = 40, interval: float = 0.1):
+        self.total = total
+        self.limiter = limiter
+        self.width = width
+        self.interval = interval
+        self.done = 0
+        self.found = 0
+        self.latency_sum = 0.0
+        self.started = time.monotonic()
+        self._last_draw = 0.0
+    
+    def update(self, result: Dict):
+        """Учитывает завершенную проверку"""
+        self.done += 1
+        if result["found"] and not result["error"]:
+            self.found += 1
+        if result["elapsed"]:
+            self.latency_sum += result["elapsed"]
+        
+        now = time.monotonic()
+        if now - self._last_draw >= self.interval or self.done == self.total:
+            self._last_draw = now
+            self.draw()
+    
+    def eta(self) -> float:
+        """Оставшееся время: средняя задержка запроса на число запросов в полете"""
+        remaining = self.total - self.done
+        if not self.done or not remaining:
+            return 0.0
+        average = self.latency_sum / self.done
+        return remaining * average / max(1, self.limiter.in_flight)
+    
+    def draw(self):
+        """Перерисовывает строку прогресса"""
+        ratio = self.done / self.total if self.total else 1.0
+        filled = int(ratio * self.width)
+        bar = "█" * filled + "░" * (self.width - filled)
+        elapsed = time.monotonic() - self.started
+        print(
+            f"\r\033[K{Fore.GREEN}[{bar}] {int(ratio * 100)}% ({self.done}/{self.total}){Style.RESET_ALL} "
+            f"✅ {self.found} | ⏱ {elapsed:.0f} с | ETA {self.eta():.0f} с | ⚡ {self.limiter.in_flight}",
+            end="", flush=True
+        )
+    
+    def print_line(self, text: str):
+        """Печатает строку над прогресс-баром"""
+        print(f"\r\033[K{text}")
+        self.draw()
+    
+    def finish(self):
+        """Завершает вывод прогресса"""
+        self.draw()
+        print()
 
 class WhatsMyFinder:
     """Основной класс приложения"""
     
-    def __init__(self):
-        self.config = self.load_config()
-        self.locale = self.load_locale()
+    def __init__(self, config: Optional[Dict] = None, embedded: bool = False):
+        self.config = config or self.load_config()
+        # Встроенный экземпляр не читает локали и не создает папок
+        self.embedded = embedded
+        self.locale = {} if embedded else self.load_locale()
         self.database = None
+        self.result_cache = None
+        self.health = None
+        self.tracer = None
+        self.profiler = None
+        self.dns_cache = None
         self.selected_categories = set()
         self.export_format = "html"
         self.language = self.config["ui"]["default_language"]
         
         # Создаем необходимые папки
-        self.create_directories()
-        
+        if not embedded:
+            self.create_directories()
+    
+    @classmethod
+    def embed(cls, database: SiteDatabase, config: Optional[Dict] = None, health: Optional[HealthStore] = None) -> "WhatsMyFinder":
+        """Экземпляр для встраивания в чужой сервис: без файлов, кэшей на диске и вывода в терминал"""
+        # config дополняет конфигурацию по умолчанию по секциям
+        defaults = cls.default_config()
+        for section, values in (config or {}).items():
+            defaults[section] = {**defaults.get(section, {}), **values} if isinstance(values, dict) else values
+        defaults["cache"]["enabled"] = False
+        defaults["network"]["dns_cache"] = False
+        defaults["trace"]["enabled"] = False
+        app = cls(defaults, embedded=True)
+        app.database = database
+        app.health = health if health is not None else HealthStore()
+        return app
+    
     def load_config(self) -> Dict:
         """Загружает конфигурацию"""
         config_path = "config.json"
@@ -47,7 +2311,11 @@ class WhatsMyFinder:
             except Exception as e:
                 print(f"{Fore.RED}❌ Ошибка загрузки config.json: {e}{Style.RESET_ALL}")
         
-        # Конфигурация по умолчанию
+        return self.default_config()
+    
+    @staticmethod
+    def default_config() -> Dict:
+        """Конфигурация по умолчанию"""
         return {
             "app": {
                 "name": "WhatsMyFinder",
@@ -59,12 +2327,78 @@ class WhatsMyFinder:
                 "database": "wmn-data.json",
                 "reports_html": "reports/html",
                 "reports_csv": "reports/csv",
-                "locales": "locales"
+                "locales": "locales",
+                "cache": "cache"
             },
             "search": {
                 "default_concurrent_requests": 5,
+                "max_concurrent_requests": 300,
+                "adaptive_concurrency": True,
+                "per_host_limit": 4,
+                "per_host_rate": 5,
+                "max_retries": 1,
+                "retry_backoff": 0.5,
+                "adaptive_timeouts": True,
+                "min_timeout": 3,
+                "timeout_multiplier": 3.0,
+                "hedge_requests": True,
+                "search_deadline": 120,
                 "default_timeout": 15,
-                "max_sites_per_category": 100
+                "max_sites_per_category": 100,
+                "batch_usernames_in_flight": 8,
+                "workers": 0,
+                "queue_size": 4096,
+                "body_matching": "stream",
+                "username_variants": False,
+                "prefilter": True,
+                "prefilter_charset": False,
+                "time_budget": 0,
+                "max_hits": 0,
+                "max_body_bytes": 1048576
+            },
+            "cache": {
+                "enabled": True,
+                "ttl_found": 604800,
+                "ttl_missing": 86400,
+                "ttl_error": 0,
+                "max_entries": 1000000
+            },
+            "health": {
+                "quarantine_after": 5,
+                "quarantine_period": 3600,
+                "quarantine_max": 86400
+            },
+            "egress": {
+                "direct": True,
+                "proxies": [],
+                "drain_after": 5,
+                "drain_period": 60
+            },
+            "network": {
+                "verify_ssl": False,
+                "dns_cache": True,
+                "dns_ttl": 3600,
+                "dns_stale_ttl": 86400,
+                "keepalive_timeout": 30,
+                "warmup": True,
+                "warmup_connect": True,
+                "warmup_concurrency": 32
+            },
+            "trace": {
+                "enabled": False,
+                "keep_requests": True
+            },
+            "profile": {
+                "interval": 0.01,
+                "threshold": 0.1,
+                "cpu": True,
+                "top": 50
+            },
+            "daemon": {
+                "host": "127.0.0.1",
+                "port": 8780,
+                "max_jobs": 4,
+                "keep_finished": 100
             },
             "ui": {
                 "default_language": "ru",
@@ -113,10 +2447,11 @@ class WhatsMyFinder:
         os.makedirs(self.config["paths"]["reports_html"], exist_ok=True)
         os.makedirs(self.config["paths"]["reports_csv"], exist_ok=True)
         os.makedirs(self.config["paths"]["locales"], exist_ok=True)
+        os.makedirs(self.config["paths"].get("cache", "cache"), exist_ok=True)
     
-    def load_database(self) -> bool:
-        """Загружает базу данных"""
-        db_path = self.config["paths"]["database"]
+    def load_database(self, db_path: Optional[str] = None) -> bool:
+        """Загружает базу данных; если база уже загружена, заменяет ее, сбрасывая кэш только измененных сайтов"""
+        db_path = db_path or self.config["paths"]["database"]
         
         if not os.path.exists(db_path):
             print(f"\n{Fore.RED}{self.locale['errors']['no_database']}{Style.RESET_ALL}")
@@ -124,12 +2459,20 @@ class WhatsMyFinder:
             return False
         
         try:
-            with open(db_path, 'r', encoding='utf-8') as f:
-                self.database = json.load(f)
+            if self.database is not None:
+                database = SiteDatabase.load(db_path, self.database_cache_path(db_path))
+                self.config["paths"]["database"] = db_path
+                diff = self.apply_database(database)
+                print(f"{Fore.GREEN}🔄 База данных обновлена: добавлено {len(diff['added'])}, "
+                      f"удалено {len(diff['removed'])}, изменено {len(diff['changed'])}{Style.RESET_ALL}")
+                return True
+            
+            self.database = SiteDatabase.load(db_path, self.database_cache_path(db_path))
+            self.config["paths"]["database"] = db_path
             
             print(f"{Fore.GREEN}✅ База данных загружена:{Style.RESET_ALL}")
-            print(f"  📊 Сайтов: {len(self.database.get('sites', []))}")
-            print(f"  📂 Категорий: {len(self.database.get('categories', []))}")
+            print(f"  📊 Сайтов: {len(self.database.sites)}")
+            print(f"  📂 Категорий: {len(self.database.categories)}")
             print(f"  📍 Источник: {self.config['app']['data_source']}")
             return True
             
@@ -137,6 +2480,103 @@ class WhatsMyFinder:
             print(f"{Fore.RED}❌ Ошибка загрузки базы данных: {e}{Style.RESET_ALL}")
             return False
     
+    def apply_database(self, database: SiteDatabase) -> Dict[str, List[str]]:
+        """Подменяет базу; кэш и телеметрия сбрасываются только для измененных и удаленных сайтов"""
+        diff = self.database.diff(database)
+        stale = diff["changed"] + diff["removed"]
+        if stale:
+            cache = self.get_result_cache()
+            if cache:
+                cache.invalidate(stale)
+            health = self.get_health_store()
+            health.forget(stale)
+            health.save()
+        # Идущие поиски держат свои списки сайтов и доживают на прежней базе
+        self.database = database
+        return diff
+    
+    def database_changed(self) -> bool:
+        """Изменился ли файл базы с момента загрузки"""
+        try:
+            stat = os.stat(self.config["paths"]["database"])
+        except OSError:
+            return False
+        source = self.database.source
+        return (stat.st_mtime_ns, stat.st_size) != (source.get("mtime_ns"), source.get("size"))
+    
+    def get_result_cache(self) -> Optional[ResultCache]:
+        """Открывает кэш результатов, если он включен"""
+        cache_config = self.config.get("cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        if self.result_cache is None:
+            self.result_cache = ResultCache(
+                os.path.join(self.config["paths"].get("cache", "cache"), "results.sqlite3"),
+                ttl_found=cache_config.get("ttl_found", 604800),
+                ttl_missing=cache_config.get("ttl_missing", 86400),
+                ttl_error=cache_config.get("ttl_error", 0),
+                max_entries=cache_config.get("max_entries", 1000000)
+            )
+        return self.result_cache
+    
+    def get_health_store(self) -> HealthStore:
+        """Загружает телеметрию здоровья сайтов"""
+        if self.health is None:
+            health_config = self.config.get("health", {})
+            self.health = HealthStore(
+                os.path.join(self.config["paths"].get("cache", "cache"), "health.json"),
+                quarantine_after=health_config.get("quarantine_after", 5),
+                quarantine_period=health_config.get("quarantine_period", 3600),
+                quarantine_max=health_config.get("quarantine_max", 86400)
+            )
+        return self.health
+    
+    def search_session(self, cache: bool = True, tracer: Optional[RequestTracer] = None,
+                       session: Optional[aiohttp.ClientSession] = None) -> SearchSession:
+        """Сессия поиска с кэшем, телеметрией, трассировкой и выходами из config.json; session - готовая сессия вызывающего"""
+        return SearchSession(
+            self.config["search"],
+            cache=self.get_result_cache() if cache else None,
+            health=self.get_health_store(),
+            tracer=tracer or self.get_tracer(),
+            egress_config=self.config.get("egress"),
+            network_config=self.config.get("network"),
+            dns_cache=self.get_dns_cache(),
+            session=session,
+            profiler=self.profiler
+        )
+    
+    def get_dns_cache(self) -> Optional[DnsCache]:
+        """Загружает сохраненный между запусками DNS-кэш, если он включен"""
+        network_config = self.config.get("network", {})
+        if not network_config.get("dns_cache", True):
+            return None
+        if self.dns_cache is None:
+            self.dns_cache = DnsCache(
+                os.path.join(self.config["paths"].get("cache", "cache"), "dns.json"),
+                ttl=network_config.get("dns_ttl", 3600),
+                stale_ttl=network_config.get("dns_stale_ttl", 86400)
+            )
+        return self.dns_cache
+    
+    def get_tracer(self) -> Optional[RequestTracer]:
+        """Трассировка фаз запросов, если она включена в config.json или флагами --trace/--metrics"""
+        trace_config = self.config.get("trace", {})
+        if self.tracer is None and trace_config.get("enabled", False):
+            self.tracer = RequestTracer(keep_requests=trace_config.get("keep_requests", True))
+        return self.tracer
+    
+    def close(self):
+        """Освобождает ресурсы приложения"""
+        if self.result_cache:
+            self.result_cache.close()
+            self.result_cache = None
+    
+    def database_cache_path(self, db_path: Optional[str] = None) -> str:
+        """Путь к скомпилированной базе"""
+        db_name = os.path.splitext(os.path.basename(db_path or self.config["paths"]["database"]))[0]
+        return os.path.join(self.config["paths"].get("cache", "cache"), f"{db_name}.pickle")
+    
     def clear_screen(self):
         """Очищает экран терминала"""
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -184,33 +2624,48 @@ class WhatsMyFinder:
         """Меню поиска username"""
         self.print_header()
         
-        if not self.database and not self.load_database():
+        if self.database is None and not self.load_database():
             input(f"\n{Fore.YELLOW}⏎ Нажмите Enter для возврата...{Style.RESET_ALL}")
             return
+        if self.database_changed():
+            self.load_database()
         
         print(f"{Fore.YELLOW}🔍 {self.locale['search']['enter_username']}{Style.RESET_ALL}")
         print(f"{Fore.CYAN}{'─'*40}{Style.RESET_ALL}")
         
-        username = input(f"\n{Fore.GREEN}➜ Username: {Style.RESET_ALL}").strip()
-        
-        if not username:
-            return
-        
-        # Показываем выбранные настройки
-        print(f"\n{Fore.CYAN}⚙️  Текущие настройки:{Style.RESET_ALL}")
-        print(f"  📂 Категории: {len(self.selected_categories) if self.selected_categories else 'Все'}")
-        print(f"  📄 Формат: {self.export_format.upper()}")
-        
-        confirm = input(f"\n{Fore.YELLOW}▶️  Начать поиск? (y/n): {Style.RESET_ALL}").strip().lower()
-        
-        if confirm == 'y':
-            asyncio.run(self.perform_search(username))
-        
-        input(f"\n{Fore.YELLOW}⏎ Нажмите Enter для возврата...{Style.RESET_ALL}")
+        if asyncio.run(self.interactive_search()):
+            input(f"\n{Fore.YELLOW}⏎ Нажмите Enter для возврата...{Style.RESET_ALL}")
+    
+    async def interactive_search(self) -> bool:
+        """Ввод username и поиск в одной сессии: пока пользователь вводит имя, сессия прогревает DNS и соединения"""
+        async with self.search_session() as search:
+            warmup = None
+            if self.config.get("network", {}).get("warmup", True):
+                warmup = asyncio.ensure_future(search.warm_up(self.search_sites()))
+            try:
+                username = (await read_line(f"\n{Fore.GREEN}➜ Username: {Style.RESET_ALL}")).strip()
+                
+                if not username:
+                    return False
+                
+                # Показываем выбранные настройки
+                print(f"\n{Fore.CYAN}⚙️  Текущие настройки:{Style.RESET_ALL}")
+                print(f"  📂 Категории: {len(self.selected_categories) if self.selected_categories else 'Все'}")
+                print(f"  📄 Формат: {self.export_format.upper()}")
+                
+                confirm = (await read_line(f"\n{Fore.YELLOW}▶️  Начать поиск? (y/n): {Style.RESET_ALL}")).strip().lower()
+            finally:
+                # Недогретые хосты поиск откроет сам
+                if warmup:
+                    warmup.cancel()
+            
+            if confirm == 'y':
+                await self.perform_search(username, search)
+        return True
     
     def select_categories_menu(self):
         """Меню выбора категорий"""
-        if not self.database and not self.load_database():
+        if self.database is None and not self.load_database():
             input(f"\n{Fore.YELLOW}⏎ Нажмите Enter для возврата...{Style.RESET_ALL}")
             return
         
@@ -218,7 +2673,7 @@ class WhatsMyFinder:
             self.print_header()
             print(f"{Fore.YELLOW}📂 {self.locale['categories']['title']}{Style.RESET_ALL}\n")
             
-            categories = self.database.get("categories", [])
+            categories = self.database.categories
             
             # Выводим категории с номерами
             for i, category in enumerate(sorted(categories), 1):
@@ -319,15 +2774,16 @@ class WhatsMyFinder:
         """Изменение количества параллельных запросов"""
         try:
             current = self.config["search"]["default_concurrent_requests"]
-            new = input(f"\n{Fore.CYAN}➜ Параллельные запросы (1-10, текущее: {current}): {Style.RESET_ALL}").strip()
+            maximum = self.config["search"].get("max_concurrent_requests", 300)
+            new = input(f"\n{Fore.CYAN}➜ Параллельные запросы (1-{maximum}, текущее: {current}): {Style.RESET_ALL}").strip()
             
             if new:
                 value = int(new)
-                if 1 <= value <= 10:
+                if 1 <= value <= maximum:
                     self.config["search"]["default_concurrent_requests"] = value
                     print(f"{Fore.GREEN}✅ Установлено: {value}{Style.RESET_ALL}")
                 else:
-                    print(f"{Fore.RED}❌ Значение должно быть от 1 до 10{Style.RESET_ALL}")
+                    print(f"{Fore.RED}❌ Значение должно быть от 1 до {maximum}{Style.RESET_ALL}")
         except ValueError:
             print(f"{Fore.RED}❌ Введите число{Style.RESET_ALL}")
         
@@ -351,172 +2807,702 @@ class WhatsMyFinder:
         
         input(f"\n{Fore.YELLOW}⏎ Нажмите Enter...{Style.RESET_ALL}")
     
-    async def check_site(self, session: aiohttp.ClientSession, site_config: Dict, username: str, semaphore: asyncio.Semaphore) -> Dict:
+    async def check_site(self, search: "SearchSession", site: SiteRecord, username: str, deadline: Optional[float] = None) -> Dict:
         """Проверяет один сайт"""
-        async with semaphore:
-            result = {
-                "name": site_config.get("name", "Unknown"),
-                "url": "",
-                "found": False,
-                "error": None,
-                "category": site_config.get("cat", "unknown"),
-                "status": None
-            }
+        result = {
+            "username": username,
+            "name": site.name,
+            "url": "",
+            "found": False,
+            "error": None,
+            "category": site.cat,
+            "status": None,
+            "elapsed": None,
+            "cached": False
+        }
+        
+        # Подготавливаем URL
+        if site.url_parts is None:
+            return result
+        
+        try:
+            # Свежий результат из кэша избавляет от запроса
+            if search.cache:
+                cached = search.cache.get(site.name, username)
+                if cached:
+                    return cached
             
-            try:
-                # Подготавливаем URL
-                uri_check = site_config.get("uri_check", "")
-                if not uri_check or "{account}" not in uri_check:
-                    return result
-                
-                url = uri_check.replace("{account}", username)
-                result["url"] = url
-                
-                # Заголовки
-                headers = site_config.get("headers", {})
-                if not headers:
-                    headers = {
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                        "Accept": "text/html",
-                    }
-                
-                # Таймаут из настроек
-                timeout = aiohttp.ClientTimeout(total=self.config["search"]["default_timeout"])
-                
-                # Выполняем запрос
-                if site_config.get("post_body"):
-                    post_body = site_config.get("post_body", "").replace("{account}", username)
-                    async with session.post(url, data=post_body, headers=headers, timeout=timeout, ssl=False) as response:
-                        content = await response.text()
-                        status = response.status
+            url = site.url(username)
+            result["url"] = url
+            key = site.request_key(username)
+            outcome = None
+            
+            # Такой же запрос уже в полете: ждем его ответа и применяем к нему свои правила
+            shared = search.requests.get(key)
+            if shared is not None:
+                shared.join(site)
+                try:
+                    outcome = await asyncio.shield(shared.future)
+                except asyncio.CancelledError:
+                    if not shared.future.cancelled():
+                        raise
+                if outcome is not None and not outcome.error and site.needle(outcome.status) not in outcome.needles | {None}:
+                    # Сайт присоединился, когда тело уже читалось без его строки
+                    outcome = None
+                if outcome is not None:
+                    search.coalesced += 1
+            
+            if outcome is None:
+                if key in search.requests:
+                    outcome = await self.fetch(search, site, [site], username, url, deadline)
                 else:
-                    async with session.get(url, headers=headers, timeout=timeout, ssl=False) as response:
-                        content = await response.text()
-                        status = response.status
-                
-                result["status"] = status
-                
-                # Логика проверки
-                expected_code = site_config.get("e_code")
-                expected_string = site_config.get("e_string", "")
-                missing_code = site_config.get("m_code")
-                missing_string = site_config.get("m_string", "")
+                    shared = SharedRequest(site)
+                    search.requests[key] = shared
+                    try:
+                        outcome = await self.fetch(search, site, shared.sites, username, url, deadline)
+                        shared.future.set_result(outcome)
+                    finally:
+                        del search.requests[key]
+                        if not shared.future.done():
+                            shared.future.cancel()
+            
+            result["status"] = outcome.status
+            result["error"] = outcome.error
+            result["found"] = outcome.error is None and site.matches(outcome.status, outcome.found)
+            result["elapsed"] = round(outcome.elapsed, 3)
+            # Результат по правилам, замененным перезагрузкой базы, не должен вернуться в кэш и телеметрию
+            if self.database is None or self.database.current(site):
+                search.health.record(site, result)
+                if search.cache:
+                    search.cache.put(result)
+            return result
+        finally:
+            # Проба сайта после карантина заканчивается при любом исходе: ответ, кэш, дедлайн или отмена
+            search.health.end_probe(site)
+    
+    async def fetch(self, search: "SearchSession", site: SiteRecord, sites: List[SiteRecord], username: str, url: str,
+                    deadline: Optional[float]) -> RequestOutcome:
+        """Запрос с повторами; site определяет хост, таймауты и повторы, sites - правила, разделяющие ответ"""
+        status = None
+        needles = found = frozenset()
+        error = None
+        # Учитывается только время запросов, без ожидания слотов и пауз между повторами
+        elapsed = 0.0
+        max_retries = self.config["search"].get("max_retries", 1)
+        attempt = 0
+        
+        while True:
+            retry = False
+            try:
+                if deadline is not None and deadline - time.monotonic() <= 0:
+                    error = "Deadline"
+                    break
                 
-                # Проверяем по правилам
-                if expected_code is not None and status == expected_code:
-                    if expected_string:
-                        result["found"] = expected_string in content
-                    else:
-                        result["found"] = True
-                elif missing_code is not None and status == missing_code:
-                    result["found"] = False
-                elif missing_string and missing_string in content:
-                    result["found"] = False
-                else:
-                    # Fallback
-                    result["found"] = status not in [404, 410, 403, 400]
+                # Повтор уходит через следующий выход в ротации хоста
+                async with search.egress_slot(site.host) as egress:
+                    attempt_started = time.monotonic()
+                    try:
+                        status, needles, found = await self.hedged_request(search, egress, site, sites, username, url, deadline)
+                    except Exception as e:
+                        # Отказы соединения и таймауты говорят о здоровье выхода, ошибки сайта - нет
+                        if isinstance(e, (asyncio.TimeoutError, aiohttp.ClientHttpProxyError)) or is_transient_error(e):
+                            search.egresses.record(egress, False)
+                        raise
+                    finally:
+                        elapsed += time.monotonic() - attempt_started
+                search.egresses.record(egress, True)
+                error = None
+                # Временные ответы сервера повторяем, если они не входят в правила сайта
+                retry = status in RETRY_STATUSES and status not in (site.e_code, site.m_code)
                     
             except asyncio.TimeoutError:
-                result["error"] = "Timeout"
+                error = "Timeout"
+                retry = True
             except Exception as e:
-                result["error"] = str(e)[:50]
+                error = str(e)[:50]
+                retry = is_transient_error(e)
             
-            return result
+            if not retry or attempt >= max_retries:
+                break
+            delay = search.backoff(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                break
+            attempt += 1
+            search.retries += 1
+            await asyncio.sleep(delay)
+        
+        return RequestOutcome(status, needles, found, error, elapsed)
+    
+    def skipped_result(self, site: SiteRecord, username: str, reason: str) -> Dict:
+        """Результат для сайта, который не проверялся"""
+        return {
+            "username": username,
+            "name": site.name,
+            "url": site.url(username) if site.url_parts else "",
+            "found": False,
+            "error": reason,
+            "category": site.cat,
+            "status": None,
+            "elapsed": None,
+            "cached": False
+        }
+    
+    async def request_site(self, search: "SearchSession", egress: Egress, site: SiteRecord, sites: List[SiteRecord], username: str,
+                           url: str, timeout: float) -> Tuple[int, frozenset, frozenset]:
+        """Один HTTP-запрос к сайту; тело читается один раз для строк всех разделяющих ответ сайтов"""
+        session = egress.session
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        started = time.monotonic()
+        trace = search.tracer.begin(site, url) if search.tracer else None
+        
+        try:
+            if site.body_parts:
+                request = session.post(url, data=site.body(username), headers=site.headers, timeout=client_timeout,
+                                       proxy=egress.request_proxy, trace_request_ctx=trace)
+            else:
+                request = session.get(url, headers=site.headers, timeout=client_timeout,
+                                      proxy=egress.request_proxy, trace_request_ctx=trace)
+            
+            async with request as response:
+                if trace:
+                    trace.status = response.status
+                if response.status == 429:
+                    search.limiter.record_congestion()
+                    search.hosts.penalize((egress.name, site.host), parse_retry_after(response.headers.get("Retry-After")))
+                else:
+                    search.limiter.record_success()
+                needles, found = await self.match_response(sites, response, trace)
+        except asyncio.TimeoutError:
+            search.limiter.record_congestion()
+            if trace:
+                trace.error = "Timeout"
+            raise
+        except Exception as e:
+            if trace:
+                trace.error = type(e).__name__
+            raise
+        finally:
+            if trace:
+                search.tracer.finish(trace)
+        
+        search.record_latency(site, time.monotonic() - started)
+        return response.status, needles, found
     
-    async def perform_search(self, username: str):
-        """Выполняет поиск username"""
+    async def hedged_request(self, search: "SearchSession", egress: Egress, site: SiteRecord, sites: List[SiteRecord], username: str,
+                             url: str, deadline: Optional[float]) -> Tuple[int, frozenset, frozenset]:
+        """Запрос с хеджированием: если сайт отвечает дольше обычного, параллельно отправляется дубль"""
+        timeout = search.site_timeout(site, deadline)
+        hedge_delay = search.hedge_delay(site)
+        if hedge_delay is None or hedge_delay >= timeout:
+            return await self.request_site(search, egress, site, sites, username, url, timeout)
+        
+        primary = asyncio.ensure_future(self.request_site(search, egress, site, sites, username, url, timeout))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if done:
+                return primary.result()
+            # Дубль - такой же запрос к хосту: без свободных слотов хоста и общего лимита ждем основной
+            if not await search.try_hedge_slot(egress, site.host):
+                return await primary
+            
+            search.hedged += 1
+            hedge = asyncio.ensure_future(self.request_site(search, egress, site, sites, username, url, timeout - hedge_delay))
+            # Колбэк срабатывает и для дубля, отмененного до старта
+            hedge.add_done_callback(lambda _: search.release_hedge_slot(egress, site.host))
+            tasks.add(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # Оба запроса завершились ошибкой: отдаем ошибку основного
+            return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def match_response(self, sites: List[SiteRecord], response: aiohttp.ClientResponse,
+                             trace: Optional[RequestTrace] = None) -> Tuple[frozenset, frozenset]:
+        """Ищет в теле строки, нужные правилам сайтов при этом коде ответа; тело читается, только если код не решает исход"""
+        needles = frozenset(needle for needle in (site.needle(response.status) for site in sites) if needle)
+        if not needles:
+            await drain_small_body(response)
+            return needles, needles
+        
+        if self.config["search"].get("body_matching", "stream") == "full":
+            text = await response.text()
+            matching_started = time.perf_counter()
+            found = frozenset(needle for needle in needles if needle in text)
+            if trace:
+                trace.phases["match"] += time.perf_counter() - matching_started
+            return needles, found
+        
+        limit = max(site.max_body_bytes or self.config["search"].get("max_body_bytes", DEFAULT_MAX_BODY_BYTES) for site in sites)
+        return needles, frozenset(await scan_body(response, needles, limit, trace))
+    
+    def filter_sites(self) -> List[SiteRecord]:
+        """Возвращает сайты выбранных категорий"""
+        return self.database.select(self.selected_categories)
+    
+    def limit_sites(self, sites: List[SiteRecord], username: Optional[str]) -> List[SiteRecord]:
+        """Не больше max_sites_per_category сайтов; при отборе остаются самые результативные для username"""
+        max_sites = self.config["search"]["max_sites_per_category"]
+        if len(sites) <= max_sites:
+            return sites
+        return self.get_health_store().rank(sites, username)[:max_sites]
+    
+    def search_sites(self) -> List[SiteRecord]:
+        """Сайты, которые отберет поиск, пока username еще не известен: тот же отбор limit_sites по всем классам username"""
+        return self.limit_sites(self.filter_sites(), None)
+    
+    async def perform_search(self, username: str, search: Optional[SearchSession] = None):
+        """Выполняет поиск username; без готовой сессии открывает свою"""
         print(f"\n{Fore.YELLOW}{self.locale['search']['searching'].format(username)}{Style.RESET_ALL}")
         
         # Фильтруем сайты по выбранным категориям
-        sites = self.database.get("sites", [])
-        
-        if self.selected_categories:
-            filtered_sites = [site for site in sites if site.get("cat") in self.selected_categories]
-        else:
-            filtered_sites = sites
+        filtered_sites = self.filter_sites()
         
         # Ограничиваем количество сайтов
         max_sites = self.config["search"]["max_sites_per_category"]
+        test_sites = self.limit_sites(filtered_sites, username)
         if len(filtered_sites) > max_sites:
-            test_sites = filtered_sites[:max_sites]
-            print(f"{Fore.YELLOW}⚠️  Ограничение: проверяю первые {max_sites} сайтов{Style.RESET_ALL}")
-        else:
-            test_sites = filtered_sites
+            print(f"{Fore.YELLOW}⚠️  Ограничение: проверяю {max_sites} самых результативных сайтов{Style.RESET_ALL}")
         
         print(f"{Fore.CYAN}{self.locale['search']['checking_sites'].format(len(test_sites))}{Style.RESET_ALL}")
         
-        estimated_time = len(test_sites) * 2 / self.config["search"]["default_concurrent_requests"]
-        print(f"{Fore.CYAN}{self.locale['search']['time_estimate'].format(int(estimated_time))}{Style.RESET_ALL}")
-        
-        # Семафор для ограничения запросов
-        semaphore = asyncio.Semaphore(self.config["search"]["default_concurrent_requests"])
-        
-        # Создаем сессию
-        connector = aiohttp.TCPConnector(limit=self.config["search"]["default_concurrent_requests"])
-        timeout = aiohttp.ClientTimeout(total=30)
-        
-        results = []
-        
-        # Прогресс-бар
-        total = len(test_sites)
+        # Результаты пишутся на диск по мере готовности, отчеты строятся из этого потока
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        stream_path = self.report_path("reports_csv", username, timestamp, ".ndjson")
+        sinks = [ResultSink.open(stream_path)]
+        if self.export_format in ["csv", "both"]:
+            sinks.append(ResultSink.open(
+                self.report_path("reports_csv", username, timestamp, ".csv"), "csv",
+                columns=["category", "site_name", "url", "status", "timestamp"], found_only=True
+            ))
         
         try:
-            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-                # Создаем задачи
-                tasks = []
-                for i, site in enumerate(test_sites, 1):
-                    task = self.check_site(session, site, username, semaphore)
-                    tasks.append(task)
-                    
-                    # Выводим прогресс каждые 10%
-                    if i % max(1, total // 10) == 0 or i == total:
-                        progress = int((i / total) * 50)
-                        bar = "█" * progress + "░" * (50 - progress)
-                        percent = int((i / total) * 100)
-                        print(f"\r{Fore.GREEN}[{bar}] {percent}% ({i}/{total}){Style.RESET_ALL}", end="", flush=True)
+            async with contextlib.AsyncExitStack() as stack:
+                if search is None:
+                    search = await stack.enter_async_context(self.search_session())
+                # Прогресс-бар обновляется по мере завершения запросов
+                progress = ProgressDisplay(len(test_sites), search.limiter)
                 
-                print()  # Новая строка после прогресс-бара
+                def on_result(result: Dict):
+                    for sink in sinks:
+                        sink.write(result)
+                    progress.update(result)
+                    if result["found"] and not result["error"]:
+                        progress.print_line(f"  {Fore.GREEN}✅ {result['name']}{Style.RESET_ALL} ({result['category']}): {result['url']}")
                 
-                # Выполняем все задачи
-                print(f"{Fore.CYAN}⏳ Обработка результатов...{Style.RESET_ALL}")
-                results = await asyncio.gather(*tasks, return_exceptions=True)
+                await self.check_username(search, username, test_sites, on_result)
+                progress.finish()
+                for sink in sinks:
+                    await sink.drain()
                 
         except Exception as e:
             print(f"{Fore.RED}❌ Ошибка: {e}{Style.RESET_ALL}")
+            print(f"{Fore.YELLOW}📄 Полученные результаты: {stream_path}{Style.RESET_ALL}")
             return
+        finally:
+            for sink in sinks:
+                sink.close()
+        
+        # Сводка и отчеты собираются из потока вне цикла событий
+        loop = asyncio.get_event_loop()
+        summary = await loop.run_in_executor(None, self.summarize_stream, stream_path)
+        self.print_results(username, summary["total_checked"], summary["found"], summary["errors"], summary["by_category"],
+                           summary["impossible"])
+        await loop.run_in_executor(None, self.save_report, summary, username, timestamp)
+    
+    def report_path(self, directory: str, username: str, timestamp: str, suffix: str) -> str:
+        """Путь файла отчета в каталоге из config.json"""
+        return os.path.join(self.config["paths"][directory], f"whatsmyfinder_{username}_{timestamp}{suffix}")
+    
+    def summarize_stream(self, stream_path: str) -> Dict:
+        """Сводка поиска по NDJSON-потоку результатов; в словари превращаются только найденные профили"""
+        table = ResultTable(self.database)
+        with open(stream_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                table.add(json.loads(line))
+        counts = table.counts()
+        return {
+            "total_checked": counts["checks"] - counts["errors"] - counts["impossible"],
+            "found": counts["found"],
+            "errors": counts["errors"],
+            "impossible": counts["impossible"],
+            "by_category": {category: [table.row(index) for index in rows]
+                            for category, rows in table.group_by_category(found_only=True).items()},
+            "selected_categories": sorted(self.selected_categories),
+            "generated": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+    
+    async def check_username(self, search: "SearchSession", username: str, sites: List[SiteRecord],
+                             on_result: Callable[[Dict], Optional[Awaitable]], variants: Optional[bool] = None,
+                             time_budget: Optional[float] = None, max_hits: Optional[int] = None, max_pending: Optional[int] = None,
+                             priority: int = 0, completed: Optional[Set[Tuple[str, str]]] = None):
+        """Проверяет username по списку сайтов через планировщик сессии, отдавая результаты по мере готовности"""
+        search_config = self.config["search"]
+        search_deadline = search_config.get("search_deadline", 0)
+        deadline = time.monotonic() + search_deadline if search_deadline else None
+        if variants is None:
+            variants = search_config.get("username_variants", False)
+        if time_budget is None:
+            time_budget = search_config.get("time_budget", 0)
+        if max_hits is None:
+            max_hits = search_config.get("max_hits", 0)
+        # Бюджет времени и квота находок останавливают поиск досрочно; 0 - без ограничения
+        stop = time.monotonic() + time_budget if time_budget else None
+        
+        async def report(result: Dict):
+            # Асинхронный on_result - обратное давление: пока он ждет потребителя, новые проверки не начинаются
+            outcome = on_result(result)
+            if outcome is not None:
+                await outcome
         
-        # Обрабатываем результаты
-        valid_results = [r for r in results if isinstance(r, dict) and not r.get("error")]
-        error_results = [r for r in results if isinstance(r, dict) and r.get("error")]
-        found_sites = [r for r in valid_results if r.get("found")]
+        def remaining() -> Optional[float]:
+            return None if stop is None else max(stop - time.monotonic(), 0)
         
-        # Группируем по категориям
-        by_category = {}
-        for site in found_sites:
-            cat = site.get("category", "unknown")
-            if cat not in by_category:
-                by_category[cat] = []
-            by_category[cat].append(site)
+        # Пары, в которых username не может существовать на сайте, отсекаются до сети
+        checks = self.plan_checks(username, sites) if variants else [(site, username) for site in sites]
+        # Пары (вариант, сайт), уже проверенные прерванным запуском, не повторяются
+        if completed:
+            checks = [(site, account) for site, account in checks if (account, site.name) not in completed]
+            sites = list({site.id: site for site, _ in checks}.values())
+        if search_config.get("prefilter", True):
+            strict = search_config.get("prefilter_charset", False)
+            possible = []
+            for site, account in checks:
+                if site.accepts(account, strict):
+                    possible.append((site, account))
+                else:
+                    await report(self.skipped_result(site, account, "Impossible"))
+            if len(possible) < len(checks):
+                checks = possible
+                sites = list({site.id: site for site, _ in checks}.values())
         
-        # Выводим результаты
-        self.print_results(username, len(valid_results), len(found_sites), len(error_results), by_category)
+        # Без бюджета медленные сайты стартуют первыми; с бюджетом - сайты с наибольшим ожиданием находок в секунду.
+        # Сайты в карантине не запрашиваются
+        budgeted = bool(time_budget or max_hits)
+        sites, quarantined = search.health.schedule(sites, username=username if budgeted else None)
+        for site in quarantined:
+            await report(self.skipped_result(site, username, "Quarantined"))
+        order = {site.id: index for index, site in enumerate(sites)}
+        checks = sorted((check for check in checks if check[0].id in order), key=lambda check: order[check[0].id])
+        waiting = iter(checks)
+        rank = itertools.count()
+        scheduler = search.scheduler
+        group = CheckGroup(functools.partial(self.check_site, search), deadline)
+        # Поставлено в очередь планировщика, но не отдано; с max_pending - не больше max_pending
+        outstanding = 0
+        exhausted = not checks
         
-        # Создаем отчет
-        report_data = {
-            "username": username,
-            "total_checked": len(valid_results),
-            "found": len(found_sites),
-            "errors": len(error_results),
-            "by_category": by_category,
-            "all_found": found_sites,
-            "selected_categories": list(self.selected_categories),
-            "timestamp": datetime.now().isoformat()
-        }
+        async def submit():
+            nonlocal outstanding, exhausted
+            while not exhausted and (not max_pending or outstanding < max_pending):
+                if not scheduler.has_room():
+                    # Очередь полна: ждем места, только если своих результатов ждать не приходится
+                    if outstanding:
+                        return
+                    await asyncio.wait_for(scheduler.wait_room(), remaining())
+                check = next(waiting, None)
+                if check is None:
+                    exhausted = True
+                    return
+                scheduler.submit(group, priority, next(rank), *check)
+                outstanding += 1
+        
+        hits = 0
+        try:
+            while True:
+                try:
+                    await submit()
+                    if not outstanding:
+                        break
+                    if stop is not None and group.finished.empty() and not remaining():
+                        break
+                    _, _, task = await asyncio.wait_for(group.finished.get(), remaining())
+                except asyncio.TimeoutError:
+                    break
+                outstanding -= 1
+                result = task.result()
+                await report(result)
+                if result["found"] and not result["error"]:
+                    hits += 1
+                    if max_hits and hits >= max_hits:
+                        break
+        finally:
+            # Досрочная остановка: снятые и отмененные проверки успевают освободить слоты до следующего username
+            if outstanding:
+                await scheduler.cancel(group)
+        
+        # Уже готовые результаты отдаются, кроме находок сверх квоты; остальные проверки - как непроверенные
+        while outstanding:
+            site, account, task = group.finished.get_nowait()
+            outstanding -= 1
+            result = None
+            if task is not None and not task.cancelled() and task.exception() is None:
+                result = task.result()
+                if result["found"] and not result["error"]:
+                    hits += 1
+                    if max_hits and hits > max_hits:
+                        result = None
+            await report(result or self.skipped_result(site, account, "NotChecked"))
+        for site, account in waiting:
+            await report(self.skipped_result(site, account, "NotChecked"))
+    
+    def plan_checks(self, username: str, sites: List[SiteRecord]) -> List[Tuple[SiteRecord, str]]:
+        """Пары (сайт, вариант username) без вариантов, дающих сайту тот же запрос"""
+        checks = []
+        seen = set()
+        for site in sites:
+            for variant in username_variants(username):
+                key = (site.id, site.request_key(variant))
+                if key not in seen:
+                    seen.add(key)
+                    checks.append((site, variant))
+        return checks
+    
+    async def run_batch(self, usernames: Iterable[str], sink: ResultSink, report_progress: bool = True) -> Dict:
+        """Пакетная проверка списка username через одну сессию; с журналом в sink пропускает завершенные проверки"""
+        all_sites = self.filter_sites()
+        window = asyncio.Semaphore(self.config["search"].get("batch_usernames_in_flight", 8))
+        stats = {"usernames": 0, "checks": 0, "found": 0, "errors": 0, "cached": 0, "resumed": 0, "not_checked": 0, "impossible": 0}
+        started = time.monotonic()
+        last_report = started
+        
+        def on_result(username: str, result: Dict):
+            nonlocal last_report
+            # Проверки - только запрошенные пары: отсеянные и непроверенные считаются отдельно
+            if result["error"] == "NotChecked":
+                stats["not_checked"] += 1
+            elif result["error"] == "Impossible":
+                stats["impossible"] += 1
+            else:
+                stats["checks"] += 1
+                if result["cached"]:
+                    stats["cached"] += 1
+                if result["error"]:
+                    stats["errors"] += 1
+                elif result["found"]:
+                    stats["found"] += 1
+            
+            sink.write(result, username)
+            
+            now = time.monotonic()
+            if report_progress and now - last_report >= 5:
+                last_report = now
+                sink.submit()
+                rate = stats["checks"] / (now - started)
+                print(f"⏳ {stats['usernames']} username, {stats['checks']} проверок, {rate:.1f} проверок/с", file=sys.stderr)
+        
+        async def run_one(username: str, order: int):
+            try:
+                sites = self.limit_sites(all_sites, username)
+                completed = sink.journal.done(username) if sink.journal else set()
+                if completed:
+                    names = {site.name for site in sites}
+                    stats["resumed"] += sum(1 for _, name in completed if name in names)
+                # Ранние username разбираются первыми: их результаты и журнал закрываются раньше
+                await self.check_username(search, username, sites, functools.partial(on_result, username), priority=order,
+                                          completed=completed)
+            finally:
+                window.release()
+        
+        async with self.search_session() as search:
+            pending = set()
+            # Источник username читается в потоке: медленный stdin или очередь не блокируют цикл событий
+            loop = asyncio.get_event_loop()
+            iterator = iter(usernames)
+            while True:
+                await window.acquire()
+                username = await loop.run_in_executor(None, next, iterator, None)
+                if username is None:
+                    window.release()
+                    break
+                pending.add(asyncio.ensure_future(run_one(username, stats["usernames"])))
+                stats["usernames"] += 1
+                for task in [task for task in pending if task.done()]:
+                    pending.discard(task)
+                    task.result()
+            if pending:
+                await asyncio.gather(*pending)
+            stats["retries"] = search.retries
+            stats["hedged"] = search.hedged
+            stats["coalesced"] = search.coalesced
+            stats["egresses"] = search.egresses.report()
+            await sink.drain()
+        
+        stats["elapsed"] = time.monotonic() - started
+        stats["checks_per_second"] = stats["checks"] / stats["elapsed"] if stats["elapsed"] else 0.0
+        return stats
+    
+    def run_sharded_batch(self, usernames: Iterable[str], output: TextIO, workers: int, all_results: bool = False,
+                          report_progress: bool = True, output_format: str = "ndjson", header: bool = True,
+                          journal: Optional[CheckJournal] = None) -> Dict:
+        """Пакетная проверка на нескольких процессах: у каждого свой цикл событий, коннектор и копия базы"""
+        context = multiprocessing.get_context("spawn")
+        usernames_queue = context.Queue(maxsize=workers * 64)
+        results_queue = context.Queue()
+        health = self.get_health_store()
+        baseline = health.snapshot()
+        processes = [
+            context.Process(
+                target=batch_worker,
+                args=(self.config, self.database, self.selected_categories, all_results, output_format,
+                      journal.completed if journal else None, usernames_queue, results_queue),
+                daemon=True
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        
+        def feed():
+            for username in usernames:
+                usernames_queue.put(username)
+            for _ in processes:
+                usernames_queue.put(None)
         
-        # Сохраняем отчет
-        self.save_report(report_data, username)
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        
+        stats = collections.Counter()
+        started = time.monotonic()
+        last_report = started
+        finished = 0
+        if output_format == "csv" and header:
+            # Заголовок пишет родитель, рабочие процессы отдают только строки
+            output.write(",".join(ResultSink.CSV_COLUMNS) + "\r\n")
+        try:
+            while finished < workers:
+                try:
+                    message = results_queue.get(timeout=1)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        raise RuntimeError("рабочие процессы завершились до окончания проверки")
+                    continue
+                
+                if message[0] == "lines":
+                    for text in message[1]:
+                        output.write(text)
+                        stats["lines"] += text.count("\n")
+                elif message[0] == "journal":
+                    # Как и в ResultSink, журнал дописывается после сброса вывода
+                    output.flush()
+                    journal.stream.write("".join(message[1]))
+                    journal.stream.flush()
+                else:
+                    finished += 1
+                    stats.update(message[1])
+                    health.merge(message[2], baseline)
+                    if message[3] is not None:
+                        self.get_tracer().merge(message[3])
+                
+                now = time.monotonic()
+                if report_progress and now - last_report >= 5:
+                    last_report = now
+                    output.flush()
+                    print(f"⏳ {workers} процессов, выведено результатов: {stats['lines']}", file=sys.stderr)
+        finally:
+            for process in processes:
+                process.join(5)
+                if process.is_alive():
+                    process.terminate()
+        
+        health.save()
+        output.flush()
+        stats = {key: stats[key] for key in ("usernames", "checks", "found", "errors", "cached", "resumed", "not_checked",
+                                             "impossible", "retries", "hedged", "coalesced")}
+        stats["workers"] = workers
+        stats["elapsed"] = time.monotonic() - started
+        stats["checks_per_second"] = stats["checks"] / stats["elapsed"] if stats["elapsed"] else 0.0
+        return stats
+    
+    async def validate_sites(self, sites: List[SiteRecord]) -> List[Dict]:
+        """Проверяет правила сайтов на известных аккаунтах и случайном несуществующем имени"""
+        missing_name = "wmf" + uuid.uuid4().hex[:12]
+        checks = []
+        
+        async with self.search_session(cache=False) as search:
+            for site in sites:
+                for account in site.known:
+                    checks.append((site, account, True, self.check_site(search, site, account)))
+                checks.append((site, missing_name, False, self.check_site(search, site, missing_name)))
+            results = await asyncio.gather(*(check[3] for check in checks))
+        
+        by_site = {}
+        for (site, account, expected, _), result in zip(checks, results):
+            report = by_site.setdefault(site.name, {
+                "site": site.name,
+                "category": site.cat,
+                "fingerprint": site.fingerprint(),
+                "status": "pass",
+                "known_ok": 0,
+                "known_total": len(site.known),
+                "missing_ok": False,
+                "details": []
+            })
+            if result["error"]:
+                report["details"].append(f"{account}: {result['error']}")
+                report["status"] = "error"
+                continue
+            if result["found"] == expected:
+                if expected:
+                    report["known_ok"] += 1
+                else:
+                    report["missing_ok"] = True
+                continue
+            report["details"].append(f"{account}: {'не найден' if expected else 'ложное срабатывание'} (HTTP {result['status']})")
+            if report["status"] == "pass":
+                report["status"] = "fail"
+        
+        return list(by_site.values())
+    
+    def run_validation(self, full: bool = False) -> Tuple[List[Dict], int]:
+        """Валидация базы; без full перепроверяются только изменившиеся и неоднозначные сайты"""
+        state_path = os.path.join(self.config["paths"].get("cache", "cache"), "validation.json")
+        state = {}
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        
+        sites = [site for site in self.database.sites if site.url_parts is not None]
+        pending = []
+        for site in sites:
+            previous = state.get(site.name)
+            if full or not previous or previous["fingerprint"] != site.fingerprint() or previous["status"] == "error":
+                pending.append(site)
+        
+        checked_at = datetime.now().isoformat(timespec="seconds")
+        for report in asyncio.run(self.validate_sites(pending)) if pending else []:
+            report["checked_at"] = checked_at
+            state[report["site"]] = report
+        
+        # Удаленные из базы сайты выпадают из состояния
+        names = {site.name for site in sites}
+        state = {name: report for name, report in state.items() if name in names}
+        tmp_path = f"{state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, state_path)
+        
+        return [state[site.name] for site in sites if site.name in state], len(pending)
+    
+    def save_validation_report(self, reports: List[Dict]) -> str:
+        """Сохраняет CSV с результатом валидации по каждому сайту"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filepath = os.path.join(self.config["paths"]["reports_csv"], f"validation_{timestamp}.csv")
+        fieldnames = ['site', 'category', 'status', 'known_ok', 'known_total', 'missing_ok', 'checked_at', 'details']
+        with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for report in reports:
+                writer.writerow(dict(report, details="; ".join(report["details"])))
+        return filepath
     
-    def print_results(self, username: str, total: int, found: int, errors: int, categories: Dict):
+    def print_results(self, username: str, total: int, found: int, errors: int, categories: Dict, impossible: int = 0):
         """Выводит результаты поиска"""
         print(f"\n{Fore.CYAN}{'='*60}{Style.RESET_ALL}")
         print(f"{Fore.YELLOW}📊 {self.locale['results']['title']}{Style.RESET_ALL}")
@@ -528,6 +3514,8 @@ class WhatsMyFinder:
         
         if errors > 0:
             print(f"{Fore.YELLOW}{self.locale['results']['errors'].format(errors)}{Style.RESET_ALL}")
+        if impossible > 0:
+            print(f"{Fore.WHITE}🚫 Пропущено без запроса (username невозможен на сайте): {impossible}{Style.RESET_ALL}")
         
         print(f"{Fore.CYAN}{self.locale['results']['categories'].format(len(categories))}{Style.RESET_ALL}")
         
@@ -544,25 +3532,24 @@ class WhatsMyFinder:
         
         print(f"{Fore.CYAN}{'='*60}{Style.RESET_ALL}")
     
-    def save_report(self, data: Dict, username: str):
+    def save_report(self, data: Dict, username: str, timestamp: str):
         """Сохраняет отчет в выбранном формате"""
         if self.export_format in ["html", "both"]:
-            html_file = self.create_html_report(data, username)
+            html_file = self.create_html_report(data, username, timestamp)
             print(f"{Fore.GREEN}📄 HTML: {html_file}{Style.RESET_ALL}")
         
         if self.export_format in ["csv", "both"]:
-            csv_file, summary_file = self.create_csv_report(data, username)
-            print(f"{Fore.GREEN}📊 CSV: {csv_file}{Style.RESET_ALL}")
+            summary_file = self.create_summary_report(data, username, timestamp)
+            print(f"{Fore.GREEN}📊 CSV: {self.report_path('reports_csv', username, timestamp, '.csv')}{Style.RESET_ALL}")
             print(f"{Fore.GREEN}📝 TXT: {summary_file}{Style.RESET_ALL}")
     
-    def create_html_report(self, data: Dict, username: str) -> str:
+    def create_html_report(self, data: Dict, username: str, timestamp: str) -> str:
         """Создает HTML отчет"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"whatsmyfinder_{username}_{timestamp}.html"
-        filepath = os.path.join(self.config["paths"]["reports_html"], filename)
+        filepath = self.report_path("reports_html", username, timestamp, ".html")
         
-        # Простой HTML шаблон
-        html_content = f"""<!DOCTYPE html>
+        with open(filepath, 'w', encoding='utf-8') as f:
+            # Простой HTML шаблон
+            f.write(f"""<!DOCTYPE html>
 <html lang="{self.language}">
 <head>
     <meta charset="UTF-8">
@@ -583,7 +3570,7 @@ class WhatsMyFinder:
 <body>
     <div class="header">
         <h1>🔍 WhatsMyFinder Report</h1>
-        <p>Username: <strong>{username}</strong> | Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+        <p>Username: <strong>{username}</strong> | Date: {data['generated']}</p>
         <p>Tool by: {self.config['app']['author']} | Database: {self.config['app']['data_source']}</p>
     </div>
     
@@ -605,85 +3592,52 @@ class WhatsMyFinder:
             <p>Categories</p>
         </div>
     </div>
-"""
-        
-        if data['selected_categories']:
-            html_content += f"""
+""")
+            
+            if data['selected_categories']:
+                f.write(f"""
     <div style="background: #e8f4fd; padding: 10px; border-radius: 5px; margin: 10px 0;">
         <strong>🔧 Filtered Categories:</strong> {', '.join(data['selected_categories'])}
     </div>
-"""
-        
-        for category, sites in sorted(data['by_category'].items()):
-            html_content += f"""
+""")
+            
+            for category, sites in sorted(data['by_category'].items()):
+                f.write(f"""
     <div class="category">
         <div class="category-header">
             <h3>{category.upper()} ({len(sites)})</h3>
         </div>
-"""
-            for site in sorted(sites, key=lambda x: x['name']):
-                html_content += f"""
+""")
+                for site in sorted(sites, key=lambda x: x['name']):
+                    f.write(f"""
         <div class="site-item">
             <strong>{site['name']}</strong><br>
             <a href="{site['url']}" target="_blank">{site['url']}</a>
         </div>
-"""
-            html_content += """
+""")
+                f.write("""
     </div>
-"""
-        
-        html_content += f"""
+""")
+            
+            f.write(f"""
     <div style="margin-top: 30px; padding: 10px; background: #f5f5f5; border-radius: 5px; text-align: center;">
         <p>Generated by WhatsMyFinder v{self.config['app']['version']}</p>
         <p>Author: {self.config['app']['author']} | Source: {self.config['app']['data_source']}</p>
     </div>
 </body>
 </html>
-"""
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+""")
         
         return filepath
     
-    def create_csv_report(self, data: Dict, username: str) -> tuple:
-        """Создает CSV и TXT отчеты"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    def create_summary_report(self, data: Dict, username: str, timestamp: str) -> str:
+        """Создает TXT сводку; CSV с профилями пишется потоково во время поиска"""
+        txt_filepath = self.report_path("reports_csv", username, timestamp, "_summary.txt")
         
-        # CSV файл
-        csv_filename = f"whatsmyfinder_{username}_{timestamp}.csv"
-        csv_filepath = os.path.join(self.config["paths"]["reports_csv"], csv_filename)
-        
-        # TXT файл
-        txt_filename = f"whatsmyfinder_{username}_{timestamp}_summary.txt"
-        txt_filepath = os.path.join(self.config["paths"]["reports_csv"], txt_filename)
-        
-        # Записываем CSV
-        all_sites = []
-        for category, sites in data['by_category'].items():
-            for site in sites:
-                all_sites.append({
-                    "category": category,
-                    "site_name": site['name'],
-                    "url": site['url'],
-                    "status": site.get('status', ''),
-                    "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                })
-        
-        if all_sites:
-            with open(csv_filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['category', 'site_name', 'url', 'status', 'timestamp']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for site in sorted(all_sites, key=lambda x: (x['category'], x['site_name'])):
-                    writer.writerow(site)
-        
-        # Записываем TXT summary
         with open(txt_filepath, 'w', encoding='utf-8') as f:
             f.write(f"WhatsMyFinder Report - {username}\n")
             f.write("="*60 + "\n")
-            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"Generated: {data['generated']}\n")
             f.write(f"Tool: {self.config['app']['name']} v{self.config['app']['version']}\n")
             f.write(f"Author: {self.config['app']['author']}\n")
             f.write(f"Database: {self.config['app']['data_source']}\n")
@@ -693,6 +3647,7 @@ class WhatsMyFinder:
             f.write(f"  • Sites checked: {data['total_checked']}\n")
             f.write(f"  • Profiles found: {data['found']}\n")
             f.write(f"  • Errors: {data['errors']}\n")
+            f.write(f"  • Skipped without a request: {data.get('impossible', 0)}\n")
             f.write(f"  • Categories with results: {len(data['by_category'])}\n")
             
             if data['selected_categories']:
@@ -707,7 +3662,7 @@ class WhatsMyFinder:
                     f.write(f"  • {site['name']}\n")
                     f.write(f"    {site['url']}\n")
         
-        return csv_filepath, txt_filepath
+        return txt_filepath
     
     def run(self):
         """Запускает приложение"""
@@ -734,11 +3689,670 @@ class WhatsMyFinder:
             print(f"\n{Fore.RED}❌ Критическая ошибка: {e}{Style.RESET_ALL}")
             import traceback
             traceback.print_exc()
+        finally:
+            self.close()
+
+class CheckResult(NamedTuple):
+    """Результат одной проверки для встраивающего кода"""
+    username: str
+    name: str
+    url: str
+    found: bool
+    error: Optional[str]
+    category: str
+    status: Optional[int]
+    elapsed: Optional[float]
+    cached: bool
+
+async def search_usernames(usernames: Union[str, Iterable[str], AsyncIterable[str]], database: SiteDatabase,
+                           session: aiohttp.ClientSession, categories: Optional[Set[str]] = None, config: Optional[Dict] = None,
+                           health: Optional[HealthStore] = None, max_pending: int = 64, usernames_in_flight: int = 4,
+                           variants: Optional[bool] = None, time_budget: Optional[float] = None,
+                           max_hits: Optional[int] = None) -> AsyncIterator[CheckResult]:
+    """Результаты проверок username по мере готовности, без файлов и вывода, через сессию вызывающего"""
+    app = WhatsMyFinder.embed(database, config, health)
+    app.selected_categories = set(categories or ())
+    all_sites = app.filter_sites()
+    # Очередь ограничена: пока потребитель не заберет результат, проверки не отдают свои и не начинают новые
+    results = asyncio.Queue(maxsize=max_pending)
+    window = asyncio.Semaphore(usernames_in_flight)
+    finished = object()
+    
+    async def source() -> AsyncIterator[str]:
+        if isinstance(usernames, str):
+            yield usernames
+        elif hasattr(usernames, "__aiter__"):
+            async for username in usernames:
+                yield username
+        else:
+            for username in usernames:
+                yield username
+    
+    async def check(search: SearchSession, username: str, order: int):
+        try:
+            await app.check_username(search, username, app.limit_sites(all_sites, username), results.put, variants=variants,
+                                     time_budget=time_budget, max_hits=max_hits, max_pending=max_pending, priority=order)
+        finally:
+            window.release()
+    
+    async def produce(search: SearchSession):
+        pending = set()
+        outcome = finished
+        try:
+            order = itertools.count()
+            async for username in source():
+                await window.acquire()
+                pending.add(asyncio.ensure_future(check(search, username, next(order))))
+                for task in [task for task in pending if task.done()]:
+                    pending.discard(task)
+                    task.result()
+            await asyncio.gather(*pending)
+        except asyncio.CancelledError:
+            # Потребитель ушел: проверки отменяются, отдавать некому
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            raise
+        except Exception as e:
+            for task in pending:
+                task.cancel()
+            outcome = e
+        await results.put(outcome)
+    
+    async with app.search_session(cache=False, session=session) as search:
+        producer = asyncio.ensure_future(produce(search))
+        try:
+            while True:
+                item = await results.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield CheckResult(**item)
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+class SearchJob:
+    """Задание демона: список username и накопленные результаты"""
+    
+    def __init__(self, client: str, usernames: List[str], categories: Set[str], all_results: bool,
+                 time_budget: Optional[float] = None, max_hits: Optional[int] = None, database: Optional[SiteDatabase] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.client = client
+        self.usernames = usernames
+        self.categories = categories
+        self.all_results = all_results
+        # Ограничения на каждый username; None - из config.json
+        self.time_budget = time_budget
+        self.max_hits = max_hits
+        self.state = "queued"
+        # Задание на все результаты тысяч username держит их в колонках, а не в словарях
+        self.results = ResultTable(database)
+        self.checks = 0
+        self.found = 0
+        self.errors = 0
+        self.impossible = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.task = None
+        self.changed = asyncio.Condition()
+    
+    @property
+    def done(self) -> bool:
+        return self.state in ("done", "cancelled", "failed")
+    
+    async def add(self, result: Dict):
+        """Добавляет результат и будит потоковых читателей"""
+        # Как и в пакете, проверки - только запрошенные пары
+        if result["error"] == "Impossible":
+            self.impossible += 1
+        elif result["error"] != "NotChecked":
+            self.checks += 1
+            if result["error"]:
+                self.errors += 1
+            elif result["found"]:
+                self.found += 1
+        if self.all_results or result["found"]:
+            self.results.add(result)
+            async with self.changed:
+                self.changed.notify_all()
+    
+    async def finish(self, state: str):
+        self.state = state
+        self.finished = time.time()
+        async with self.changed:
+            self.changed.notify_all()
+    
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "client": self.client,
+            "state": self.state,
+            "usernames": len(self.usernames),
+            "checks": self.checks,
+            "found": self.found,
+            "errors": self.errors,
+            "impossible": self.impossible,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+class SearchDaemon:
+    """Фоновый сервис: теплая сессия и база, задания через локальный HTTP API"""
+    
+    def __init__(self, app: "WhatsMyFinder", max_jobs: int, keep_finished: int = 100):
+        self.app = app
+        self.max_jobs = max_jobs
+        self.keep_finished = keep_finished
+        self.search = None
+        self.jobs = collections.OrderedDict()
+        # Очереди по клиентам обслуживаются по кругу, чтобы один клиент не занял демон целиком
+        self.queues = collections.OrderedDict()
+        self.running = 0
+        self._wakeup = None
+        self._dispatcher = None
+        self._reloading = None
+    
+    def web_app(self) -> web.Application:
+        """HTTP-приложение демона"""
+        application = web.Application()
+        application.router.add_post("/jobs", self.handle_submit)
+        application.router.add_get("/jobs", self.handle_list)
+        application.router.add_get("/jobs/{id}", self.handle_job)
+        application.router.add_get("/jobs/{id}/results", self.handle_results)
+        application.router.add_delete("/jobs/{id}", self.handle_cancel)
+        application.router.add_get("/status", self.handle_status)
+        application.router.add_get("/metrics", self.handle_metrics)
+        application.router.add_post("/database/reload", self.handle_reload)
+        application.on_startup.append(self.on_startup)
+        application.on_cleanup.append(self.on_cleanup)
+        return application
+    
+    async def on_startup(self, application: web.Application):
+        # Демон держит только агрегаты трассировки: записи по запросам росли бы без конца
+        self.tracer = RequestTracer(keep_requests=False)
+        self.search = self.app.search_session(tracer=self.tracer)
+        await self.search.__aenter__()
+        self._wakeup = asyncio.Event()
+        self._reloading = asyncio.Lock()
+        self._dispatcher = asyncio.ensure_future(self.dispatch())
+    
+    async def on_cleanup(self, application: web.Application):
+        self._dispatcher.cancel()
+        tasks = [job.task for job in self.jobs.values() if job.task]
+        for task in tasks:
+            task.cancel()
+        # Отмененные задания дописывают свое состояние, пока сессия еще открыта
+        await asyncio.gather(self._dispatcher, *tasks, return_exceptions=True)
+        await self.search.__aexit__(None, None, None)
+    
+    def next_job(self) -> Optional[SearchJob]:
+        """Следующее задание по кругу среди клиентов"""
+        for client in list(self.queues):
+            pending = self.queues.pop(client)
+            job = pending.popleft()
+            if pending:
+                # Клиент уходит в конец круга
+                self.queues[client] = pending
+            if job.state == "queued":
+                return job
+        return None
+    
+    async def dispatch(self):
+        """Запускает задания, пока не достигнут лимит одновременных"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Обновленный на диске wmn-data.json подхватывается перед запуском следующих заданий
+            if self.app.database_changed():
+                try:
+                    await self.reload_database()
+                except (OSError, ValueError) as e:
+                    print(f"{Fore.YELLOW}⚠️  База не перезагружена: {e}{Style.RESET_ALL}", file=sys.stderr)
+            while self.running < self.max_jobs:
+                job = self.next_job()
+                if job is None:
+                    break
+                self.running += 1
+                job.task = asyncio.ensure_future(self.run_job(job))
+    
+    async def run_job(self, job: SearchJob):
+        """Выполняет задание на общей сессии демона"""
+        job.state = "running"
+        job.started = time.time()
+        sites = self.app.database.select(job.categories)
+        try:
+            for username in job.usernames:
+                # Каждый результат сразу уходит потоковым читателям, не дожидаясь остальных сайтов username
+                await self.app.check_username(self.search, username, self.app.limit_sites(sites, username), job.add,
+                                              time_budget=job.time_budget, max_hits=job.max_hits)
+            await job.finish("done")
+        except asyncio.CancelledError:
+            await job.finish("cancelled")
+            raise
+        except Exception:
+            await job.finish("failed")
+            raise
+        finally:
+            self.running -= 1
+            self.forget_finished()
+            self._wakeup.set()
+    
+    async def reload_database(self, db_path: Optional[str] = None) -> Dict[str, List[str]]:
+        """Читает базу вне цикла событий и подменяет ее; выполняющиеся задания доживают на прежней"""
+        async with self._reloading:
+            db_path = db_path or self.app.config["paths"]["database"]
+            loop = asyncio.get_event_loop()
+            database = await loop.run_in_executor(None, SiteDatabase.load, db_path, self.app.database_cache_path(db_path))
+            self.app.config["paths"]["database"] = db_path
+            diff = self.app.apply_database(database)
+        print(f"🔄 База данных обновлена: добавлено {len(diff['added'])}, удалено {len(diff['removed'])}, "
+              f"изменено {len(diff['changed'])}", file=sys.stderr)
+        return diff
+    
+    def forget_finished(self):
+        """Удаляет самые старые завершенные задания сверх keep_finished"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
+    
+    def find_job(self, request: web.Request) -> SearchJob:
+        job = self.jobs.get(request.match_info["id"])
+        if job is None:
+            raise web.HTTPNotFound(text="job not found")
+        return job
+    
+    async def handle_submit(self, request: web.Request) -> web.Response:
+        try:
+            payload = await request.json()
+            usernames = [str(username).strip() for username in payload["usernames"] if str(username).strip()]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text='expected JSON {"usernames": [...]}')
+        if not usernames:
+            raise web.HTTPBadRequest(text="empty username list")
+        
+        try:
+            time_budget = float(payload["time_budget"]) if payload.get("time_budget") is not None else None
+            max_hits = int(payload["max_hits"]) if payload.get("max_hits") is not None else None
+        except (ValueError, TypeError):
+            raise web.HTTPBadRequest(text="time_budget and max_hits must be numbers")
+        
+        client = request.headers.get("X-Client") or request.remote or "local"
+        job = SearchJob(client, usernames, set(payload.get("categories") or ()), bool(payload.get("all_results")),
+                        time_budget, max_hits, self.app.database)
+        self.jobs[job.id] = job
+        self.queues.setdefault(client, collections.deque()).append(job)
+        self._wakeup.set()
+        return web.json_response(job.summary(), status=202)
+    
+    async def handle_list(self, request: web.Request) -> web.Response:
+        return web.json_response([job.summary() for job in self.jobs.values()])
+    
+    async def handle_job(self, request: web.Request) -> web.Response:
+        return web.json_response(self.find_job(request).summary())
+    
+    async def handle_results(self, request: web.Request) -> web.StreamResponse:
+        """Отдает результаты задания в NDJSON по мере появления"""
+        job = self.find_job(request)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        sent = 0
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: len(job.results) > sent or job.done)
+            batch = [job.results.row(index) for index in range(sent, len(job.results))]
+            sent += len(batch)
+            if batch:
+                await response.write("".join(json.dumps(result, ensure_ascii=False) + "\n" for result in batch).encode("utf-8"))
+            if job.done and sent >= len(job.results):
+                break
+        await response.write_eof()
+        return response
+    
+    async def handle_cancel(self, request: web.Request) -> web.Response:
+        job = self.find_job(request)
+        if job.task:
+            job.task.cancel()
+        elif not job.done:
+            await job.finish("cancelled")
+        return web.json_response(job.summary())
+    
+    async def handle_reload(self, request: web.Request) -> web.Response:
+        """Перезагружает базу (по умолчанию тот же файл) и возвращает отличия по сайтам"""
+        try:
+            payload = await request.json() if request.can_read_body else {}
+            db_path = payload.get("path")
+        except (ValueError, AttributeError):
+            raise web.HTTPBadRequest(text='expected JSON {"path": ...} or an empty body')
+        try:
+            diff = await self.reload_database(db_path)
+        except (OSError, ValueError) as e:
+            raise web.HTTPBadRequest(text=f"database not reloaded: {e}")
+        return web.json_response(diff)
+    
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Фазы запросов, гистограммы по сайтам и переиспользование соединений в формате OpenMetrics"""
+        return web.Response(
+            text=self.tracer.openmetrics(),
+            headers={"Content-Type": "application/openmetrics-text; version=1.0.0; charset=utf-8"}
+        )
+    
+    async def handle_status(self, request: web.Request) -> web.Response:
+        """Глубина очереди и загрузка демона"""
+        return web.json_response({
+            "queued": sum(1 for job in self.jobs.values() if job.state == "queued"),
+            "running": self.running,
+            "max_jobs": self.max_jobs,
+            "in_flight": self.search.limiter.in_flight,
+            "concurrency_limit": int(self.search.limiter.limit),
+            "checks_queued": self.search.scheduler.queued(),
+            "checks_running": self.search.scheduler.running(),
+            "clients": len(self.queues),
+            "jobs": len(self.jobs),
+            "sites": len(self.app.database.sites),
+            "egresses": self.search.egresses.report()
+        })
+
+class QueueWriter:
+    """Файлоподобный приемник текста, отправляющий записанное в очередь процесса-родителя при flush"""
+    
+    def __init__(self, results: "multiprocessing.Queue", kind: str = "lines"):
+        self.results = results
+        self.kind = kind
+        self.lines = []
+    
+    def write(self, text: str):
+        self.lines.append(text)
+    
+    def flush(self):
+        if self.lines:
+            self.results.put((self.kind, self.lines))
+            self.lines = []
+
+def batch_worker(config: Dict, database: Optional[SiteDatabase], categories: Set[str], all_results: bool, output_format: str,
+                 completed: Optional[Dict[str, Set[Tuple[str, str]]]], usernames: "multiprocessing.Queue", results: "multiprocessing.Queue"):
+    """Рабочий процесс пакетного режима: берет username из общей очереди до получения None"""
+    colorama.init()
+    app = WhatsMyFinder(config)
+    if database is None:
+        with contextlib.redirect_stdout(sys.stderr):
+            if not app.load_database():
+                results.put(("done", {}, {}, None))
+                return
+    else:
+        app.database = database
+    app.selected_categories = categories
+    
+    # Телеметрию сохраняет родитель, объединяя приращения всех процессов
+    app.get_health_store().path = None
+    try:
+        # Строки журнала идут в ту же очередь после строк вывода, родитель дописывает их в файл журнала
+        journal = CheckJournal(QueueWriter(results, "journal"), completed) if completed is not None else None
+        sink = ResultSink(QueueWriter(results), output_format, found_only=not all_results, header=False, journal=journal)
+        try:
+            stats = asyncio.run(app.run_batch(iter(usernames.get, None), sink, report_progress=False))
+        finally:
+            sink.close()
+        tracer = app.get_tracer()
+        results.put((
+            "done", {key: value for key, value in stats.items() if isinstance(value, int)},
+            app.health.snapshot(), tracer.snapshot() if tracer else None
+        ))
+    finally:
+        app.close()
+
+# Параметры пакета, которые журнал запоминает для --resume
+JOURNAL_SETTINGS = ("batch", "output", "categories", "all_results", "format")
+# Параметры поиска из config.json и командной строки, от которых зависит набор проверок
+JOURNAL_SEARCH_SETTINGS = ("username_variants", "prefilter", "prefilter_charset", "time_budget", "max_hits", "max_sites_per_category")
+
+def read_usernames(source: TextIO) -> Iterable[str]:
+    """Читает username построчно, пропуская пустые строки и комментарии"""
+    for line in source:
+        username = line.strip()
+        if username and not username.startswith("#"):
+            yield username
+
+def run_batch_cli(app: WhatsMyFinder, args: argparse.Namespace) -> int:
+    """Неинтерактивный пакетный режим"""
+    journal = None
+    resuming = bool(args.resume)
+    if resuming:
+        # Параметры прерванного запуска берутся из журнала, --workers можно задать заново
+        journal, settings = CheckJournal.resume(args.resume)
+        app.config["search"].update(settings.pop("search", {}))
+        for key, value in settings.items():
+            setattr(args, key, value)
+        print(f"📒 Продолжение по журналу {args.resume}: завершено проверок {journal.completed_checks}", file=sys.stderr)
+    elif args.journal:
+        if args.batch == "-":
+            print("❌ Журнал требует список username из файла, а не stdin", file=sys.stderr)
+            return 1
+        settings = {key: getattr(args, key) for key in JOURNAL_SETTINGS}
+        # Действующие значения, включая умолчания, которых нет в config.json
+        search_config = {**app.default_config()["search"], **app.config["search"]}
+        settings["search"] = {key: search_config[key] for key in JOURNAL_SEARCH_SETTINGS}
+        journal = CheckJournal.create(args.journal, settings)
+    
+    # stdout занят потоком результатов, служебные сообщения уходят в stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        if not app.load_database():
+            return 1
+    
+    if args.categories:
+        app.selected_categories = set(args.categories.split(","))
+    
+    source = sys.stdin if args.batch == "-" else open(args.batch, 'r', encoding='utf-8')
+    output = sys.stdout if args.output == "-" else open(args.output, 'a' if resuming else 'w', newline='', encoding='utf-8')
+    try:
+        if args.workers > 1:
+            stats = app.run_sharded_batch(read_usernames(source), output, args.workers, all_results=args.all_results,
+                                          output_format=args.format, header=not resuming, journal=journal)
+        else:
+            sink = ResultSink(output, args.format, found_only=not args.all_results, header=not resuming, journal=journal)
+            try:
+                stats = asyncio.run(app.run_batch(read_usernames(source), sink))
+            finally:
+                sink.close()
+    except KeyboardInterrupt:
+        print("\n👋 Прервано пользователем", file=sys.stderr)
+        if journal is not None:
+            print(f"📒 Продолжить: python whatsmyfinder.py --resume {journal.path}", file=sys.stderr)
+        return 130
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        if journal is not None:
+            journal.close()
+    
+    if journal is not None:
+        completed = CheckJournal.compact(journal.path)
+        print(f"📒 Журнал {journal.path} сжат: завершено проверок {completed}", file=sys.stderr)
+    
+    print(
+        f"✅ Username: {stats['usernames']} | Проверок: {stats['checks']} | "
+        f"Найдено: {stats['found']} | Ошибок: {stats['errors']} | Из кэша: {stats['cached']} | "
+        f"По журналу: {stats['resumed']} | Не проверено: {stats['not_checked']} | Невозможных: {stats['impossible']} | "
+        f"Повторов: {stats['retries']} | Хеджей: {stats['hedged']} | "
+        f"Общих запросов: {stats['coalesced']} | "
+        f"Время: {stats['elapsed']:.1f} с | {stats['checks_per_second']:.1f} проверок/с",
+        file=sys.stderr
+    )
+    # Сводка по выходам нужна, только если их несколько
+    egresses = stats.get("egresses", [])
+    if len(egresses) > 1:
+        for egress in egresses:
+            drained = ", выведен из ротации" if egress["drained"] else ""
+            print(
+                f"  🌐 {egress['name']}: запросов {egress['requests']}, отказов {egress['failures']}, "
+                f"оценка {egress['score']:.2f}{drained}",
+                file=sys.stderr
+            )
+    return 0
+
+def run_history_cli(app: WhatsMyFinder, args: argparse.Namespace) -> int:
+    """Запросы к истории проверок из кэша результатов"""
+    cache = app.get_result_cache()
+    if cache is None:
+        print("❌ Кэш результатов отключен в config.json", file=sys.stderr)
+        return 1
+    
+    if args.history_site:
+        rows = cache.found_on_site(args.history_site)
+    else:
+        rows = cache.last_status(args.history_user)
+    
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    print(f"📚 Записей: {len(rows)}", file=sys.stderr)
+    return 0
+
+def run_health_cli(app: WhatsMyFinder, args: argparse.Namespace) -> int:
+    """Сводка здоровья сайтов по накопленной телеметрии"""
+    for row in app.get_health_store().report():
+        print(json.dumps(row, ensure_ascii=False))
+    return 0
+
+def run_validate_cli(app: WhatsMyFinder, args: argparse.Namespace) -> int:
+    """Самопроверка базы на известных аккаунтах"""
+    if not app.load_database():
+        return 1
+    
+    reports, checked = app.run_validation(full=args.full)
+    counts = collections.Counter(report["status"] for report in reports)
+    report_file = app.save_validation_report(reports)
+    
+    print(f"\n{Fore.CYAN}🧪 Перепроверено сайтов: {checked} из {len(reports)}{Style.RESET_ALL}")
+    print(f"  {Fore.GREEN}✅ Работают: {counts['pass']}{Style.RESET_ALL}")
+    print(f"  {Fore.RED}❌ Устарели: {counts['fail']}{Style.RESET_ALL}")
+    print(f"  {Fore.YELLOW}⚠️  Ошибки сети: {counts['error']}{Style.RESET_ALL}")
+    print(f"{Fore.GREEN}📊 CSV: {report_file}{Style.RESET_ALL}")
+    return 0
+
+def run_daemon_cli(app: WhatsMyFinder, args: argparse.Namespace) -> int:
+    """Режим демона с локальным HTTP API"""
+    if not app.load_database():
+        return 1
+    
+    daemon_config = app.config.get("daemon", {})
+    host = args.host or daemon_config.get("host", "127.0.0.1")
+    port = args.port or daemon_config.get("port", 8780)
+    daemon = SearchDaemon(app, daemon_config.get("max_jobs", 4), daemon_config.get("keep_finished", 100))
+    
+    print(f"{Fore.GREEN}🛰️  Демон слушает http://{host}:{port} (заданий одновременно: {daemon.max_jobs}){Style.RESET_ALL}")
+    web.run_app(daemon.web_app(), host=host, port=port, print=None, access_log=None)
+    return 0
+
+def export_trace(app: WhatsMyFinder, args: argparse.Namespace):
+    """Сохраняет трассу и метрики запросов, если они запрошены"""
+    if app.tracer is None:
+        return
+    if args.trace:
+        app.tracer.write_json(args.trace)
+        print(f"🔬 Трасса запросов: {args.trace}", file=sys.stderr)
+    if args.metrics:
+        app.tracer.write_openmetrics(args.metrics)
+        print(f"🔬 Метрики OpenMetrics: {args.metrics}", file=sys.stderr)
+
+def export_profile(app: WhatsMyFinder, args: argparse.Namespace):
+    """Сохраняет профиль цикла событий, если он запрошен"""
+    if app.profiler is None:
+        return
+    app.profiler.write_json(args.profile)
+    lag = app.profiler.summary()["loop_lag"]
+    print(f"🔬 Профиль: {args.profile} (задержка цикла p99 {lag['p99'] * 1000:.1f} мс, максимум {lag['max'] * 1000:.1f} мс, "
+          f"блокировок: {sum(count for count, _, _ in app.profiler.stalls.values())})", file=sys.stderr)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Разбирает аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="WhatsMyFinder - OSINT Username Search Tool")
+    parser.add_argument("--batch", metavar="FILE", help="файл со списком username (по одному в строке, '-' для stdin)")
+    parser.add_argument("-o", "--output", metavar="FILE", default="-", help="файл для результатов NDJSON ('-' для stdout)")
+    parser.add_argument("-c", "--categories", metavar="CAT[,CAT]", help="категории через запятую")
+    parser.add_argument("--all-results", action="store_true", help="выводить все проверки, а не только найденные профили")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="с --batch: формат вывода")
+    parser.add_argument("--trace", metavar="PATH", help="записать JSON-трассу фаз HTTP-запросов")
+    parser.add_argument("--metrics", metavar="PATH", help="записать метрики запросов в формате OpenMetrics")
+    parser.add_argument("--profile", metavar="PATH", help="записать JSON-профиль цикла событий: задержка, блокирующие вызовы, CPU")
+    parser.add_argument("--variants", action="store_true", help="проверять также варианты написания username (регистр, разделители)")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS", help="бюджет времени на username: по истечении оставшиеся проверки отменяются")
+    parser.add_argument("--max-hits", type=int, metavar="N", help="остановить проверку username после N находок")
+    parser.add_argument("--journal", metavar="PATH", help="с --batch: журнал завершенных проверок для --resume")
+    parser.add_argument("--resume", metavar="PATH", help="продолжить прерванный пакет по журналу")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", help="с --batch: число рабочих процессов")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш результатов")
+    parser.add_argument("--no-prefilter", action="store_true", help="запрашивать сайты, на которых username не может существовать")
+    parser.add_argument("--strict-prefilter", action="store_true", help="отсеивать и username с символами вне класса эталонных аккаунтов")
+    parser.add_argument("--history-site", metavar="SITE", help="все username, найденные на сайте (из кэша)")
+    parser.add_argument("--history-user", metavar="USERNAME", help="последний статус username по сайтам (из кэша)")
+    parser.add_argument("--health-report", action="store_true", help="сводка здоровья сайтов (ошибки, задержки, карантин)")
+    parser.add_argument("--validate", action="store_true", help="проверить правила базы на известных аккаунтах (только изменившиеся сайты)")
+    parser.add_argument("--full", action="store_true", help="с --validate: перепроверить все сайты")
+    parser.add_argument("--daemon", action="store_true", help="запустить демон с локальным HTTP API заданий")
+    parser.add_argument("--host", help="с --daemon: адрес для прослушивания")
+    parser.add_argument("--port", type=int, help="с --daemon: порт")
+    return parser.parse_args(argv)
 
 def main():
     """Точка входа"""
+    # Перехват stdout colorama нужен только приложению, а не импортирующему модулю сервису
+    colorama.init()
+    args = parse_args()
     app = WhatsMyFinder()
-    app.run()
+    
+    if args.no_cache:
+        app.config.setdefault("cache", {})["enabled"] = False
+    if args.variants:
+        app.config["search"]["username_variants"] = True
+    if args.no_prefilter:
+        app.config["search"]["prefilter"] = False
+    if args.strict_prefilter:
+        app.config["search"]["prefilter_charset"] = True
+    if args.time_budget is not None:
+        app.config["search"]["time_budget"] = args.time_budget
+    if args.max_hits is not None:
+        app.config["search"]["max_hits"] = args.max_hits
+    if args.trace or args.metrics:
+        app.config.setdefault("trace", {})["enabled"] = True
+        # Записи по каждому запросу нужны только JSON-трассе
+        app.config["trace"]["keep_requests"] = bool(args.trace)
+    if args.profile:
+        profile_config = app.config.get("profile", {})
+        app.profiler = LoopProfiler(profile_config.get("interval", 0.01), profile_config.get("threshold", 0.1),
+                                    profile_config.get("cpu", True), profile_config.get("top", 50))
+        if args.workers > 1:
+            print("⚠️  --profile профилирует только основной процесс; для профиля поиска запустите с --workers 1", file=sys.stderr)
+    
+    if args.history_site or args.history_user:
+        handler = run_history_cli
+    elif args.health_report:
+        handler = run_health_cli
+    elif args.validate:
+        handler = run_validate_cli
+    elif args.daemon:
+        handler = run_daemon_cli
+    elif args.batch or args.resume:
+        handler = run_batch_cli
+    else:
+        try:
+            app.run()
+        finally:
+            export_trace(app, args)
+            export_profile(app, args)
+        return
+    
+    try:
+        code = handler(app, args)
+    finally:
+        app.close()
+        export_trace(app, args)
+        export_profile(app, args)
+    sys.exit(code)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file